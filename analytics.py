@@ -0,0 +1,287 @@
+"""
+Analytics API: migration numbers without the map
+
+Analytics answers the questions the map is drawn from, for any set of
+dashboard filters, straight from the aggregates update_map uses (the
+aggregate cube when available, otherwise the filtered records):
+
+- od_matrix: unique migrants per origin-destination pair (long or wide)
+- net_migration: inflow, outflow and net migration per place
+- shares: migrants per caste category, religion, caste or reason, counted
+  like the map's flows
+- panel_summary: repeat and return migration across survey waves
+- trajectory: one member's records in month order
+
+od_matrix, net_migration and shares take weighted=True (weighted=1 over
+HTTP) for survey-weighted population estimates instead of sample counts,
+when the records carry survey weights.
+
+From Python:
+    from migration import analytics
+    analytics.od_matrix(migration_status='Emigrated', level_type='district')
+
+register() serves the same over HTTP, as JSON or as an Arrow IPC stream
+(format=arrow) written batch by batch for large matrices:
+    /api/od?migration_status=Immigrated&level_type=district&format=arrow
+    /api/net?breakdown_type=religion&breakdown_value=Hindu
+    /api/shares?dimension=caste&migration_reason=Marriage
+    /api/shares?dimension=religion&weighted=1
+    /api/panel?migration_status=Emigrated&breakdown_type=religion&breakdown_value=Muslim
+    /api/trajectory?hh_id=1000123&mem_id=2
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from engine import WEIGHT_COLUMN, weighted_migrants
+
+DEFAULT_FILTERS = {
+    'migration_status': 'Emigrated',
+    'level_type': 'state',
+    'breakdown_type': 'overall',
+    'breakdown_value': None,
+    'caste_filter': None,
+    'migration_reason': None,
+}
+ALLOWED_VALUES = {
+    'migration_status': ('Emigrated', 'Immigrated'),
+    'level_type': ('state', 'district'),
+    'breakdown_type': ('overall', 'caste_category', 'religion'),
+}
+SHARE_DIMENSIONS = {
+    'caste_category': 'caste_category',
+    'religion': 'religion',
+    'caste': 'caste',
+    'reason': 'emigration_immigration_reason',
+}
+ARROW_BATCH_ROWS = 65536
+
+
+def parse_filters(args):
+    """Filters from a mapping of request arguments, with the dashboard's defaults"""
+    filters = dict(DEFAULT_FILTERS)
+    for name in filters:
+        value = args.get(name)
+        if value not in (None, ''):
+            filters[name] = value
+    for name, allowed in ALLOWED_VALUES.items():
+        if filters[name] not in allowed:
+            raise ValueError(f"{name} must be one of {', '.join(allowed)}")
+    return filters
+
+
+def _place_columns(level_type, end):
+    return [end] if level_type == 'state' else [end, f'{end}_state']
+
+
+class Analytics:
+    """OD matrices, net migration and demographic shares for any filter set
+
+    aggregate(**filters) returns OD counts shaped like aggregate_flows (and
+    takes weighted=True); records(**filters) returns the matching records like
+    engine.records (without level_type), with a 'weight' column when the data
+    is weighted; panel is a panel.PanelIndex over the same records; cube,
+    when given, is the AggregateCube aggregate reads from.
+    """
+
+    def __init__(self, aggregate, records, panel=None, cube=None):
+        self._aggregate = aggregate
+        self._records = records
+        self._panel = panel
+        self._cube = cube
+
+    def _filters(self, filters):
+        return parse_filters({**DEFAULT_FILTERS, **filters})
+
+    def od_matrix(self, wide=False, weighted=False, **filters):
+        """Unique migrants per OD pair, largest first; wide=True pivots origins x destinations"""
+        filters = self._filters(filters)
+        agg_df = self._aggregate(**filters, weighted=weighted)
+        agg_df = agg_df.sort_values('count', ascending=False, kind='stable').reset_index(drop=True)
+        if not wide:
+            return agg_df
+        if filters['level_type'] == 'state':
+            origins, destinations = agg_df['origin'].astype(str), agg_df['destination'].astype(str)
+        else:
+            origins = agg_df['origin'].astype(str) + ' (' + agg_df['origin_state'].astype(str) + ')'
+            destinations = agg_df['destination'].astype(str) + ' (' + agg_df['destination_state'].astype(str) + ')'
+        matrix = pd.crosstab(origins.rename('origin'), destinations.rename('destination'),
+                             values=agg_df['count'], aggfunc='sum')
+        return matrix.fillna(0).astype(int)
+
+    def net_migration(self, weighted=False, **filters):
+        """Inflow, outflow and net migration per place (sums of OD counts), largest net first"""
+        filters = self._filters(filters)
+        agg_df = self._aggregate(**filters, weighted=weighted)
+        level_type = filters['level_type']
+        place = ['place'] if level_type == 'state' else ['place', 'state']
+
+        def totals(end):
+            # Plain strings, so origin and destination vocabularies line up
+            columns = _place_columns(level_type, end)
+            ends = agg_df[columns].astype(str).set_axis(place, axis=1)
+            return agg_df['count'].groupby([ends[col] for col in place]).sum()
+
+        net = pd.DataFrame({'inflow': totals('destination'), 'outflow': totals('origin')}).fillna(0).astype(int)
+        net['net'] = net['inflow'] - net['outflow']
+        return net.sort_values('net', ascending=False, kind='stable').reset_index()
+
+    def shares(self, dimension, weighted=False, **filters):
+        """Migrants per value of a demographic dimension and their share of all matching migrants
+
+        Migrants are counted like the map's flows: unique migrants per
+        state-to-state flow, summed. The aggregate cube answers with one
+        lookup per value when it holds the filters with the dimension added;
+        otherwise the matching records are grouped the same way.
+        """
+        if dimension not in SHARE_DIMENSIONS:
+            raise ValueError(f"dimension must be one of {', '.join(SHARE_DIMENSIONS)}")
+        filters = self._filters(filters)
+        found = self._cube_shares(dimension, weighted, filters)
+        migrants, total = found if found is not None else self._record_shares(dimension, weighted, filters)
+        named = np.array([bool(value) and value != 'nan' for value in migrants.index], dtype=bool)
+        migrants = migrants[named & (migrants > 0).to_numpy()]
+        result = migrants.rename('migrants').rename_axis(dimension).reset_index()
+        result['share'] = result['migrants'] / total if total else 0.0
+        result['migrants'] = np.rint(result['migrants']).astype(np.int64)
+        # Ties in name order, so both sources list values alike
+        return result.sort_values(['migrants', dimension], ascending=[False, True], kind='stable',
+                                  ignore_index=True)
+
+    def _cube_shares(self, dimension, weighted, filters):
+        """(migrants per value, total) from cube lookups, or None if the cube doesn't hold them"""
+        if self._cube is None:
+            return None
+        breakdown = filters['breakdown_type'] if filters['breakdown_value'] else 'overall'
+        if dimension in ('caste_category', 'religion'):
+            if breakdown not in ('overall', dimension):
+                return None
+            chosen = filters['breakdown_value'] if breakdown == dimension else None
+        else:
+            chosen = filters['caste_filter' if dimension == 'caste' else 'migration_reason'] or None
+
+        def total(with_value):
+            agg_df = self._cube.lookup(**{**filters, **with_value, 'level_type': 'state'}, weighted=weighted)
+            return None if agg_df is None else agg_df['count'].sum()
+
+        # The cube's filter columns are named like the dimensions
+        counts = {}
+        for value in [chosen] if chosen is not None else self._cube.values(dimension):
+            if dimension in ('caste_category', 'religion'):
+                with_value = {'breakdown_type': dimension, 'breakdown_value': value}
+            else:
+                with_value = {'caste_filter' if dimension == 'caste' else 'migration_reason': value}
+            counts[value] = total(with_value)
+        overall = total({})
+        if overall is None or any(found is None for found in counts.values()):
+            return None
+        return pd.Series(counts, dtype=np.float64), overall
+
+    def _record_shares(self, dimension, weighted, filters):
+        """(migrants per value, total) from the matching records, counted per state-to-state flow"""
+        records = self._records(**{k: v for k, v in filters.items() if k != 'level_type'})
+        column = SHARE_DIMENSIONS[dimension]
+        if weighted and 'weight' not in records.columns:
+            raise ValueError(f'the migration data has no {WEIGHT_COLUMN} survey weights')
+        # Integer ids per (value, flow) and per flow, summed per value with np.bincount
+        flow_ids = records.groupby(['origin', 'destination'], observed=True, sort=False).ngroup().to_numpy()
+        value_ids, values = pd.factorize(records[column])
+        kept = (flow_ids >= 0) & (value_ids >= 0)
+        n_flows = max(1, int(flow_ids.max()) + 1) if len(flow_ids) else 1
+        member_ids = pd.factorize(records['unique_id'])[0]
+        weights = (records['weight'].to_numpy(dtype=np.float64) if weighted
+                   else np.ones(len(records), dtype=np.float64))
+        groups = value_ids.astype(np.int64) * n_flows + flow_ids
+        per_flow = weighted_migrants(groups[kept], member_ids[kept], weights[kept], len(values) * n_flows)
+        migrants = pd.Series(per_flow.reshape(len(values), n_flows).sum(axis=1),
+                             index=pd.Index(np.asarray(values, dtype=object), name=column))
+        flows = flow_ids >= 0
+        total = weighted_migrants(flow_ids[flows], member_ids[flows], weights[flows], n_flows).sum()
+        return migrants, total
+
+    def panel_summary(self, **filters):
+        """Moves, repeat and return migration across waves for the migrants matching the filters"""
+        if self._panel is None:
+            raise ValueError('no panel index available')
+        filters = self._filters(filters)
+        return self._panel.summary(self._panel.matching(**{k: v for k, v in filters.items() if k != 'level_type'}))
+
+    def trajectory(self, hh_id, mem_id):
+        """One member's migration records in month order"""
+        if self._panel is None:
+            raise ValueError('no panel index available')
+        return self._panel.trajectory(hh_id, mem_id)
+
+
+def arrow_stream(df, batch_rows=ARROW_BATCH_ROWS):
+    """Yield an Arrow IPC stream of df one record batch at a time"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    buffer = io.BytesIO()
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    with pa.ipc.new_stream(buffer, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=batch_rows):
+            writer.write_batch(batch)
+            yield drain()
+    yield drain()
+
+
+def register(app, analytics):
+    """Serve /api/od, /api/net, /api/shares, /api/panel and /api/trajectory from an Analytics instance"""
+    from flask import Response, request
+
+    def weighted():
+        return request.args.get('weighted') == '1'
+
+    def respond(compute):
+        try:
+            filters = parse_filters(request.args)
+            df = compute(filters)
+        except ValueError as error:
+            return Response(json.dumps({'error': str(error)}), status=400, mimetype='application/json')
+
+        if request.args.get('format') == 'arrow':
+            return Response(arrow_stream(df), mimetype='application/vnd.apache.arrow.stream')
+        body = '{"filters": %s, "rows": %s}' % (json.dumps(filters), df.to_json(orient='records'))
+        return Response(body, mimetype='application/json')
+
+    @app.server.route('/api/od')
+    def api_od():
+        wide = request.args.get('wide') == '1'
+        if wide and request.args.get('format') == 'arrow':
+            return Response(json.dumps({'error': 'wide matrices are only available as JSON'}),
+                            status=400, mimetype='application/json')
+        return respond(lambda filters: (analytics.od_matrix(wide=True, weighted=weighted(), **filters).reset_index()
+                                        if wide else analytics.od_matrix(weighted=weighted(), **filters)))
+
+    @app.server.route('/api/net')
+    def api_net():
+        return respond(lambda filters: analytics.net_migration(weighted=weighted(), **filters))
+
+    @app.server.route('/api/panel')
+    def api_panel():
+        return respond(lambda filters: pd.DataFrame([analytics.panel_summary(**filters)]))
+
+    @app.server.route('/api/trajectory')
+    def api_trajectory():
+        def member(filters):
+            try:
+                hh_id, mem_id = int(request.args['hh_id']), int(request.args['mem_id'])
+            except (KeyError, ValueError):
+                raise ValueError('hh_id and mem_id must be integers')
+            return analytics.trajectory(hh_id, mem_id)
+        return respond(member)
+
+    @app.server.route('/api/shares')
+    def api_shares():
+        return respond(lambda filters: analytics.shares(request.args.get('dimension', 'caste_category'),
+                                                        weighted=weighted(), **filters))
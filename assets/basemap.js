@@ -0,0 +1,27 @@
+/*
+ * Prepends the cached static base map (assets/basemap_<level>.json, built by
+ * b/build_basemap.py) to the flow layer returned by update_map. The server
+ * names the file in layout.meta.basemap; each URL is fetched once per page and
+ * then served from the browser/CDN cache.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside);
+window.dash_clientside.migration = Object.assign({}, window.dash_clientside.migration, {
+    attachBasemap: function(figure) {
+        if (!figure) {
+            return window.dash_clientside.no_update;
+        }
+        const url = figure.layout && figure.layout.meta && figure.layout.meta.basemap;
+        if (!url) {
+            return figure;
+        }
+        const cache = window.migrationBasemaps = window.migrationBasemaps || {};
+        if (!cache[url]) {
+            cache[url] = fetch(url).then(function(response) {
+                return response.json();
+            });
+        }
+        return cache[url].then(function(basemap) {
+            return Object.assign({}, figure, {data: basemap.data.concat(figure.data)});
+        });
+    }
+});
@@ -0,0 +1,22 @@
+/*
+ * Month-by-month playback. The Play button starts a dcc.Interval that steps
+ * the month slider in the browser; each step is an ordinary map request,
+ * answered on the server from the precomputed monthly frames.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside);
+window.dash_clientside.migration = Object.assign({}, window.dash_clientside.migration, {
+    togglePlay: function(nClicks, timerDisabled, monthMode) {
+        if (!nClicks) {
+            return window.dash_clientside.no_update;
+        }
+        const playing = timerDisabled;
+        const mode = playing && (monthMode || []).indexOf('monthly') < 0 ? ['monthly'] : monthMode;
+        return [!playing, playing ? '❚❚ Pause' : '▶ Play', mode];
+    },
+    nextMonth: function(nIntervals, month, lastMonth) {
+        if (!nIntervals) {
+            return window.dash_clientside.no_update;
+        }
+        return month >= lastMonth ? 0 : month + 1;
+    }
+});
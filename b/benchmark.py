@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmark the dashboard callbacks and data preparation
+
+Drives update_map and the three options callbacks over a matrix of filter
+combinations at state and district level, and reports latency percentiles,
+figure payload size, trace counts and peak RSS. Runs against synthetic
+migration records by default so it works without the S3 data.
+
+Run this script from the root directory of the repo:
+python b/benchmark.py --rows 50000 --output bench.json
+python b/benchmark.py --data raw/migration_2024.parquet --baseline bench.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+from generate_synthetic import generate_migration
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_app(data_path):
+    """Import migration.py against the given data file, timing the data preparation"""
+    os.environ["MIGRATION_DATA"] = str(data_path)
+    sys.path.insert(0, str(REPO_DIR))
+    start = time.perf_counter()
+    module = importlib.import_module("migration")
+    return module, time.perf_counter() - start
+
+
+def build_scenarios(app_module):
+    """Representative filter combinations for both migration directions and levels"""
+    scenarios = []
+    for status in ["Emigrated", "Immigrated"]:
+        subset = app_module.engine.records(status, "overall", None, None, None)
+        top = lambda col: next((x for x in subset[col].value_counts().index if x != "nan"), None)
+        category, religion = top("caste_category"), top("religion")
+        caste, reason = top("caste"), top("emigration_immigration_reason")
+        filters = [
+            ("overall", None, None, None),
+            ("overall", None, None, reason),
+            ("caste_category", None, None, None),
+            ("caste_category", category, None, None),
+            ("caste_category", category, caste, None),
+            ("caste_category", category, caste, reason),
+            ("religion", religion, None, None),
+            ("religion", religion, None, reason),
+        ]
+        for level in ["state", "district"]:
+            for breakdown_type, breakdown_value, caste_filter, migration_reason in filters:
+                scenarios.append({
+                    "migration_status": status,
+                    "level_type": level,
+                    "breakdown_type": breakdown_type,
+                    "breakdown_value": breakdown_value,
+                    "caste_filter": caste_filter,
+                    "migration_reason": migration_reason,
+                })
+    return scenarios
+
+
+def scenario_name(s):
+    parts = [s["migration_status"], s["level_type"], s["breakdown_type"]]
+    parts += [s[k] for k in ("breakdown_value", "caste_filter", "migration_reason") if s[k]]
+    return "/".join(parts)
+
+
+def percentiles(samples):
+    arr = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p90_ms": float(np.percentile(arr, 90)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def time_call(func, args, repeat, reset=None):
+    samples, result = [], None
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        result = func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def run(app_module, repeat):
+    """Time every callback over the scenario matrix"""
+    results = {"update_map": [], "options": []}
+    all_map, all_opts = [], []
+
+    # Time cold calls: caches are emptied before every update_map call
+    reset = getattr(app_module, "clear_caches", None)
+    for s in build_scenarios(app_module):
+        samples, (fig, *_) = time_call(app_module.update_map, (
+            s["migration_status"], s["level_type"], s["breakdown_type"],
+            s["breakdown_value"], s["caste_filter"], s["migration_reason"]), repeat, reset)
+        all_map += samples
+        entry = {"scenario": scenario_name(s), **s, **percentiles(samples)}
+        entry["payload_bytes"] = len(json.dumps(fig, cls=PlotlyJSONEncoder))
+        entry["traces"] = len(fig["data"])
+        entry["peak_rss_mb"] = peak_rss_mb()
+        results["update_map"].append(entry)
+        print(f"  {entry['scenario']:<70} p50 {entry['p50_ms']:9.1f} ms  "
+              f"{entry['traces']:6d} traces  {entry['payload_bytes'] / 1024:9.1f} KB")
+
+    for s in build_scenarios(app_module):
+        if s["level_type"] != "state":
+            continue
+        calls = {
+            "update_breakdown_options": (app_module.update_breakdown_options,
+                                         (s["breakdown_type"], s["migration_status"])),
+            "update_caste_options": (app_module.update_caste_options,
+                                     (s["breakdown_type"], s["breakdown_value"], s["migration_status"])),
+            "update_reason_options": (app_module.update_reason_options,
+                                      (s["migration_status"], s["breakdown_type"],
+                                       s["breakdown_value"], s["caste_filter"])),
+        }
+        for name, (func, args) in calls.items():
+            samples, output = time_call(func, args, repeat)
+            all_opts += samples
+            results["options"].append({
+                "callback": name, "scenario": scenario_name(s),
+                **percentiles(samples),
+                "payload_bytes": len(json.dumps(output[0])),
+            })
+
+    results["summary"] = {
+        "update_map": percentiles(all_map),
+        "options": percentiles(all_opts),
+        "max_payload_bytes": max(e["payload_bytes"] for e in results["update_map"]),
+        "max_traces": max(e["traces"] for e in results["update_map"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return results
+
+
+def compare(current, baseline_path):
+    """Print p50 changes against a previous results file"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    before = {e["scenario"]: e for e in baseline["update_map"]}
+    print("\n" + "=" * 70)
+    print(f"COMPARISON against {baseline_path} ({baseline['meta']['git_revision']})")
+    print("=" * 70)
+    for entry in current["update_map"]:
+        old = before.get(entry["scenario"])
+        if old:
+            change = (entry["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+            print(f"  {entry['scenario']:<70} {old['p50_ms']:9.1f} -> {entry['p50_ms']:9.1f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000, help="synthetic migration rows to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic data")
+    parser.add_argument("--data", help="benchmark an existing migration parquet instead of synthetic data")
+    parser.add_argument("--repeat", type=int, default=5, help="calls per scenario")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("MIGRATION DASHBOARD BENCHMARK")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = args.data
+        if data_path is None:
+            data_path = Path(tmp) / "migration_synthetic.parquet"
+            print(f"Generating {args.rows:,} synthetic migration rows (seed={args.seed})...")
+            generate_migration(args.rows, args.seed).to_parquet(data_path, index=False)
+
+        app_module, load_seconds = load_app(data_path)
+        print(f"Data preparation: {load_seconds:.2f} s, peak RSS {peak_rss_mb():.1f} MB\n")
+
+        results = run(app_module, args.repeat)
+
+    results["meta"] = {
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "rows": app_module.engine.rows if args.data else args.rows,
+        "engine": app_module.engine.name,
+        "data": str(args.data) if args.data else f"synthetic(seed={args.seed})",
+        "repeat": args.repeat,
+        "data_preparation_s": load_seconds,
+    }
+
+    summary = results["summary"]
+    print("\n" + "=" * 70)
+    print("SUMMARY")
+    print("=" * 70)
+    print(f"update_map p50/p90/p99:  {summary['update_map']['p50_ms']:.1f} / "
+          f"{summary['update_map']['p90_ms']:.1f} / {summary['update_map']['p99_ms']:.1f} ms")
+    print(f"options p50/p90/p99:     {summary['options']['p50_ms']:.1f} / "
+          f"{summary['options']['p90_ms']:.1f} / {summary['options']['p99_ms']:.1f} ms")
+    print(f"Largest figure:          {summary['max_payload_bytes'] / 1024:.1f} KB, {summary['max_traces']:,} traces")
+    print(f"Peak RSS:                {summary['peak_rss_mb']:.1f} MB")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\n✓ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Build the static base map layers served from assets/
+
+The state and district boundaries never change, so instead of re-sending
+them inside every figure they are written once as a Plotly trace in
+assets/basemap_<level>.json. All exterior rings go into a single
+Scattergeo line trace (rings separated by nulls), with coordinates rounded
+to 4 decimals (~10 m, well below the simplification tolerance). The browser
+fetches each file once and caches it; assets/basemap.js prepends it to the
+flow layer returned by the server.
+
+The choropleth map mode needs the polygons themselves, so the same
+boundaries are also written as GeoJSON (assets/choropleth_<level>.json)
+with each feature's id set to its place key ("state" or "district|state").
+
+Run this script from the root directory of the repo whenever the boundary
+files in raw/ change:
+python b/build_basemap.py
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from spatial import boundary_keys  # noqa: E402
+
+RAW_DIR = REPO_DIR / "raw"
+ASSETS_DIR = REPO_DIR / "assets"
+
+LEVELS = {
+    "state": ("state_boundaries.parquet", "#667eea"),
+    "district": ("district_boundaries.parquet", "#95a5a6"),
+}
+
+
+def exterior_rings(geometry):
+    """Exterior rings of a Polygon or MultiPolygon, as drawn by migration.py"""
+    if geometry is None or geometry.is_empty:
+        return []
+    if geometry.geom_type == "Polygon":
+        return [geometry.exterior]
+    if geometry.geom_type == "MultiPolygon":
+        return [polygon.exterior for polygon in geometry.geoms]
+    return []
+
+
+def basemap_trace(gdf, color, precision=4):
+    """One Scattergeo line trace with every ring, separated by nulls"""
+    lons, lats = [], []
+    for geometry in gdf.geometry:
+        for ring in exterior_rings(geometry):
+            for lon, lat in ring.coords:
+                lons.append(round(lon, precision))
+                lats.append(round(lat, precision))
+            lons.append(None)
+            lats.append(None)
+    return {
+        "type": "scattergeo",
+        "lon": lons,
+        "lat": lats,
+        "mode": "lines",
+        "line": {"width": 1, "color": color},
+        "hoverinfo": "skip",
+        "showlegend": False,
+        "name": "Boundaries",
+    }
+
+
+def choropleth_features(gdf, level, precision=4):
+    """GeoJSON FeatureCollection keyed by place, for the choropleth trace"""
+    geometry = shapely.transform(gdf.geometry.values, lambda coords: np.round(coords, precision))
+    parts = gpd.GeoSeries(geometry, index=boundary_keys(gdf, level).values).explode(index_parts=False)
+    # A place split over several rows becomes one MultiPolygon feature
+    merged = parts.groupby(level=0, sort=False).agg(lambda polygons: shapely.MultiPolygon(list(polygons)))
+    features = gpd.GeoDataFrame(geometry=gpd.GeoSeries(merged.values, index=merged.index), crs=gdf.crs)
+    return json.loads(features.to_json(drop_id=False))
+
+
+def main():
+    ASSETS_DIR.mkdir(exist_ok=True)
+    print("Building static base map layers...")
+    print("=" * 60)
+    for level, (filename, color) in LEVELS.items():
+        gdf = gpd.read_parquet(RAW_DIR / filename)
+        trace = basemap_trace(gdf, color)
+        path = ASSETS_DIR / f"basemap_{level}.json"
+        path.write_text(json.dumps({"data": [trace]}, separators=(",", ":")))
+        rings = trace["lon"].count(None)
+        print(f"✓ {path.relative_to(REPO_DIR)}: {rings:,} rings, "
+              f"{os.path.getsize(path) / 1024:.1f} KB")
+
+        features = choropleth_features(gdf, level)
+        path = ASSETS_DIR / f"choropleth_{level}.json"
+        path.write_text(json.dumps(features, separators=(",", ":")))
+        print(f"✓ {path.relative_to(REPO_DIR)}: {len(features['features']):,} features, "
+              f"{os.path.getsize(path) / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Check that the query engines return identical results
+
+Runs every engine in engine.ENGINES (the ones whose library is installed)
+over the same migration file and compares option lists, surveyed members,
+matching records and OD aggregates for a matrix of filter combinations at
+state and district level, with and without a place restriction. Exits
+non-zero on the first mismatch.
+
+Run this script from the root directory of the repo:
+python b/compare_engines.py --data raw/migration_2024.parquet
+python b/compare_engines.py --data raw/migration_synthetic.parquet --engines pandas duckdb
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from engine import ENGINES, create_engine  # noqa: E402
+
+DATA_DIR = REPO_DIR / 'raw'
+RECORD_COLUMNS = ['unique_id', 'origin', 'destination', 'origin_district', 'destination_district']
+
+
+def place_keys():
+    """State and district keys as migration.py builds them"""
+    states = pd.read_parquet(DATA_DIR / 'state_centroids.parquet')
+    districts = pd.read_parquet(DATA_DIR / 'district_centroids.parquet')
+    return {'state': list(states['state_name']),
+            'district': list(districts['district_name'] + '|' + districts['state_name'])}
+
+
+def scenarios(engine, keys):
+    """Filter combinations built from the most common values in the data"""
+    for status in ['Emigrated', 'Immigrated']:
+        category = next(iter(engine.distinct('caste_category', mem_status=status)), None)
+        religion = next(iter(engine.distinct('religion', mem_status=status)), None)
+        caste = next(iter(engine.distinct('caste', mem_status=status, caste_category=category)), None)
+        reason = next(iter(engine.distinct('emigration_immigration_reason', mem_status=status)), None)
+        filters = [
+            ('overall', None, None, None),
+            ('overall', None, None, reason),
+            ('caste_category', category, None, None),
+            ('caste_category', category, caste, reason),
+            ('religion', religion, None, None),
+        ]
+        for level in ['state', 'district']:
+            for breakdown_type, breakdown_value, caste_filter, migration_reason in filters:
+                for places in [None, keys[level][:len(keys[level]) // 10]]:
+                    yield status, level, breakdown_type, breakdown_value, caste_filter, migration_reason, places
+
+
+def normalise(df, columns):
+    """Plain-string keys in a fixed row order, so frames compare by value"""
+    df = df[columns].copy()
+    for col in columns:
+        if col != 'count':
+            df[col] = df[col].astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def compare(name, reference, other):
+    if not reference.equals(other):
+        print(f"MISMATCH in {name}")
+        print(reference.compare(other) if reference.shape == other.shape else
+              f"  shapes {reference.shape} vs {other.shape}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare query engine results')
+    parser.add_argument('--data', type=Path, default=DATA_DIR / 'migration_2024.parquet')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    args = parser.parse_args()
+
+    keys = place_keys()
+    engines = []
+    for name in args.engines:
+        try:
+            start = time.perf_counter()
+            engines.append(create_engine(name, [args.data], DATA_DIR / 'district_mapping.parquet', keys))
+            print(f"{name}: loaded in {time.perf_counter() - start:.2f} s ({engines[-1].rows:,} records)")
+        except ImportError as error:
+            print(f"{name}: skipped ({error})")
+    if len(engines) < 2:
+        print("Need at least two installed engines to compare")
+        sys.exit(1)
+
+    reference, others = engines[0], engines[1:]
+    print("=" * 70)
+    print(f"Comparing {', '.join(e.name for e in others)} against {reference.name}")
+    print("=" * 70)
+
+    for other in others:
+        assert reference.source_rows == other.source_rows, 'source_rows'
+        assert reference.rows == other.rows, 'rows'
+        for level in ['state', 'district']:
+            ours = reference.surveyed_members()[level].reindex(keys[level], fill_value=0)
+            theirs = other.surveyed_members()[level].reindex(keys[level], fill_value=0)
+            compare(f'surveyed_members[{level}]', ours.astype(int), theirs.astype(int))
+
+    checked = 0
+    for status, level, *filters, places in scenarios(reference, keys):
+        label = f"{status}/{level}/{'/'.join(str(f) for f in filters)}{'' if places is None else '/places'}"
+        expected = reference.aggregate(status, level, *filters, places=places)
+        records = normalise(reference.records(status, *filters, places=places, level_type=level), RECORD_COLUMNS)
+        for other in others:
+            compare(f'aggregate {label} ({other.name})',
+                    normalise(expected, list(expected.columns)),
+                    normalise(other.aggregate(status, level, *filters, places=places), list(expected.columns)))
+            compare(f'records {label} ({other.name})', records,
+                    normalise(other.records(status, *filters, places=places, level_type=level), RECORD_COLUMNS))
+        checked += 1
+
+    print(f"{checked} filter combinations identical across {len(engines)} engines")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic CPHS-like migration records for scale testing
+
+The output has the same columns and dtypes as raw/migration_2024.parquet and
+uses the state/district names from district_mapping.parquet and
+district_centroids.parquet, so it can be fed straight to the dashboard:
+
+python b/generate_synthetic.py --rows 1000000
+MIGRATION_DATA=raw/migration_synthetic.parquet python migration.py
+
+Records are generated per household and member, then repeated over survey
+waves, with Zipf-like skew on origins, destinations and jatis so that a few
+corridors and castes dominate as they do in the survey. With --weights, a
+mem_weight column of CPHS-like member weights is added (the survey extract
+has none), for the dashboard's survey-weighted estimates.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RAW_DIR = Path(__file__).resolve().parent.parent / "raw"
+
+MEMBERS_PER_HOUSEHOLD = 3.2
+MEAN_WAVES_PER_MEMBER = 1.6
+SAME_STATE_SHARE = 0.45
+RETURN_SHARE = 0.05
+# Members of the population each sampled member stands for (log-normal around the median)
+MEDIAN_WEIGHT = 2500.0
+
+STATUSES = {"Emigrated": 0.55, "Immigrated": 0.33, "Member of the household": 0.12}
+CASTE_CATEGORIES = {"OBC": 0.42, "Intermediate Caste": 0.20, "SC": 0.19, "Upper Caste": 0.11, "ST": 0.08}
+JATIS_PER_CATEGORY = {"OBC": 1400, "Intermediate Caste": 500, "SC": 900, "Upper Caste": 300, "ST": 600}
+RELIGIONS = {"Hindu": 0.80, "Muslim": 0.14, "Christian": 0.023, "Sikh": 0.017,
+             "Buddhist": 0.007, "Jain": 0.004, "Others": 0.009}
+REASONS = {"Employment": 0.46, "Marriage": 0.21, "Family Moved": 0.12, "Education": 0.09,
+           "Business": 0.05, "Medical": 0.02, "Natural Calamity": 0.01, "Others": 0.04}
+# Destination hubs that draw a disproportionate share of inter-state moves
+HUB_STATES = {"Maharashtra": 6.0, "Delhi": 5.0, "Karnataka": 4.0, "Gujarat": 4.0,
+              "Tamil Nadu": 3.0, "Haryana": 2.5, "Telangana": 2.5, "Kerala": 2.0}
+
+
+def zipf_weights(n, exponent, rng):
+    """Zipf weights over n items in a random order"""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+def pick(rng, choices, size):
+    """Draw size values from a {value: probability} dict"""
+    values = np.array(list(choices))
+    p = np.array(list(choices.values()), dtype=float)
+    return values[rng.choice(len(values), size, p=p / p.sum())]
+
+
+def month_slots(n_months, last="Dec 2024"):
+    end = pd.Period(last, freq="M")
+    return [p.strftime("%b %Y") for p in pd.period_range(end - n_months + 1, end, freq="M")]
+
+
+def generate_migration(n_rows, seed=0, n_months=12, raw_dir=RAW_DIR, weights=False):
+    """Synthetic migration records with realistic skew, exactly n_rows long"""
+    rng = np.random.default_rng(seed)
+    mapping = pd.read_parquet(raw_dir / "district_mapping.parquet")
+    centroids = pd.read_parquet(raw_dir / "district_centroids.parquet")
+
+    # Only use districts the dashboard can place on the map
+    placed = set(zip(centroids["district_name"], centroids["state_name"]))
+    mapping = mapping[[(d, s) in placed for d, s in zip(mapping["matched_district"], mapping["state"])]]
+    mapping = mapping.reset_index(drop=True)
+
+    n_members = max(1, int(np.ceil(n_rows / MEAN_WAVES_PER_MEMBER)))
+    n_households = max(1, int(np.ceil(n_members / MEMBERS_PER_HOUSEHOLD)))
+
+    # Household attributes: home district, caste and religion are shared by members
+    home = rng.choice(len(mapping), n_households, p=zipf_weights(len(mapping), 0.8, rng))
+    hh_category = pick(rng, CASTE_CATEGORIES, n_households)
+    hh_caste = np.empty(n_households, dtype=object)
+    for category, n_jatis in JATIS_PER_CATEGORY.items():
+        mask = hh_category == category
+        ranks = rng.choice(n_jatis, mask.sum(), p=zipf_weights(n_jatis, 1.1, rng))
+        hh_caste[mask] = np.char.add(f"{category} Jati ", ranks.astype(str))
+    hh_religion = pick(rng, RELIGIONS, n_households)
+    hh_ids = rng.choice(np.arange(10_000_000, 10_000_000 + 20 * n_households), n_households, replace=False)
+
+    # Members, spread over households
+    member_hh = np.sort(rng.integers(0, n_households, n_members))
+    first = np.r_[0, np.flatnonzero(np.diff(member_hh)) + 1]
+    mem_id = np.arange(n_members) - np.repeat(first, np.diff(np.r_[first, n_members])) + 1
+
+    # Destination: same-state move or a hub-weighted inter-state move
+    state_weights = centroids["state_name"].map(HUB_STATES).fillna(1.0).to_numpy()
+    district_weights = state_weights * zipf_weights(len(centroids), 0.6, rng)
+    away = rng.choice(len(centroids), n_members, p=district_weights / district_weights.sum())
+    home_state = mapping["state"].to_numpy()[home[member_hh]]
+    same_state = rng.random(n_members) < SAME_STATE_SHARE
+    by_state = centroids.groupby("state_name").indices
+    for state in np.unique(home_state[same_state]):
+        rows = np.flatnonzero(same_state & (home_state == state))
+        options = by_state.get(state)
+        if options is not None:
+            away[rows] = rng.choice(options, len(rows))
+
+    members = pd.DataFrame({
+        "hh_id": hh_ids[member_hh],
+        "mem_id": mem_id,
+        "mem_status": pick(rng, STATUSES, n_members),
+        "state_code": mapping["state_code"].to_numpy()[home[member_hh]],
+        "state": home_state,
+        "district": mapping["district"].to_numpy()[home[member_hh]],
+        "emigrated_immigrated_state": centroids["state_name"].to_numpy()[away],
+        "emigrated_immigrated_district": centroids["district_name"].to_numpy()[away],
+        "caste_category": hh_category[member_hh],
+        "caste": hh_caste[member_hh],
+        "religion": hh_religion[member_hh],
+        "emigration_immigration_reason": pick(rng, REASONS, n_members),
+    })
+
+    # Repeat members over waves until exactly n_rows records exist
+    waves = np.minimum(rng.geometric(1 / MEAN_WAVES_PER_MEMBER, n_members), n_months)
+    repeat = np.repeat(np.arange(n_members), waves)
+    if len(repeat) < n_rows:
+        repeat = np.r_[repeat, rng.integers(0, n_members, n_rows - len(repeat))]
+    repeat = np.sort(rng.permutation(repeat)[:n_rows])
+    df = members.iloc[repeat].reset_index(drop=True)
+
+    months = np.array(month_slots(n_months))
+    month_index = rng.integers(0, n_months, n_rows)
+    df["month_slot"] = months[month_index]
+
+    # Some emigrants come back: a later record reports them as immigrants from the destination
+    returning = (df["mem_status"].to_numpy() == "Emigrated") & (rng.random(n_rows) < RETURN_SHARE)
+    returning &= month_index < n_months - 1
+    rows = np.flatnonzero(returning)
+    df.loc[rows, "mem_status"] = "Immigrated"
+    df.loc[rows, "month_slot"] = months[rng.integers(month_index[rows] + 1, n_months)]
+
+    # Non-migrant members have no destination recorded
+    stayers = df["mem_status"] == "Member of the household"
+    df.loc[stayers, ["emigrated_immigrated_state", "emigrated_immigrated_district",
+                     "emigration_immigration_reason"]] = None
+
+    # Match the categorical dtypes of the survey extract
+    for col in ["mem_status", "state", "district", "emigrated_immigrated_state",
+                "emigrated_immigrated_district", "caste_category", "caste", "religion",
+                "emigration_immigration_reason"]:
+        df[col] = df[col].astype("category")
+    df["month_slot"] = pd.Categorical(df["month_slot"], categories=months, ordered=True)
+
+    # Household design weights, shared by members (drawn last so the other columns don't change)
+    if weights:
+        hh_weight = rng.lognormal(np.log(MEDIAN_WEIGHT), 0.6, n_households).round(2)
+        df["mem_weight"] = hh_weight[pd.Index(hh_ids).get_indexer(df["hh_id"])]
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic CPHS-like migration records")
+    parser.add_argument("--rows", type=int, default=100_000, help="number of records to generate")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--months", type=int, default=12, help="number of month_slot values, ending Dec 2024")
+    parser.add_argument("--output", default=str(RAW_DIR / "migration_synthetic.parquet"), help="output parquet path")
+    parser.add_argument("--weights", action="store_true", help="add CPHS-like member survey weights (mem_weight)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows:,} synthetic migration records (seed={args.seed})...")
+    df = generate_migration(args.rows, args.seed, args.months, weights=args.weights)
+
+    print(f"Memory usage: {df.memory_usage(deep=True).sum() / (1024 * 1024):.2f} MB")
+    print(f"Members: {df[['hh_id', 'mem_id']].drop_duplicates().shape[0]:,}, "
+          f"households: {df['hh_id'].nunique():,}")
+    print(df["mem_status"].value_counts().to_string())
+
+    df.to_parquet(args.output, engine="pyarrow", compression="snappy", index=False)
+    file_size = os.path.getsize(args.output) / (1024 * 1024)
+    print(f"✓ Saved to {args.output} ({file_size:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
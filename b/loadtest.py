@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Load-test the dashboard with concurrent simulated users
+
+Starts migration.py in-process on a threaded local server (or targets a
+running one with --url) and runs N virtual users against it. Each user
+loads the page layout, then plays a random session of realistic
+interactions: status and level toggles, breakdown -> value -> caste ->
+reason cascades (typing into the caste search), flow limit and map style
+changes, zoom/pan in visible-area mode, clicks on places (with paging
+through their partners), scrubbing through the months when monthly frames
+are available and switching to survey-weighted counts. Think time between
+actions is random.
+
+Users behave like the Dash renderer. The callback graph comes from
+/_dash-dependencies. Every server callback triggered by a changed property
+is posted to /_dash-update-component. A callback whose inputs are outputs
+of another pending callback waits for that one, so update_map fires after
+the option lists it depends on, with the new values. Responses update the
+user's copy of the component properties and trigger further callbacks.
+
+Reports throughput, latency percentiles per callback, error rates,
+no-update responses (204s, e.g. map requests superseded by a newer one from
+the same page or already answered by their preview) and, in-process, server
+RSS over time.
+
+Run this script from the root directory of the repo:
+python b/loadtest.py --users 20 --duration 60
+python b/loadtest.py --data raw/migration_2024.parquet --users 50 --ramp-up 30 --output load.json
+python b/loadtest.py --url http://localhost:8050 --users 10
+"""
+
+import argparse
+import base64
+import json
+import logging
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+from benchmark import git_revision, load_app, percentiles
+from generate_synthetic import generate_migration
+
+# Relative weights of the interactions a session is made of
+ACTIONS = {
+    "toggle_status": 3,
+    "toggle_level": 3,
+    "breakdown_cascade": 4,
+    "reason": 2,
+    "flow_limit": 1,
+    "map_style": 1,
+    "zoom": 2,
+    "inspect_place": 2,
+    "scrub_months": 1,
+    "toggle_weighting": 1,
+}
+
+
+class Recorder:
+    """Thread-safe log of requests and RSS samples"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.actions = 0
+        self.rss = []
+
+    def add(self, **entry):
+        with self.lock:
+            self.requests.append(entry)
+
+
+class Callback:
+    """One server-side callback from /_dash-dependencies"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.multi = spec["output"].startswith("..")
+        self.outputs = [tuple(o.rsplit(".", 1)) for o in spec["output"].strip(".").split("...")]
+        self.inputs = [(i["id"], i["property"]) for i in spec["inputs"]]
+        self.state = [(s["id"], s["property"]) for s in spec["state"]]
+        self.name = self.outputs[0][0]
+
+    def body(self, props, changed):
+        value = lambda key: props.get(key[0], {}).get(key[1])
+        outputs = [{"id": i, "property": p} for i, p in self.outputs]
+        return {
+            "output": self.spec["output"],
+            "outputs": outputs if self.multi else outputs[0],
+            "inputs": [{"id": i, "property": p, "value": value((i, p))} for i, p in self.inputs],
+            "changedPropIds": [f"{i}.{p}" for i, p in changed],
+            "state": [{"id": i, "property": p, "value": value((i, p))} for i, p in self.state],
+        }
+
+
+def component_props(node, props):
+    """Collect the props of every component with an id in a layout tree"""
+    if isinstance(node, list):
+        for child in node:
+            component_props(child, props)
+    elif isinstance(node, dict) and "props" in node:
+        if "id" in node["props"]:
+            props[node["props"]["id"]] = dict(node["props"])
+        component_props(node["props"].get("children"), props)
+    return props
+
+
+def place_ids(figure):
+    """Place ids on the marker layer of a map-figure value (a full figure or a patch of its traces)"""
+    if isinstance(figure, dict) and figure.get("__dash_patch_update"):
+        traces = next((op["params"]["value"] for op in figure["operations"] if op["location"] == ["data"]), [])
+    else:
+        traces = (figure or {}).get("data", [])
+    for trace in traces:
+        if trace.get("name") == "Migration Points":
+            data = trace.get("customdata")
+            if isinstance(data, dict):
+                # Plotly sends NumPy arrays base64-encoded, with the shape as "rows, columns"
+                shape = [int(n) for n in str(data.get("shape", -1)).split(",")]
+                data = np.frombuffer(base64.b64decode(data["bdata"]), dtype=data["dtype"]).reshape(shape)
+            return [int(row[0]) for row in data]
+    return []
+
+
+class VirtualUser:
+    """One browser page: its component props, callbacks and a random session"""
+
+    def __init__(self, base_url, callbacks, recorder, rng, think_ms):
+        self.base_url = base_url
+        self.callbacks = callbacks
+        self.recorder = recorder
+        self.rng = rng
+        self.think_ms = think_ms
+        self.http = requests.Session()
+        self.props = {}
+
+    def load_page(self):
+        start = time.perf_counter()
+        response = self.http.get(f"{self.base_url}/_dash-layout", timeout=120)
+        self.recorder.add(callback="_dash-layout", start=time.time(), seconds=time.perf_counter() - start,
+                          status=response.status_code, bytes=len(response.content))
+        self.props = component_props(response.json(), {})
+        self.fire({cb: set() for cb in self.callbacks if not cb.spec.get("prevent_initial_call")})
+
+    def triggered(self, changed):
+        pending = defaultdict(set)
+        for cb in self.callbacks:
+            for key in cb.inputs:
+                if key in changed:
+                    pending[cb].add(key)
+        return pending
+
+    def fire(self, pending):
+        """Run pending callbacks (and the ones they trigger) in dependency order"""
+        pending = dict(pending)
+        while pending:
+            blocked = {cb for cb in pending for other in pending
+                       if other is not cb and set(other.outputs) & set(cb.inputs)}
+            ready = [cb for cb in pending if cb not in blocked] or list(pending)
+            changed = set()
+            for cb in ready:
+                changed |= self.post(cb, pending.pop(cb))
+            for cb, keys in self.triggered(changed).items():
+                pending.setdefault(cb, set()).update(keys)
+
+    def post(self, cb, changed):
+        """POST one callback; apply its response and return the properties that changed"""
+        start = time.perf_counter()
+        try:
+            response = self.http.post(f"{self.base_url}/_dash-update-component",
+                                      json=cb.body(self.props, changed), timeout=120)
+            status, size = response.status_code, len(response.content)
+        except requests.RequestException as error:
+            self.recorder.add(callback=cb.name, start=time.time(), seconds=time.perf_counter() - start,
+                              status=type(error).__name__, bytes=0)
+            return set()
+        self.recorder.add(callback=cb.name, start=time.time(), seconds=time.perf_counter() - start,
+                          status=status, bytes=size)
+        if status != 200:
+            return set()
+
+        updated = set()
+        for component_id, values in response.json().get("response", {}).items():
+            for prop, value in values.items():
+                if self.props.setdefault(component_id, {}).get(prop) != value:
+                    self.props[component_id][prop] = value
+                    updated.add((component_id, prop))
+        return updated
+
+    def set(self, *changes):
+        """Change component properties as a user would and run the resulting callbacks"""
+        changed = set()
+        for component_id, prop, value in changes:
+            if self.props.setdefault(component_id, {}).get(prop) != value:
+                self.props[component_id][prop] = value
+                changed.add((component_id, prop))
+        self.fire(self.triggered(changed))
+
+    def pick(self, component_id):
+        options = self.props.get(component_id, {}).get("options") or []
+        return self.rng.choice(options)["value"] if options else None
+
+    def act(self, action):
+        rng = self.rng
+        if action == "toggle_status":
+            current = self.props["migration-status"]["value"]
+            self.set(("migration-status", "value", "Immigrated" if current == "Emigrated" else "Emigrated"))
+        elif action == "toggle_level":
+            current = self.props["level-type"]["value"]
+            self.set(("level-type", "value", "district" if current == "state" else "state"))
+        elif action == "breakdown_cascade":
+            self.set(("breakdown-type", "value", rng.choice(["caste_category", "religion", "overall"])))
+            if self.props["breakdown-type"]["value"] != "overall":
+                self.think()
+                self.set(("breakdown-value", "value", self.pick("breakdown-value")))
+            if self.props["breakdown-type"]["value"] == "caste_category" and rng.random() < 0.5:
+                # Type the first letters of a caste, then pick from the server's matches
+                caste = self.pick("caste-filter")
+                for n in range(1, min(4, len(caste or "")) + 1):
+                    self.set(("caste-filter", "search_value", caste[:n]))
+                self.think()
+                self.set(("caste-filter", "value", self.pick("caste-filter")))
+        elif action == "reason":
+            self.set(("migration-reason", "value", self.pick("migration-reason") if rng.random() < 0.7 else None))
+        elif action == "flow_limit":
+            self.set(("flow-limit", "value", self.pick("flow-limit")))
+        elif action == "map_style":
+            self.set(("map-style", "value", self.pick("map-style")))
+        elif action == "zoom":
+            self.set(("map-extent", "value", "viewport"))
+            self.set(("migration-map", "relayoutData", {
+                "geo.center.lon": rng.uniform(70.0, 92.0),
+                "geo.center.lat": rng.uniform(10.0, 32.0),
+                "geo.projection.scale": rng.choice([4.0, 8.0, 16.0]),
+            }))
+        elif action == "inspect_place":
+            places = place_ids(self.props.get("map-figure", {}).get("data"))
+            if places:
+                self.set(("migration-map", "clickData", {"points": [{"customdata": [rng.choice(places)]}]}))
+                for _ in range(rng.randint(0, 2)):
+                    self.think()
+                    clicks = self.props.get("place-detail-next", {}).get("n_clicks") or 0
+                    self.set(("place-detail-next", "n_clicks", clicks + 1))
+        elif action == "scrub_months":
+            last_month = self.props.get("month-slider", {}).get("max") or 0
+            if last_month:
+                self.set(("month-mode", "value", ["monthly"]))
+                for month in sorted(rng.sample(range(last_month + 1), min(3, last_month + 1))):
+                    self.set(("month-slider", "value", month))
+                self.set(("month-mode", "value", []))
+        elif action == "toggle_weighting":
+            current = self.props.get("count-weighting", {}).get("value")
+            self.set(("count-weighting", "value", "sample" if current == "weighted" else "weighted"))
+        with self.recorder.lock:
+            self.recorder.actions += 1
+
+    def think(self):
+        time.sleep(self.rng.expovariate(1000.0 / self.think_ms) if self.think_ms > 0 else 0)
+
+    def run(self, stop_at):
+        self.load_page()
+        names, weights = list(ACTIONS), list(ACTIONS.values())
+        while time.time() < stop_at:
+            self.think()
+            self.act(self.rng.choices(names, weights)[0])
+
+
+def sample_rss(recorder, rss_mb, stop, interval=1.0):
+    """Record (time, RSS MB) every interval seconds until stop is set"""
+    while not stop.wait(interval):
+        with recorder.lock:
+            recorder.rss.append((time.time(), rss_mb()))
+
+
+def summarise(recorder, started, duration, bucket_seconds):
+    entries = recorder.requests
+    ok = [e for e in entries if e["status"] == 200]
+    superseded = [e for e in entries if e["status"] == 204]
+    errors = [e for e in entries if e["status"] not in (200, 204)]
+    summary = {
+        "requests": len(entries),
+        "actions": recorder.actions,
+        "throughput_rps": len(entries) / duration,
+        "actions_per_s": recorder.actions / duration,
+        "no_update": len(superseded),
+        "errors": len(errors),
+        "error_rate": len(errors) / len(entries) if entries else 0.0,
+        "error_statuses": {str(s): sum(e["status"] == s for e in errors) for s in {e["status"] for e in errors}},
+        "callbacks": {},
+        "timeline": [],
+    }
+    by_callback = defaultdict(list)
+    for e in ok:
+        by_callback[e["callback"]].append(e)
+    for name, items in sorted(by_callback.items()):
+        summary["callbacks"][name] = {
+            "requests": len(items),
+            **percentiles([e["seconds"] for e in items]),
+            "mean_bytes": float(np.mean([e["bytes"] for e in items])),
+        }
+    if ok:
+        summary["overall"] = percentiles([e["seconds"] for e in ok])
+
+    for offset in range(0, int(np.ceil(duration)), bucket_seconds):
+        lo, hi = started + offset, started + offset + bucket_seconds
+        items = [e for e in entries if lo <= e["start"] < hi]
+        rss = [mb for t, mb in recorder.rss if lo <= t < hi]
+        latency = [e["seconds"] for e in items if e["status"] == 200]
+        summary["timeline"].append({
+            "t": offset,
+            "requests_per_s": len(items) / bucket_seconds,
+            "p90_ms": float(np.percentile(np.asarray(latency) * 1000, 90)) if latency else None,
+            "errors": sum(e["status"] not in (200, 204) for e in items),
+            "rss_mb": max(rss) if rss else None,
+        })
+    return summary
+
+
+def report(summary):
+    print("\n" + "=" * 70)
+    print("RESULTS")
+    print("=" * 70)
+    print(f"  {summary['requests']:,} requests, {summary['actions']:,} user actions")
+    print(f"  throughput {summary['throughput_rps']:.1f} req/s, {summary['actions_per_s']:.1f} actions/s")
+    print(f"  no-update (204) responses {summary['no_update']:,}, errors {summary['errors']:,} "
+          f"({summary['error_rate']:.2%}) {summary['error_statuses'] or ''}")
+    print(f"\n  {'callback':<24} {'requests':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'KB':>8}")
+    for name, c in summary["callbacks"].items():
+        print(f"  {name:<24} {c['requests']:9,d} {c['p50_ms']:9.1f} {c['p90_ms']:9.1f} {c['p99_ms']:9.1f} "
+              f"{c['max_ms']:9.1f} {c['mean_bytes'] / 1024:8.1f}")
+    print(f"\n  {'t (s)':>6} {'req/s':>8} {'p90 ms':>9} {'errors':>7} {'RSS MB':>8}")
+    for row in summary["timeline"]:
+        p90 = f"{row['p90_ms']:9.1f}" if row["p90_ms"] is not None else f"{'-':>9}"
+        rss = f"{row['rss_mb']:8.1f}" if row["rss_mb"] is not None else f"{'-':>8}"
+        print(f"  {row['t']:6d} {row['requests_per_s']:8.1f} {p90} {row['errors']:7d} {rss}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load after ramp-up starts")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which users join")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="mean think time between actions")
+    parser.add_argument("--seed", type=int, default=0, help="seed for sessions and synthetic data")
+    parser.add_argument("--rows", type=int, default=50000, help="synthetic migration rows to generate")
+    parser.add_argument("--data", help="load an existing migration parquet instead of synthetic data")
+    parser.add_argument("--url", help="test a running server instead of starting one in-process")
+    parser.add_argument("--bucket", type=int, default=5, help="seconds per timeline row")
+    parser.add_argument("--output", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("MIGRATION DASHBOARD LOAD TEST")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = rss_mb = None
+        base_url = args.url.rstrip("/") if args.url else None
+        if base_url is None:
+            data_path = args.data
+            if data_path is None:
+                data_path = Path(tmp) / "migration_synthetic.parquet"
+                print(f"Generating {args.rows:,} synthetic migration rows (seed={args.seed})...")
+                generate_migration(args.rows, args.seed, weights=True).to_parquet(data_path, index=False)
+            app_module, load_seconds = load_app(data_path)
+            from memory_guard import current_rss_mb
+            rss_mb = current_rss_mb
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+            server = make_server("127.0.0.1", 0, app_module.app.server, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            print(f"Data preparation: {load_seconds:.2f} s; serving on {base_url}")
+
+        callbacks = [Callback(spec) for spec in requests.get(f"{base_url}/_dash-dependencies", timeout=30).json()
+                     if not spec.get("clientside_function")]
+        print(f"{len(callbacks)} server callbacks; {args.users} users for {args.duration:.0f} s "
+              f"(ramp-up {args.ramp_up:.0f} s, think time {args.think_ms:.0f} ms)\n")
+
+        recorder = Recorder()
+        stop = threading.Event()
+        if rss_mb is not None:
+            threading.Thread(target=sample_rss, args=(recorder, rss_mb, stop), daemon=True).start()
+
+        started = time.time()
+        stop_at = started + args.duration
+        threads = []
+        for n in range(args.users):
+            user = VirtualUser(base_url, callbacks, recorder, random.Random(args.seed * 1000 + n), args.think_ms)
+            delay = args.ramp_up * n / max(1, args.users)
+            thread = threading.Thread(target=lambda u=user, d=delay: (time.sleep(d), u.run(stop_at)), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        stop.set()
+        duration = time.time() - started
+        if server is not None:
+            server.shutdown()
+
+    summary = summarise(recorder, started, duration, args.bucket)
+    report(summary)
+    summary["meta"] = {
+        "git_revision": git_revision(),
+        "users": args.users,
+        "duration_s": duration,
+        "ramp_up_s": args.ramp_up,
+        "think_ms": args.think_ms,
+        "target": args.url or (args.data or f"synthetic(rows={args.rows}, seed={args.seed})"),
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(summary, indent=2))
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
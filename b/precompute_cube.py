@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Precompute the aggregate cube of unique migrants per origin-destination pair
+
+Every (mem_status x level x filter layer x reason) aggregate the dashboard
+can ask for is computed on a process pool. The prepared records are
+integer-coded once and placed in shared memory, so workers attach to the
+arrays instead of receiving a pickled DataFrame. Each task counts distinct
+migrants for one shard with NumPy (np.unique + np.bincount); shards are
+merged in task order and sorted, so the output is identical for any number
+of workers. If the records carry survey weights (engine.WEIGHT_COLUMN),
+each row also gets its population estimate in a 'weighted' column.
+
+Run this script from the root directory of the repo:
+python b/precompute_cube.py --data raw/migration_2024.parquet --workers 8
+python b/precompute_cube.py --data raw/migration_2022_2024.parquet raw/migration_2024.parquet
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from cube import FILTER_COLUMNS, FLOW_COLUMNS, LAYERS, METADATA_KEY  # noqa: E402
+from engine import STATUSES, migrant_records, read_records, weighted_migrants  # noqa: E402
+
+LEVELS = ['state', 'district']
+# Caste shards per (status, level, layer); the caste layers dominate the work
+CASTE_SHARDS = 4
+
+_arrays = {}
+_shms = []
+
+
+def load_records(paths, raw_dir):
+    """Migration records prepared by the pandas engine's own code, so the cube matches the app"""
+    df, source_rows = read_records(paths, raw_dir / 'district_mapping.parquet')
+    return migrant_records(df).reset_index(drop=True), source_rows
+
+
+def encode(df):
+    """Integer codes for every column the cube needs, plus their vocabularies"""
+    codes, vocab = {}, {}
+
+    # Home and away places share one vocabulary so origin/destination codes compare
+    for kind, home, away in [('state', 'state', 'emigrated_immigrated_state'),
+                             ('district', 'matched_district', 'emigrated_immigrated_district')]:
+        values = pd.concat([df[home].astype(object), df[away].astype(object)], ignore_index=True)
+        all_codes, uniques = pd.factorize(values, sort=True)
+        codes[f'home_{kind}'] = all_codes[:len(df)].astype(np.int32)
+        codes[f'away_{kind}'] = all_codes[len(df):].astype(np.int32)
+        vocab[kind] = np.asarray(uniques, dtype=object)
+
+    for col, name in [('mem_status', 'mem_status'), ('caste_category', 'caste_category'),
+                      ('religion', 'religion'), ('caste', 'caste'),
+                      ('emigration_immigration_reason', 'reason'), ('unique_id', 'person')]:
+        col_codes, uniques = pd.factorize(df[col].astype(object), sort=True)
+        codes[name] = col_codes.astype(np.int32)
+        vocab[name] = np.asarray(uniques, dtype=object)
+    if 'weight' in df.columns:
+        codes['weight'] = df['weight'].to_numpy(dtype=np.float64)
+    return codes, vocab
+
+
+def share(codes):
+    """Copy arrays into shared memory and return (name, dtype, shape) descriptors"""
+    descriptors = {}
+    for name, arr in codes.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        _shms.append(shm)
+        descriptors[name] = (shm.name, arr.dtype.str, arr.shape)
+    return descriptors
+
+
+def attach(descriptors):
+    """Pool initializer: map the shared arrays into this worker"""
+    for name, (shm_name, dtype, shape) in descriptors.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shms.append(shm)
+        _arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def count_shard(task):
+    """Unique migrants per (filter values, OD pair) for one shard"""
+    status_code, level, layer, by_reason, caste_shard, n_shards, sizes = task
+    a = _arrays
+    emigrated = status_code == sizes['emigrated_code']
+
+    home, away = a[f'home_{level}'], a[f'away_{level}']
+    origin, destination = (home, away) if emigrated else (away, home)
+    mask = (a['mem_status'] == status_code) & (origin >= 0) & (destination >= 0)
+    if level == 'district':
+        origin_state, destination_state = ((a['home_state'], a['away_state']) if emigrated
+                                           else (a['away_state'], a['home_state']))
+        mask &= (origin_state >= 0) & (destination_state >= 0)
+    if 'caste' in LAYERS[layer] and n_shards > 1:
+        mask &= (a['caste'] % n_shards) == caste_shard
+    rows = np.flatnonzero(mask)
+
+    columns = [(col, a[col][rows]) for col in LAYERS[layer]]
+    if by_reason:
+        columns.append(('reason', a['reason'][rows]))
+    columns += [('origin', origin[rows]), ('destination', destination[rows])]
+    if level == 'district':
+        columns += [('origin_state', origin_state[rows]), ('destination_state', destination_state[rows])]
+    dims = [sizes[name] for name, _ in columns]
+
+    if len(rows) == 0:
+        out = {name: np.zeros(0, dtype=np.int32) for name, _ in columns} | {'count': np.zeros(0, np.int32)}
+        return out | ({'weighted': np.zeros(0, np.int64)} if 'weight' in a else {})
+
+    key = np.ravel_multi_index([c.astype(np.int64) for _, c in columns], dims)
+    groups, group_of_row = np.unique(key, return_inverse=True)
+    pairs = np.unique(group_of_row.astype(np.int64) * sizes['person'] + a['person'][rows])
+    counts = np.bincount(pairs // sizes['person'], minlength=len(groups))
+
+    out = {name: c.astype(np.int32) for (name, _), c in zip(columns, np.unravel_index(groups, dims))}
+    out['count'] = counts.astype(np.int32)
+    if 'weight' in a:
+        out['weighted'] = weighted_shard(group_of_row, rows, len(groups))
+    return out
+
+
+def weighted_shard(group_of_row, rows, n_groups):
+    """Population estimates per group of a shard, rounded like engine.aggregate(weighted=True)"""
+    a = _arrays
+    return np.rint(weighted_migrants(group_of_row, a['person'][rows], a['weight'][rows], n_groups)).astype(np.int64)
+
+
+def build_tasks(vocab, caste_shards):
+    sizes = {'caste_category': len(vocab['caste_category']), 'religion': len(vocab['religion']),
+             'caste': len(vocab['caste']), 'reason': len(vocab['reason']),
+             'person': max(1, len(vocab['person'])),
+             'origin': len(vocab['state']), 'destination': len(vocab['state']),
+             'origin_state': len(vocab['state']), 'destination_state': len(vocab['state'])}
+    statuses = list(vocab['mem_status'])
+    sizes['emigrated_code'] = statuses.index('Emigrated') if 'Emigrated' in statuses else -1
+
+    tasks = []
+    for status in STATUSES:
+        if status not in statuses:
+            continue
+        for level in LEVELS:
+            level_sizes = dict(sizes)
+            if level == 'district':
+                level_sizes['origin'] = level_sizes['destination'] = len(vocab['district'])
+            for layer, dims in LAYERS.items():
+                n_shards = caste_shards if 'caste' in dims else 1
+                for by_reason in (False, True):
+                    for shard in range(n_shards):
+                        tasks.append((statuses.index(status), level, layer, by_reason,
+                                      shard, n_shards, level_sizes))
+    return tasks
+
+
+def decode(task, out, vocab):
+    """Turn one shard's codes back into labelled rows"""
+    status_code, level, layer, by_reason = task[:4]
+    n = len(out['count'])
+    frame = {'mem_status': np.repeat(vocab['mem_status'][status_code], n),
+             'level': np.repeat(level, n).astype(object)}
+    for col in ['caste_category', 'religion', 'caste']:
+        frame[col] = vocab[col][out[col]] if col in out else np.full(n, None, dtype=object)
+    frame['reason'] = vocab['reason'][out['reason']] if by_reason else np.full(n, None, dtype=object)
+    places = vocab['district'] if level == 'district' else vocab['state']
+    frame['origin'] = places[out['origin']]
+    frame['destination'] = places[out['destination']]
+    if level == 'district':
+        frame['origin_state'] = vocab['state'][out['origin_state']]
+        frame['destination_state'] = vocab['state'][out['destination_state']]
+    else:
+        frame['origin_state'] = frame['destination_state'] = np.full(n, None, dtype=object)
+    frame['count'] = out['count']
+    if 'weighted' in out:
+        frame['weighted'] = out['weighted']
+    return pd.DataFrame(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the migration aggregate cube')
+    parser.add_argument('--data', nargs='+', default=[str(REPO_DIR / 'raw' / 'migration_2024.parquet')],
+                        help='migration parquet file(s); several files are concatenated')
+    parser.add_argument('--output', default=str(REPO_DIR / 'raw' / 'aggregate_cube.parquet'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--caste-shards', type=int, default=CASTE_SHARDS,
+                        help='shards per caste layer task')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('PRECOMPUTING AGGREGATE CUBE')
+    print('=' * 70)
+    start = time.perf_counter()
+    df, source_rows = load_records(args.data, REPO_DIR / 'raw')
+    codes, vocab = encode(df)
+    del df
+    print(f'Prepared {len(codes["person"]):,} migration records in {time.perf_counter() - start:.1f} s'
+          f'{" with survey weights" if "weight" in codes else ""}')
+
+    tasks = build_tasks(vocab, args.caste_shards)
+    descriptors = share(codes)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=attach,
+                                 initargs=(descriptors,)) as pool:
+            shards = list(pool.map(count_shard, tasks, chunksize=1))
+    finally:
+        for shm in _shms:
+            shm.close()
+            shm.unlink()
+    print(f'Counted {len(tasks)} shards on {args.workers} workers in {time.perf_counter() - start:.1f} s')
+
+    cube = pd.concat([decode(task, out, vocab) for task, out in zip(tasks, shards)], ignore_index=True)
+    cube = cube.sort_values(FILTER_COLUMNS + FLOW_COLUMNS, na_position='first', kind='stable')
+    for col in FILTER_COLUMNS + FLOW_COLUMNS:
+        cube[col] = cube[col].astype('category')
+
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    metadata = {'source_files': [Path(p).name for p in args.data], 'source_rows': source_rows,
+                'weighted': 'weighted' in cube.columns}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           METADATA_KEY: json.dumps(metadata).encode()})
+    pq.write_table(table, args.output, compression='snappy')
+
+    file_size = os.path.getsize(args.output) / (1024 * 1024)
+    print(f'✓ Saved {len(cube):,} cube rows to {args.output} ({file_size:.2f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Precompute monthly animation frames of unique migrants per origin-destination pair
+
+For every aggregate the cube holds (mem_status x level x filter layer x
+reason), counts unique migrants per OD pair and month_slot, on the same
+shared-memory process pool as b/precompute_cube.py. Frames are then delta
+encoded: a row is written only when a pair's count differs from the month
+before (a count of 0 when the pair disappears), so months where little
+changes cost little. The file is sorted by filter columns and month, with
+dictionary-encoded columns, and frames.py rebuilds any month from it
+without touching the raw records. Records with survey weights also get a
+'weighted' population estimate per row, delta encoded with the count.
+
+Run this script from the root directory of the repo:
+python b/precompute_frames.py --data raw/migration_2024.parquet --workers 8
+python b/precompute_frames.py --layers overall caste_category religion
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import precompute_cube  # noqa: E402
+from cube import FILTER_COLUMNS, FLOW_COLUMNS, LAYERS  # noqa: E402
+from frames import METADATA_KEY  # noqa: E402
+from panel import month_numbers  # noqa: E402
+
+
+def count_monthly_shard(task):
+    """Unique migrants per (filter values, OD pair, month) for one shard, sorted by series and month"""
+    status_code, level, layer, by_reason, caste_shard, n_shards, sizes = task
+    a = precompute_cube._arrays
+    emigrated = status_code == sizes['emigrated_code']
+
+    home, away = a[f'home_{level}'], a[f'away_{level}']
+    origin, destination = (home, away) if emigrated else (away, home)
+    mask = (a['mem_status'] == status_code) & (origin >= 0) & (destination >= 0) & (a['month'] >= 0)
+    if level == 'district':
+        origin_state, destination_state = ((a['home_state'], a['away_state']) if emigrated
+                                           else (a['away_state'], a['home_state']))
+        mask &= (origin_state >= 0) & (destination_state >= 0)
+    if 'caste' in LAYERS[layer] and n_shards > 1:
+        mask &= (a['caste'] % n_shards) == caste_shard
+    rows = np.flatnonzero(mask)
+
+    columns = [(col, a[col][rows]) for col in LAYERS[layer]]
+    if by_reason:
+        columns.append(('reason', a['reason'][rows]))
+    columns += [('origin', origin[rows]), ('destination', destination[rows])]
+    if level == 'district':
+        columns += [('origin_state', origin_state[rows]), ('destination_state', destination_state[rows])]
+    # Month last, so that sorted keys run through each series month by month
+    columns.append(('month', a['month'][rows]))
+    dims = [sizes[name] for name, _ in columns]
+
+    if len(rows) == 0:
+        out = {name: np.zeros(0, dtype=np.int32) for name, _ in columns} | {'count': np.zeros(0, np.int32)}
+        return out | ({'weighted': np.zeros(0, np.int64)} if 'weight' in a else {})
+
+    key = np.ravel_multi_index([c.astype(np.int64) for _, c in columns], dims)
+    groups, group_of_row = np.unique(key, return_inverse=True)
+    pairs = np.unique(group_of_row.astype(np.int64) * sizes['person'] + a['person'][rows])
+    counts = np.bincount(pairs // sizes['person'], minlength=len(groups))
+
+    out = {name: c.astype(np.int32) for (name, _), c in zip(columns, np.unravel_index(groups, dims))}
+    out['count'] = counts.astype(np.int32)
+    if 'weight' in a:
+        out['weighted'] = precompute_cube.weighted_shard(group_of_row, rows, len(groups))
+    return delta_encode(out, groups // sizes['month'], sizes['month'])
+
+
+def delta_encode(out, series, n_months):
+    """Keep the rows whose counts differ from the month before; add 0s where a pair disappears
+
+    series identifies (filters, OD pair) for each row of out; rows are sorted
+    by series, then month. The count and, if present, the weighted estimate
+    are encoded together.
+    """
+    month = out['month']
+    values = [out[name] for name in ('count', 'weighted') if name in out]
+    same_series = np.zeros(len(month), dtype=bool)
+    same_series[1:] = series[1:] == series[:-1]
+    follows = np.zeros(len(month), dtype=bool)
+    follows[1:] = same_series[1:] & (month[1:] == month[:-1] + 1)
+    changed = ~follows
+    for counts in values:
+        changed[1:] |= follows[1:] & (counts[1:] != counts[:-1])
+
+    # A pair present in one month and absent the next drops to 0
+    continued = np.zeros(len(month), dtype=bool)
+    continued[:-1] = follows[1:]
+    ends = np.flatnonzero(~continued & (month < n_months - 1))
+
+    keep = np.concatenate([np.flatnonzero(changed), ends])
+    result = {name: values[keep] for name, values in out.items()}
+    result['month'][changed.sum():] += 1
+    for name in ('count', 'weighted'):
+        if name in result:
+            result[name][changed.sum():] = 0
+    order = np.lexsort((result['month'], np.concatenate([series[changed], series[ends]])))
+    return {name: values[order] for name, values in result.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute delta-encoded monthly migration frames')
+    parser.add_argument('--data', nargs='+', default=[str(REPO_DIR / 'raw' / 'migration_2024.parquet')],
+                        help='migration parquet file(s); several files are concatenated')
+    parser.add_argument('--output', default=str(REPO_DIR / 'raw' / 'monthly_frames.parquet'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--layers', nargs='+', choices=list(LAYERS), default=list(LAYERS),
+                        help='filter layers to precompute (all of the cube\'s by default)')
+    parser.add_argument('--caste-shards', type=int, default=precompute_cube.CASTE_SHARDS,
+                        help='shards per caste layer task')
+    args = parser.parse_args()
+
+    print('=' * 70)
+    print('PRECOMPUTING MONTHLY FRAMES')
+    print('=' * 70)
+    start = time.perf_counter()
+    df, source_rows = precompute_cube.load_records(args.data, REPO_DIR / 'raw')
+    codes, vocab = precompute_cube.encode(df)
+
+    # Frames are numbered from the earliest month; unparseable month slots are left out
+    numbers = month_numbers(df['month_slot'])
+    valid = numbers >= 0
+    first = int(numbers[valid].min()) if valid.any() else 0
+    n_months = int(numbers[valid].max()) - first + 1 if valid.any() else 0
+    codes['month'] = np.where(valid, numbers - first, -1).astype(np.int32)
+    months = [pd.Timestamp(year=(first + i) // 12, month=(first + i) % 12 + 1, day=1).strftime('%b %Y')
+              for i in range(n_months)]
+    del df
+    print(f'Prepared {len(codes["person"]):,} migration records over {n_months} months '
+          f'in {time.perf_counter() - start:.1f} s')
+
+    tasks = [task for task in precompute_cube.build_tasks(vocab, args.caste_shards) if task[2] in args.layers]
+    for task in tasks:
+        task[-1]['month'] = max(1, n_months)
+    descriptors = precompute_cube.share(codes)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=precompute_cube.attach,
+                                 initargs=(descriptors,)) as pool:
+            shards = list(pool.map(count_monthly_shard, tasks, chunksize=1))
+    finally:
+        for shm in precompute_cube._shms:
+            shm.close()
+            shm.unlink()
+    print(f'Counted {len(tasks)} shards on {args.workers} workers in {time.perf_counter() - start:.1f} s')
+
+    parts = []
+    for task, out in zip(tasks, shards):
+        part = precompute_cube.decode(task, out, vocab)
+        part.insert(len(FILTER_COLUMNS), 'month', out['month'].astype(np.int16))
+        parts.append(part)
+    frames = pd.concat(parts, ignore_index=True)
+    frames = frames.sort_values(FILTER_COLUMNS + ['month'] + FLOW_COLUMNS, na_position='first', kind='stable')
+    for col in FILTER_COLUMNS + FLOW_COLUMNS:
+        frames[col] = frames[col].astype('category')
+
+    table = pa.Table.from_pandas(frames, preserve_index=False)
+    metadata = {'source_files': [Path(p).name for p in args.data], 'source_rows': source_rows,
+                'months': months, 'layers': args.layers, 'weighted': 'weighted' in frames.columns}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           METADATA_KEY: json.dumps(metadata).encode()})
+    pq.write_table(table, args.output, compression='zstd')
+
+    file_size = os.path.getsize(args.output) / (1024 * 1024)
+    print(f'✓ Saved {len(frames):,} frame deltas for {n_months} months to {args.output} ({file_size:.2f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Precomputed aggregate cube of unique migrants per origin-destination pair
+
+b/precompute_cube.py computes, for every migration status and level, the
+unique-migrant counts per OD pair under each filter combination the
+dashboard offers (caste category, religion, caste, caste category + caste,
+each with and without a migration reason). Rows are stored in one parquet
+file; a null in a filter column means "all values".
+
+AggregateCube loads that file and answers lookups with a binary search over
+an int64 key built from the filter columns' category codes, so update_map
+can skip filtering and groupby entirely. When the records carry survey
+weights, a 'weighted' column holds the population estimate of each row next
+to its sample count, so weighted lookups cost the same.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+FILTER_COLUMNS = ['mem_status', 'level', 'caste_category', 'religion', 'caste', 'reason']
+FLOW_COLUMNS = ['origin', 'destination', 'origin_state', 'destination_state']
+METADATA_KEY = b'migration_cube'
+
+# Filter columns present in each layer of the cube
+LAYERS = {
+    'overall': [],
+    'caste_category': ['caste_category'],
+    'religion': ['religion'],
+    'caste': ['caste'],
+    'caste_category_caste': ['caste_category', 'caste'],
+}
+
+
+def read_metadata(path):
+    """Build information stored with the cube (source rows and files)"""
+    meta = pq.read_schema(path).metadata or {}
+    return json.loads(meta.get(METADATA_KEY, b'{}'))
+
+
+class AggregateCube:
+    def __init__(self, path):
+        df = pd.read_parquet(path)
+        self.metadata = read_metadata(path)
+
+        # Codes are shifted by one so that null ("all values") is 0
+        self._codes = {}
+        sizes = []
+        for col in FILTER_COLUMNS:
+            df[col] = df[col].astype('category')
+            self._codes[col] = {value: code + 1 for code, value in enumerate(df[col].cat.categories)}
+            sizes.append(len(df[col].cat.categories) + 1)
+        self._sizes = tuple(sizes)
+
+        keys = np.ravel_multi_index([df[col].cat.codes.to_numpy().astype(np.int64) + 1
+                                     for col in FILTER_COLUMNS], self._sizes)
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self.weighted = 'weighted' in df.columns
+        values = ['count', 'weighted'] if self.weighted else ['count']
+        self.flows = df[FLOW_COLUMNS + values].iloc[order].reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.flows)
+
+    def values(self, col):
+        """Values of a filter column present in the cube"""
+        return list(self._codes[col])
+
+    def _code(self, col, value):
+        if value is None:
+            return 0
+        return self._codes[col].get(value, -1)
+
+    def lookup(self, migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+               migration_reason, weighted=False):
+        """OD counts shaped like update_map's groupby output, or None if the cube can't answer
+
+        With weighted, the counts are the survey-weighted population estimates.
+        """
+        category = breakdown_value if breakdown_type == 'caste_category' and breakdown_value else None
+        religion = breakdown_value if breakdown_type == 'religion' and breakdown_value else None
+        if (religion is not None and caste_filter) or (weighted and not self.weighted):
+            return None
+
+        codes = [self._code('mem_status', migration_status), self._code('level', level_type),
+                 self._code('caste_category', category), self._code('religion', religion),
+                 self._code('caste', caste_filter or None), self._code('reason', migration_reason or None)]
+        if min(codes) < 0:
+            # A value never seen in the data matches no rows
+            start = stop = 0
+        else:
+            key = np.ravel_multi_index(codes, self._sizes)
+            start, stop = np.searchsorted(self._keys, [key, key + 1])
+
+        flows = ['origin', 'destination'] if level_type == 'state' else FLOW_COLUMNS
+        agg_df = self.flows.iloc[start:stop]
+        if weighted:
+            agg_df = agg_df[flows + ['weighted']].rename(columns={'weighted': 'count'})
+        else:
+            agg_df = agg_df[flows + ['count']]
+        return agg_df.reset_index(drop=True)
@@ -0,0 +1,559 @@
+"""
+Query engines for the filter -> aggregate step
+
+Every map, option list, analytics answer and export starts by filtering the
+migration records and counting unique migrants per origin-destination pair.
+The engines below implement that step behind one interface, and
+MIGRATION_ENGINE picks one at startup:
+
+- pandas (default): eager pandas over the records prepared in memory
+- duckdb: embedded DuckDB querying the Parquet files directly, with
+  multi-threaded columnar execution. The records are never loaded into the
+  Python process, and with MIGRATION_DUCKDB_MEMORY set large scans spill to
+  disk, so several CPHS years fit on a small instance. Each process opens
+  its own connection on first use, so gunicorn workers never share one.
+  Requires `pip install duckdb`.
+
+Engines return the same rows, sorted by place, so results do not depend on
+the backend (b/compare_engines.py checks this). Each engine provides:
+
+    rows                          prepared migration records
+    source_rows                   rows in the source file(s), for the cube check
+    surveyed_members()            {'state': Series, 'district': Series} of
+                                  unique members (all statuses) per home place
+    distinct(column, **equals)    sorted option values among matching records
+    migrant_counts(columns)       unique migrants per combination of column values
+    records(filters..., places)   matching records with origin/destination columns
+    record_batches(filters...)    the same records batch_rows at a time, for
+                                  streaming exports; with unique_pairs (a
+                                  level_type), one record per migrant and OD pair
+    panel_records()               every migration record's member, month, status,
+                                  places and filter columns, for panel.PanelIndex
+    member_records(hh_id, mem_id) one member's migration records, for trajectories
+    aggregate(filters..., places) unique migrants per OD pair
+
+records and aggregate take an optional month ('Mon YYYY' month_slot), for
+the monthly map when the precomputed frames don't hold the filters.
+
+places restricts records to those starting or ending at the given place
+keys ('state' or 'district|state', per level_type).
+
+CPHS is a weighted household survey. When the records carry a member weight
+(the MIGRATION_WEIGHT column, kept through the district mapping merge as
+'weight'), engine.weighted is True and surveyed_members(weighted=True) and
+aggregate(..., weighted=True) return population estimates instead of sample
+counts: each migrant counts once per OD pair, at the mean weight of its
+records there (weighted_migrants).
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from jobs import checkpoint
+from profiling import count, span
+
+DUCKDB_THREADS = os.environ.get('MIGRATION_DUCKDB_THREADS')
+DUCKDB_MEMORY = os.environ.get('MIGRATION_DUCKDB_MEMORY')
+# Survey weight of each member record, used for population estimates when present
+WEIGHT_COLUMN = os.environ.get('MIGRATION_WEIGHT', 'mem_weight')
+
+STATUSES = ['Emigrated', 'Immigrated']
+STRING_COLUMNS = ['caste_category', 'caste', 'religion', 'emigration_immigration_reason']
+
+
+def survey_weights(df):
+    """WEIGHT_COLUMN of df as float64 (0 where missing), or None if df has no weights"""
+    if WEIGHT_COLUMN not in df.columns:
+        return None
+    return pd.to_numeric(df[WEIGHT_COLUMN], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+def weighted_migrants(group_ids, member_ids, weights, n_groups):
+    """Survey-weighted unique migrants per group, as float64
+
+    group_ids and member_ids are non-negative integer codes per record. A
+    member counts once per group, at the mean weight of its records in it,
+    like count(DISTINCT unique_id) with weights: pairs are deduplicated with
+    np.unique and summed per group with np.bincount.
+    """
+    n_members = int(member_ids.max()) + 1 if len(member_ids) else 1
+    pairs, pair_of_row = np.unique(group_ids.astype(np.int64) * n_members + member_ids, return_inverse=True)
+    pair_weights = np.bincount(pair_of_row, weights=weights) / np.bincount(pair_of_row)
+    return np.bincount(pairs // n_members, weights=pair_weights, minlength=n_groups)
+
+
+def read_records(paths, mapping_path):
+    """(records of the migration file(s) merged with the district mapping, source row count)"""
+    df = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+    source_rows = len(df)
+    mapping = pd.read_parquet(mapping_path)
+    df = df.merge(mapping[['state_code', 'district', 'matched_district']],
+                  on=['state_code', 'district'], how='left')
+    return df, source_rows
+
+
+def migrant_records(df):
+    """Migration records only, with a unique ID, string filter columns and, if weighted, a 'weight' column
+
+    This is what PandasEngine queries; b/precompute_cube.py and
+    b/precompute_frames.py build from the same records.
+    """
+    weights = survey_weights(df)
+    migrants = df['mem_status'].isin(STATUSES).to_numpy()
+    df = df[migrants].copy()
+    if weights is not None:
+        # Weights come through the merge unchanged (the mapping only adds matched_district)
+        df['weight'] = weights[migrants]
+    df['unique_id'] = df['hh_id'].astype(str) + '_' + df['mem_id'].astype(str)
+    for col in STRING_COLUMNS:
+        df[col] = df[col].astype(str)
+    return df
+
+
+def _pair_columns(level_type):
+    """Record columns that fix a migrant's OD pair at a level, whatever the status"""
+    columns = ['state', 'emigrated_immigrated_state']
+    if level_type == 'district':
+        columns += ['matched_district', 'emigrated_immigrated_district']
+    return columns
+
+
+def _flow_columns(level_type):
+    if level_type == 'state':
+        return ['origin', 'destination']
+    return ['origin', 'destination', 'origin_state', 'destination_state']
+
+
+class PandasEngine:
+    """Filters and aggregates the records prepared in memory at startup"""
+
+    name = 'pandas'
+
+    def __init__(self, paths, mapping_path, place_keys):
+        from spatial import PlaceRows
+
+        # Migration data merged with the district mapping
+        df, self.source_rows = read_records(paths, mapping_path)
+
+        # Surveyed members per home place (all statuses), the denominator of per-capita rates
+        members = df.drop_duplicates(['hh_id', 'mem_id', 'state', 'matched_district'])
+        self._surveyed = {
+            'state': members.groupby(members['state'].astype(str)).size(),
+            'district': members.groupby(members['matched_district'].astype(str) + '|' +
+                                        members['state'].astype(str)).size(),
+        }
+        del members
+
+        # Survey-weighted population per home place, when the records carry weights
+        weights = survey_weights(df)
+        self.weighted = weights is not None
+        if self.weighted:
+            member_ids = pd.factorize(df['hh_id'].astype(str) + '_' + df['mem_id'].astype(str))[0]
+            self._population = {}
+            for level, places in [('state', df['state'].astype(str)),
+                                  ('district', df['matched_district'].astype(str) + '|' + df['state'].astype(str))]:
+                place_ids, place_names = pd.factorize(places)
+                self._population[level] = pd.Series(
+                    weighted_migrants(place_ids, member_ids, weights, len(place_names)), index=place_names)
+            del member_ids
+
+        # Filter to migration records only, with a unique ID and string filter columns
+        df = self.df = migrant_records(df)
+        self._lock = threading.Lock()
+
+        # Records starting or ending at each place, for place-restricted queries
+        self.place_rows = {
+            'state': PlaceRows(place_keys['state'], df['state'].astype(str),
+                               df['emigrated_immigrated_state'].astype(str)),
+            'district': PlaceRows(place_keys['district'],
+                                  df['matched_district'].astype(str) + '|' + df['state'].astype(str),
+                                  df['emigrated_immigrated_district'].astype(str) + '|' +
+                                  df['emigrated_immigrated_state'].astype(str)),
+        }
+
+    @property
+    def rows(self):
+        return len(self.df)
+
+    def hash_unique_ids(self):
+        """Replace the hh_id_mem_id strings with 64-bit hashes (counts become approximate)
+
+        Requests may be reading self.df meanwhile, so the hashed column goes into
+        a shallow copy that then replaces self.df; readers keep the old frame.
+        """
+        with self._lock:
+            df = self.df.copy(deep=False)
+            df['unique_id'] = pd.util.hash_array(df['unique_id'].to_numpy(dtype=object))
+            self.df = df
+
+    def surveyed_members(self, weighted=False):
+        if weighted:
+            _require_weights(self)
+            return self._population
+        return self._surveyed
+
+    def distinct(self, column, **equals):
+        df = self.df
+        for col, value in equals.items():
+            df = df[df[col] == value]
+        return sorted([x for x in df[column].unique() if x and x != 'nan'])
+
+    def _source(self, places, level_type):
+        if places is None:
+            return self.df
+        index = self.place_rows[level_type]
+        ids = index.places.get_indexer(list(places))
+        return self.df.iloc[index.rows(ids[ids >= 0])]
+
+    def panel_records(self):
+        return self.df
+
+    def member_records(self, hh_id, mem_id):
+        df = self.df
+        return df[(df['hh_id'].to_numpy() == hh_id) & (df['mem_id'].to_numpy() == mem_id)]
+
+    def migrant_counts(self, columns):
+        counts = self.df.groupby(columns, observed=True)['unique_id'].nunique().rename('migrants').reset_index()
+        return counts.sort_values(columns, ignore_index=True)
+
+    def records(self, migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                places=None, level_type='state', source=None, month=None):
+        if source is None:
+            source = self._source(places, level_type)
+        matching = source['mem_status'] == migration_status
+        if month is not None:
+            matching &= source['month_slot'].astype(str) == month
+        df = source[matching].copy()
+
+        # Define origin and destination FIRST
+        if migration_status == 'Emigrated':
+            df['origin'] = df['state']
+            df['destination'] = df['emigrated_immigrated_state']
+            df['origin_district'] = df['matched_district']
+            df['destination_district'] = df['emigrated_immigrated_district']
+        else:
+            df['origin'] = df['emigrated_immigrated_state']
+            df['destination'] = df['state']
+            df['origin_district'] = df['emigrated_immigrated_district']
+            df['destination_district'] = df['matched_district']
+
+        # Apply breakdown filter AFTER defining origin/destination
+        if breakdown_type != 'overall' and breakdown_value:
+            if breakdown_type == 'caste_category':
+                df = df[df['caste_category'] == breakdown_value]
+            elif breakdown_type == 'religion':
+                df = df[df['religion'] == breakdown_value]
+
+        # Apply caste filter if selected
+        if caste_filter:
+            df = df[df['caste'] == caste_filter]
+
+        # Apply migration reason filter (independent of breakdown)
+        if migration_reason:
+            df = df[df['emigration_immigration_reason'] == migration_reason]
+        return df
+
+    def record_batches(self, migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                       batch_rows=65536, unique_pairs=None):
+        # Only the positions of the matching rows are held; each batch is copied out on its own
+        df = self.df
+        mask = df['mem_status'] == migration_status
+        if breakdown_type in ('caste_category', 'religion') and breakdown_value:
+            mask &= df[breakdown_type] == breakdown_value
+        if caste_filter:
+            mask &= df['caste'] == caste_filter
+        if migration_reason:
+            mask &= df['emigration_immigration_reason'] == migration_reason
+        rows = np.flatnonzero(mask.to_numpy())
+        del mask
+        if unique_pairs is not None:
+            # The first record of each migrant and OD pair, compared on the exact values
+            keys = df.iloc[rows][['unique_id'] + _pair_columns(unique_pairs)]
+            rows = rows[~keys.duplicated().to_numpy()]
+            del keys
+        for start in range(0, max(1, len(rows)), batch_rows):
+            yield self.records(migration_status, 'overall', None, None, None,
+                               source=df.iloc[rows[start:start + batch_rows]])
+
+    def aggregate(self, migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                  migration_reason, places=None, callback='update_map', weighted=False, month=None):
+        if weighted:
+            _require_weights(self)
+        with span(callback, 'filter'):
+            source = self._source(places, level_type)
+            df = self.records(migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                              source=source, month=month)
+
+        checkpoint()
+
+        # Aggregate unique individuals
+        with span(callback, 'aggregate'):
+            if level_type == 'state':
+                keys = ['origin', 'destination']
+            else:
+                # For district level, need to track both district and state
+                keys = ['origin_district', 'destination_district', 'origin', 'destination']
+            if weighted:
+                # Group ids from the groupby (-1 where a key is missing), summed with np.bincount
+                groups = df.groupby(keys, observed=True, sort=False)
+                group_ids = groups.ngroup().to_numpy()
+                kept = group_ids >= 0
+                totals = weighted_migrants(group_ids[kept], pd.factorize(df['unique_id'])[0][kept],
+                                           df['weight'].to_numpy()[kept], groups.ngroups)
+                agg_df = groups.size().index.to_frame(index=False)
+                agg_df['count'] = np.rint(totals).astype(np.int64)
+            else:
+                agg_df = df.groupby(keys, observed=True)['unique_id'].nunique().reset_index()
+            agg_df.columns = _flow_columns(level_type) + ['count']
+            agg_df = agg_df.sort_values(_flow_columns(level_type), key=lambda col: col.astype(str),
+                                        kind='stable', ignore_index=True)
+
+        count(callback, 'rows_scanned', len(source))
+        count(callback, 'rows_matched', len(df))
+        return agg_df
+
+
+class DuckDBEngine:
+    """Runs the same queries in an embedded DuckDB over the Parquet files"""
+
+    name = 'duckdb'
+
+    def __init__(self, paths, mapping_path, place_keys=None):
+        self._paths, self._mapping_path = paths, mapping_path
+        self._lock = threading.Lock()
+        self._db, self._pid = None, None
+        self._weight = f'coalesce(TRY_CAST(m.{_identifier(WEIGHT_COLUMN)} AS DOUBLE), 0)'
+        columns = [name for (name, *_) in self._query('DESCRIBE source').fetchall()]
+        self.weighted = WEIGHT_COLUMN in columns
+        self.source_rows = self._query('SELECT count(*) FROM source').fetchone()[0]
+        self.rows = self._query('SELECT count(*) FROM migration').fetchone()[0]
+
+    def _connect(self):
+        import duckdb
+
+        config = {}
+        if DUCKDB_THREADS:
+            config['threads'] = int(DUCKDB_THREADS)
+        if DUCKDB_MEMORY:
+            config['memory_limit'] = DUCKDB_MEMORY
+        db = duckdb.connect(config=config)
+
+        files = ', '.join(_literal(p) for p in self._paths)
+        strings = ', '.join(f"coalesce(CAST(m.{col} AS VARCHAR), 'nan') AS {col}" for col in STRING_COLUMNS)
+        db.execute(f"""
+            CREATE VIEW source AS
+            SELECT m.* EXCLUDE (district), CAST(m.district AS VARCHAR) AS district
+            FROM read_parquet([{files}]) m
+        """)
+        db.execute(f"""
+            CREATE VIEW merged AS
+            SELECT s.*, CAST(d.matched_district AS VARCHAR) AS matched_district
+            FROM source s
+            LEFT JOIN (SELECT state_code, CAST(district AS VARCHAR) AS district, matched_district
+                       FROM read_parquet({_literal(self._mapping_path)})) d
+            USING (state_code, district)
+        """)
+        columns = [name for (name, *_) in db.execute('DESCRIBE source').fetchall()]
+        weight = f', {self._weight} AS weight' if WEIGHT_COLUMN in columns else ''
+        db.execute(f"""
+            CREATE VIEW migration AS
+            SELECT m.hh_id, m.mem_id, CAST(m.mem_status AS VARCHAR) AS mem_status, m.state_code,
+                   CAST(m.state AS VARCHAR) AS state, m.district, m.matched_district,
+                   CAST(m.emigrated_immigrated_state AS VARCHAR) AS emigrated_immigrated_state,
+                   CAST(m.emigrated_immigrated_district AS VARCHAR) AS emigrated_immigrated_district,
+                   {strings}, CAST(m.month_slot AS VARCHAR) AS month_slot,
+                   CAST(m.hh_id AS VARCHAR) || '_' || CAST(m.mem_id AS VARCHAR) AS unique_id{weight}
+            FROM merged m
+            WHERE CAST(m.mem_status AS VARCHAR) IN ('Emigrated', 'Immigrated')
+        """)
+        return db
+
+    def _connection(self):
+        # Opened on first use in each process: a connection inherited across fork must not be used
+        with self._lock:
+            if self._db is None or self._pid != os.getpid():
+                self._db, self._pid = self._connect(), os.getpid()
+            return self._db
+
+    def close(self):
+        """Close this process's connection; the next query opens a new one"""
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db, self._pid = None, None
+
+    def _query(self, sql, params=None):
+        # A cursor per query: one DuckDB connection must not be shared across threads
+        return self._connection().cursor().execute(sql, params or [])
+
+    def surveyed_members(self, weighted=False):
+        if weighted:
+            _require_weights(self)
+            # Each member once per place, at the mean weight of its records there
+            places = {'state': ("CAST(m.state AS VARCHAR)", 'm.state IS NOT NULL'),
+                      'district': ("m.matched_district || '|' || CAST(m.state AS VARCHAR)",
+                                   'm.state IS NOT NULL AND m.matched_district IS NOT NULL')}
+            population = {}
+            for level, (place, where) in places.items():
+                df = self._query(f"""
+                    SELECT place, sum(w) AS n FROM (
+                        SELECT {place} AS place, m.hh_id, m.mem_id, avg({self._weight}) AS w
+                        FROM merged m WHERE {where} GROUP BY ALL
+                    ) GROUP BY ALL
+                """).df()
+                population[level] = df.set_index('place')['n']
+            return population
+        state = self._query("""
+            SELECT CAST(state AS VARCHAR) AS place, count(DISTINCT (hh_id, mem_id, matched_district)) AS n
+            FROM merged WHERE state IS NOT NULL GROUP BY ALL
+        """).df()
+        district = self._query("""
+            SELECT matched_district || '|' || CAST(state AS VARCHAR) AS place, count(DISTINCT (hh_id, mem_id)) AS n
+            FROM merged WHERE state IS NOT NULL AND matched_district IS NOT NULL GROUP BY ALL
+        """).df()
+        return {'state': state.set_index('place')['n'], 'district': district.set_index('place')['n']}
+
+    def distinct(self, column, **equals):
+        where, params = _where(equals)
+        values = self._query(f"SELECT DISTINCT {column} FROM migration WHERE {where}", params).fetchall()
+        return sorted(v for (v,) in values if v and v != 'nan')
+
+    def migrant_counts(self, columns):
+        names = ', '.join(columns)
+        return self._query(f"""
+            SELECT {names}, count(DISTINCT unique_id) AS migrants
+            FROM migration GROUP BY ALL ORDER BY {names}
+        """).df()
+
+    def panel_records(self):
+        return self._query("""
+            SELECT hh_id, mem_id, month_slot, mem_status, emigrated_immigrated_state, emigrated_immigrated_district,
+                   caste_category, religion, caste, emigration_immigration_reason
+            FROM migration
+        """).df()
+
+    def member_records(self, hh_id, mem_id):
+        return self._query('SELECT * FROM migration WHERE hh_id = ? AND mem_id = ?', [hh_id, mem_id]).df()
+
+    def _filtered(self, migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                  places, level_type, month=None):
+        """SELECT of the matching records with origin/destination columns, and its parameters"""
+        emigrated = migration_status == 'Emigrated'
+        home, away = ('state', 'emigrated_immigrated_state'), ('matched_district', 'emigrated_immigrated_district')
+        equals = {'mem_status': migration_status}
+        if breakdown_type in ('caste_category', 'religion') and breakdown_value:
+            equals[breakdown_type] = breakdown_value
+        if caste_filter:
+            equals['caste'] = caste_filter
+        if migration_reason:
+            equals['emigration_immigration_reason'] = migration_reason
+        if month is not None:
+            equals['month_slot'] = month
+        where, params = _where(equals)
+
+        if places is not None:
+            if level_type == 'state':
+                home_key, away_key = 'state', 'emigrated_immigrated_state'
+            else:
+                home_key = "matched_district || '|' || state"
+                away_key = "emigrated_immigrated_district || '|' || emigrated_immigrated_state"
+            where += f' AND (list_contains(?, {home_key}) OR list_contains(?, {away_key}))'
+            params += [list(places), list(places)]
+
+        states = home if emigrated else home[::-1]
+        districts = away if emigrated else away[::-1]
+        sql = f"""
+            SELECT *, {states[0]} AS origin, {states[1]} AS destination,
+                   {districts[0]} AS origin_district, {districts[1]} AS destination_district
+            FROM migration WHERE {where}
+        """
+        return sql, params
+
+    def records(self, migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                places=None, level_type='state', month=None):
+        sql, params = self._filtered(migration_status, breakdown_type, breakdown_value, caste_filter,
+                                     migration_reason, places, level_type, month)
+        return self._query(sql, params).df()
+
+    def record_batches(self, migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                       batch_rows=65536, unique_pairs=None):
+        sql, params = self._filtered(migration_status, breakdown_type, breakdown_value, caste_filter,
+                                     migration_reason, None, 'state')
+        if unique_pairs is not None:
+            # One record of each migrant and OD pair
+            keys = ', '.join(['unique_id'] + _pair_columns(unique_pairs))
+            sql = f'SELECT * FROM ({sql}) QUALIFY row_number() OVER (PARTITION BY {keys}) = 1'
+        # Keep the cursor referenced while its reader is consumed
+        cursor = self._query(sql, params)
+        reader = cursor.fetch_record_batch(batch_rows)
+        empty = True
+        for batch in reader:
+            empty = False
+            yield batch.to_pandas()
+        if empty:
+            yield reader.schema.empty_table().to_pandas()
+
+    def aggregate(self, migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                  migration_reason, places=None, callback='update_map', weighted=False, month=None):
+        if weighted:
+            _require_weights(self)
+        sql, params = self._filtered(migration_status, breakdown_type, breakdown_value, caste_filter,
+                                     migration_reason, places, level_type, month)
+        if level_type == 'state':
+            keys = ['origin', 'destination']
+        else:
+            keys = ['origin_district', 'destination_district', 'origin', 'destination']
+        # Rows with a missing key are dropped, as pandas groupby does
+        not_null = ' AND '.join(f'{key} IS NOT NULL' for key in keys)
+        with span(callback, 'aggregate'):
+            if weighted:
+                agg_df = self._query(f"""
+                    SELECT {', '.join(keys)}, CAST(round(sum(w)) AS BIGINT) AS count FROM (
+                        SELECT {', '.join(keys)}, unique_id, avg(weight) AS w
+                        FROM ({sql}) WHERE {not_null}
+                        GROUP BY ALL
+                    ) GROUP BY ALL
+                """, params).df()
+            else:
+                agg_df = self._query(f"""
+                    SELECT {', '.join(keys)}, count(DISTINCT unique_id) AS count
+                    FROM ({sql}) WHERE {not_null}
+                    GROUP BY ALL
+                """, params).df()
+            agg_df.columns = _flow_columns(level_type) + ['count']
+            agg_df = agg_df.sort_values(_flow_columns(level_type), kind='stable', ignore_index=True)
+
+        count(callback, 'rows_scanned', self.rows)
+        return agg_df
+
+
+def _require_weights(engine):
+    if not engine.weighted:
+        raise ValueError(f'the migration data has no {WEIGHT_COLUMN} survey weights')
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _where(equals):
+    if not equals:
+        return 'TRUE', []
+    return ' AND '.join(f'{col} = ?' for col in equals), list(equals.values())
+
+
+ENGINES = {'pandas': PandasEngine, 'duckdb': DuckDBEngine}
+
+
+def create_engine(name, paths, mapping_path, place_keys):
+    """Instantiate the engine called name ('pandas' or 'duckdb')"""
+    if name not in ENGINES:
+        raise ValueError(f"MIGRATION_ENGINE must be one of {', '.join(ENGINES)}, not {name!r}")
+    return ENGINES[name](paths, mapping_path, place_keys)
@@ -0,0 +1,166 @@
+"""
+Streaming exports of the table behind the map
+
+The dashboard's download links point at:
+    /export/flows.csv, /export/flows.parquet      OD counts for the filters
+    /export/records.csv, /export/records.parquet  the matching migrants, one
+                                                  row per migrant and OD pair
+with the dashboard filters as query parameters (see analytics.parse_filters).
+
+Responses are generated batch by batch: migrant rows are read from the
+engine EXPORT_BATCH_ROWS at a time (engine.record_batches, which drops
+repeat records of a migrant and OD pair on the engine side), and each
+batch is written as CSV text or as a Parquet row group before the next is
+read, so neither the filtered table nor the file is held in memory. At most
+MIGRATION_EXPORT_SLOTS (default 2) exports run at once per worker; further
+requests get a 429. A slot is returned when the response is closed, whether
+or not its body was read (e.g. HEAD requests).
+"""
+
+import io
+import os
+import threading
+from urllib.parse import urlencode
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analytics import parse_filters
+
+EXPORT_SLOTS = int(os.environ.get('MIGRATION_EXPORT_SLOTS', 2))
+CSV_CHUNK_ROWS = 50000
+EXPORT_BATCH_ROWS = 65536
+
+FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+RECORD_COLUMNS = {
+    'hh_id': 'hh_id',
+    'mem_id': 'mem_id',
+    'month_slot': 'month_slot',
+    'origin': 'origin_state',
+    'origin_district': 'origin_district',
+    'destination': 'destination_state',
+    'destination_district': 'destination_district',
+    'caste_category': 'caste_category',
+    'religion': 'religion',
+    'caste': 'caste',
+    'emigration_immigration_reason': 'reason',
+    # Only when the data carries survey weights
+    'weight': 'weight',
+}
+
+_slots = threading.BoundedSemaphore(EXPORT_SLOTS)
+
+
+def export_url(kind, fmt, filters):
+    """Download link for the current dashboard filters"""
+    params = {name: value for name, value in filters.items() if value not in (None, '')}
+    return f'/export/{kind}.{fmt}?{urlencode(params)}'
+
+
+def migrant_rows(batches):
+    """Batches of migrant records with the export's column names"""
+    for records in batches:
+        columns = [col for col in RECORD_COLUMNS if col in records.columns]
+        yield records[columns].rename(columns=RECORD_COLUMNS).reset_index(drop=True)
+
+
+def csv_chunks(batches, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield DataFrame batches as one CSV text, chunk_rows rows at a time"""
+    header = True
+    for df in batches:
+        if header:
+            yield df.iloc[:0].to_csv(index=False)
+            header = False
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False)
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain()"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_chunks(batches):
+    """Yield DataFrame batches as one Parquet file, a row group per batch
+
+    The schema is the first batch's, with all-null columns typed as strings so
+    that later batches with values still fit it.
+    """
+    sink = _StreamSink()
+    writer = schema = None
+    try:
+        for df in batches:
+            if writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                    for field in table.schema])
+                writer = pq.ParquetWriter(sink, schema, compression='snappy')
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+def register(app, analytics, record_batches):
+    """Serve /export/<flows|records>.<csv|parquet>
+
+    analytics provides od_matrix(**filters); record_batches(**filters, batch_rows,
+    unique_pairs) yields the matching records like engine.record_batches
+    (without level_type), one per migrant and OD pair at unique_pairs. weighted=1 exports flows as survey-weighted population
+    estimates.
+    """
+    from flask import Response, abort, request
+
+    @app.server.route('/export/<kind>.<fmt>')
+    def export(kind, fmt):
+        if kind not in ('flows', 'records') or fmt not in FORMATS:
+            abort(404)
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as error:
+            return Response(f'{error}\n', status=400, mimetype='text/plain')
+        if not _slots.acquire(blocking=False):
+            return Response('Too many exports running, try again shortly\n', status=429, mimetype='text/plain')
+
+        try:
+            if kind == 'flows':
+                # OD pairs are few; the aggregate is one batch
+                batches = [analytics.od_matrix(weighted=request.args.get('weighted') == '1', **filters)]
+            else:
+                batches = migrant_rows(record_batches(**{k: v for k, v in filters.items() if k != 'level_type'},
+                                                      batch_rows=EXPORT_BATCH_ROWS,
+                                                      unique_pairs=filters['level_type']))
+            filename = f"migration_{kind}_{filters['migration_status'].lower()}_{filters['level_type']}.{fmt}"
+            response = Response(csv_chunks(batches) if fmt == 'csv' else parquet_chunks(batches),
+                                mimetype=FORMATS[fmt],
+                                headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+        except ValueError as error:
+            _slots.release()
+            return Response(f'{error}\n', status=400, mimetype='text/plain')
+        except BaseException:
+            _slots.release()
+            raise
+        # Called by the server once the response is done with, even if the body was never read
+        response.call_on_close(_slots.release)
+        return response
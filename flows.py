@@ -0,0 +1,143 @@
+"""
+Flow selection for the migration map
+
+update_map aggregates every origin-destination pair, but drawing all of them
+at district level produces thousands of near-invisible single-migrant lines.
+select_flows keeps the largest flows exactly, either a fixed number (top-K)
+or the fewest flows covering a share of all migrants, using a partial sort
+(np.argpartition) so only the kept flows are ever fully ordered.
+
+bundle_flows bounds the drawing differently: half the budget goes to the
+largest flows, and every other flow is merged into a representative flow
+for its group (e.g. origin state -> destination state), so the drawn flows
+still account for (nearly) all migrants.
+"""
+
+import numpy as np
+
+DEFAULT_FLOW_LIMIT = 'top:500'
+
+FLOW_LIMIT_OPTIONS = [
+    {'label': 'Top 50 flows', 'value': 'top:50'},
+    {'label': 'Top 100 flows', 'value': 'top:100'},
+    {'label': 'Top 250 flows', 'value': 'top:250'},
+    {'label': 'Top 500 flows', 'value': 'top:500'},
+    {'label': 'Top 1,000 flows', 'value': 'top:1000'},
+    {'label': 'Flows covering 50% of migrants', 'value': 'share:0.5'},
+    {'label': 'Flows covering 80% of migrants', 'value': 'share:0.8'},
+    {'label': 'Flows covering 95% of migrants', 'value': 'share:0.95'},
+    {'label': '500 flows, the rest bundled by state pair', 'value': 'bundle:500'},
+    {'label': 'All flows', 'value': 'all'},
+]
+
+# Flows drawn by the quick first answer while a larger selection is computed
+PREVIEW_FLOW_LIMIT = 'top:50'
+
+
+def parse_flow_limit(value):
+    """Turn a flow-limit option value into (top_k, share); (None, None) keeps everything"""
+    kind, _, amount = (value or 'all').partition(':')
+    if kind in ('top', 'bundle'):
+        return int(amount), None
+    if kind == 'share':
+        return None, float(amount)
+    return None, None
+
+
+def exceeds_preview(value):
+    """Whether a flow-limit option value draws more flows than the preview"""
+    top_k, _ = parse_flow_limit(value)
+    return top_k is None or top_k > parse_flow_limit(PREVIEW_FLOW_LIMIT)[0]
+
+
+def bundles_flows(value):
+    """Whether a flow-limit option value asks for bundling"""
+    return (value or '').startswith('bundle:')
+
+
+def top_k_indices(counts, k):
+    """Indices of the k largest counts, largest first"""
+    if k >= len(counts):
+        return np.argsort(-counts, kind='stable')
+    part = np.argpartition(-counts, k - 1)[:k]
+    return part[np.argsort(-counts[part], kind='stable')]
+
+
+def select_flows(counts, top_k=None, share=None):
+    """Indices of the flows to draw, largest first
+
+    With top_k, the top_k largest flows. With share, the fewest largest flows
+    whose counts add up to at least that share of the total; the partial sort
+    is widened geometrically until it covers the share.
+    """
+    counts = np.asarray(counts)
+    n = len(counts)
+    if n == 0:
+        return np.arange(0)
+    if top_k is not None:
+        return top_k_indices(counts, max(0, top_k)) if top_k > 0 else np.arange(0)
+    if share is None:
+        return top_k_indices(counts, n)
+
+    target = share * counts.sum()
+    k = min(n, 64)
+    while True:
+        idx = top_k_indices(counts, k)
+        cumulative = np.cumsum(counts[idx])
+        if cumulative[-1] >= target or k == n:
+            return idx[:int(np.searchsorted(cumulative, target)) + 1]
+        k = min(n, k * 4)
+
+
+def tail_summary(counts, kept):
+    """Totals for the flows that were not selected"""
+    counts = np.asarray(counts)
+    total = int(counts.sum())
+    kept_total = int(counts[kept].sum())
+    return {
+        'flows': len(counts) - len(kept),
+        'migrants': total - kept_total,
+        'share': (total - kept_total) / total if total else 0.0,
+    }
+
+
+def bundle_flows(counts, groups, origin_xy, dest_xy, max_flows):
+    """Keep the largest flows and merge the rest into one flow per group
+
+    counts, groups (integer codes) and the (n, 2) endpoint arrays describe the
+    flows. Returns (kept, bundles, covered): kept are the flows drawn as they
+    are, largest first; bundles holds 'group', 'count', 'members', 'origin' and
+    'destination' arrays for the merged flows, largest first, whose endpoints
+    are the count-weighted means of their members' endpoints; covered are the
+    indices of every flow represented by kept or bundles. At most max_flows
+    flows are drawn in total.
+    """
+    counts = np.asarray(counts)
+    n = len(counts)
+    empty = {'group': np.zeros(0, dtype=np.int64), 'count': np.zeros(0, dtype=np.int64), 'members': np.zeros(0, dtype=np.int64),
+             'origin': np.zeros((0, 2)), 'destination': np.zeros((0, 2))}
+    if n <= max_flows:
+        kept = top_k_indices(counts, n)
+        return kept, empty, kept
+
+    kept = top_k_indices(counts, max_flows // 2)
+    rest = np.ones(n, dtype=bool)
+    rest[kept] = False
+    rest = np.flatnonzero(rest)
+    g, w = np.asarray(groups)[rest], counts[rest].astype(np.float64)
+    n_groups = int(g.max()) + 1
+
+    totals = np.bincount(g, weights=w, minlength=n_groups)
+    members = np.bincount(g, minlength=n_groups)
+    present = np.flatnonzero(members)
+    chosen = present[top_k_indices(totals[present], max_flows - len(kept))]
+
+    def weighted_mean(xy):
+        xy = np.asarray(xy, dtype=np.float64)[rest]
+        return np.column_stack([np.bincount(g, weights=w * xy[:, i], minlength=n_groups)[chosen]
+                                for i in range(2)]) / totals[chosen, None]
+
+    bundles = {'group': chosen, 'count': totals[chosen].astype(np.int64), 'members': members[chosen],
+               'origin': weighted_mean(origin_xy), 'destination': weighted_mean(dest_xy)}
+    covered = np.concatenate([kept, rest[np.isin(g, chosen)]])
+    return kept, bundles, covered
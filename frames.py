@@ -0,0 +1,161 @@
+"""
+Monthly OD frames for the time-scrubbed map
+
+b/precompute_frames.py stores, for every aggregate the cube holds, the
+unique migrants per OD pair in each month, delta encoded: a row per pair
+and month where the count changed (0 when the pair disappears). The file
+is sorted by filter columns and then month.
+
+MonthlyFrames keeps those rows in memory with the offsets of each filter
+combination, found by an int64 key (as in AggregateCube), and a pair id per
+OD pair. Rebuilding month t is a binary search for the combination, a
+second one for the rows up to month t, and the last row per pair among
+them, so scrubbing through the months never regroups the raw records.
+Frames built from weighted records carry each row's population estimate
+too ('weighted'), changed on the same rows as the count.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cube import FILTER_COLUMNS, FLOW_COLUMNS, LAYERS
+
+METADATA_KEY = b'migration_frames'
+
+
+def read_metadata(path):
+    """Build information stored with the frames (source rows and files, month labels)"""
+    meta = pq.read_schema(path).metadata or {}
+    return json.loads(meta.get(METADATA_KEY, b'{}'))
+
+
+def filter_layer(breakdown_type, breakdown_value, caste_filter):
+    """Name of the cube layer holding a filter combination, or None (religion with a caste)"""
+    columns = []
+    if breakdown_type in ('caste_category', 'religion') and breakdown_value:
+        columns.append(breakdown_type)
+    if caste_filter:
+        columns.append('caste')
+    return next((name for name, layer in LAYERS.items() if layer == columns), None)
+
+
+def _dictionary(column):
+    """(int32 codes shifted by one, null as 0; values) of a dictionary-encoded Arrow column"""
+    array = column.combine_chunks()
+    if not pa.types.is_dictionary(array.type):
+        array = array.dictionary_encode()
+    codes = pc.fill_null(array.indices, -1).to_numpy().astype(np.int32) + 1
+    return codes, array.dictionary.to_pylist()
+
+
+class MonthlyFrames:
+    def __init__(self, path):
+        table = pq.read_table(path)
+        self.metadata = read_metadata(path)
+        self.months = self.metadata.get('months', [])
+        # b/precompute_frames.py --layers may leave some out
+        self.layers = self.metadata.get('layers', list(LAYERS))
+
+        # Codes are shifted by one so that null ("all values") is 0; the key is
+        # built column by column, as np.ravel_multi_index would
+        self._codes = {}
+        sizes = []
+        keys = np.zeros(table.num_rows, dtype=np.int64)
+        for col in FILTER_COLUMNS:
+            codes, values = _dictionary(table.column(col))
+            self._codes[col] = {value: code + 1 for code, value in enumerate(values)}
+            sizes.append(len(values) + 1)
+            keys = keys * sizes[-1] + codes
+        self._sizes = tuple(sizes)
+
+        month = table.column('month').to_numpy().astype(np.int16)
+        order = np.lexsort((month, keys))
+        keys = keys[order]
+        # Rows of each filter combination are contiguous: keep one key and offset per combination
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]])) if len(keys) else np.zeros(0, dtype=np.int64)
+        self._keys = keys[starts]
+        self._offsets = np.append(starts, len(keys)).astype(np.int64)
+        self._month = month[order]
+        del keys, month
+
+        # One id per OD pair, from the dictionary codes (a missing state at state level is code 0)
+        flows = {}
+        pair_keys = np.zeros(table.num_rows, dtype=np.int64)
+        for col in FLOW_COLUMNS:
+            codes, values = _dictionary(table.column(col))
+            codes = codes[order]
+            pair_keys = pair_keys * (len(values) + 1) + codes
+            flows[col] = pd.Categorical.from_codes(codes - 1, values)
+        flows['count'] = table.column('count').to_numpy().astype(np.int32)[order]
+        self.weighted = 'weighted' in table.column_names
+        if self.weighted:
+            flows['weighted'] = table.column('weighted').to_numpy().astype(np.int64)[order]
+        self._pairs = pd.factorize(pair_keys)[0].astype(np.int32)
+        self.flows = pd.DataFrame(flows)
+
+        # Arrow keeps freed buffers in its pool; give the read buffers back
+        del table
+        pa.default_memory_pool().release_unused()
+
+    def __len__(self):
+        return len(self.flows)
+
+    def _code(self, col, value):
+        if value is None:
+            return 0
+        return self._codes[col].get(value, -1)
+
+    def month_index(self, month_slot):
+        """Frame number of a 'Mon YYYY' label, or -1"""
+        return self.months.index(month_slot) if month_slot in self.months else -1
+
+    def lookup(self, migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+               migration_reason, month_slot, weighted=False):
+        """OD counts in one month shaped like the cube's lookup, or None if the frames can't answer
+
+        The frames can't answer for a layer they were built without, for
+        religion with a caste, or for weighted counts if they hold none. With
+        weighted, the counts are the survey-weighted population estimates.
+        """
+        if (filter_layer(breakdown_type, breakdown_value, caste_filter) not in self.layers or
+                (weighted and not self.weighted)):
+            return None
+        category = breakdown_value if breakdown_type == 'caste_category' and breakdown_value else None
+        religion = breakdown_value if breakdown_type == 'religion' and breakdown_value else None
+
+        codes = [self._code('mem_status', migration_status), self._code('level', level_type),
+                 self._code('caste_category', category), self._code('religion', religion),
+                 self._code('caste', caste_filter or None), self._code('reason', migration_reason or None)]
+        frame = self.month_index(month_slot)
+        if min(codes) < 0 or frame < 0:
+            # A value never seen in the data matches no rows
+            rows = np.zeros(0, dtype=np.int64)
+        else:
+            key = np.ravel_multi_index(codes, self._sizes)
+            i = np.searchsorted(self._keys, key)
+            found = i < len(self._keys) and self._keys[i] == key
+            start, stop = (self._offsets[i], self._offsets[i + 1]) if found else (0, 0)
+            stop = start + np.searchsorted(self._month[start:stop], frame, side='right')
+            # The latest change of each pair up to this month is its count
+            pairs = self._pairs[start:stop][::-1]
+            _, last = np.unique(pairs, return_index=True)
+            rows = np.sort(stop - 1 - last)
+            rows = rows[self.flows['count'].to_numpy()[rows] > 0]
+
+        flows = ['origin', 'destination'] if level_type == 'state' else FLOW_COLUMNS
+        agg_df = self.flows.iloc[rows]
+        if weighted:
+            agg_df = agg_df[flows + ['weighted']].rename(columns={'weighted': 'count'})
+        else:
+            agg_df = agg_df[flows + ['count']]
+        return agg_df.reset_index(drop=True)
+
+    @property
+    def nbytes(self):
+        return (int(self.flows.memory_usage(deep=True, index=True).sum()) + self._keys.nbytes +
+                self._offsets.nbytes + self._month.nbytes + self._pairs.nbytes)
@@ -0,0 +1,135 @@
+"""
+Great-circle flow paths
+
+Flow lines are drawn as great-circle arcs sampled at ARC_POINTS points
+(MIGRATION_ARC_POINTS, default 9), with the direction arrow placed 80% of
+the way along the arc and rotated to the arc's bearing at that point. All
+of it is computed for many flows at once with NumPy (spherical linear
+interpolation between unit vectors).
+
+ArcStore caches the float32 results per (origin_id, dest_id, resolution),
+so a flow that has been drawn once costs only an index lookup afterwards.
+join_paths flattens many arcs into one NaN-separated polyline, so any
+number of flows is drawn as a single line trace.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+ARC_POINTS = int(os.environ.get('MIGRATION_ARC_POINTS', 9))
+ARROW_POSITION = 0.8
+
+
+def _unit_vectors(latlon):
+    lat, lon = np.radians(latlon[..., 0]), np.radians(latlon[..., 1])
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def great_circle(origin, dest, fractions):
+    """(lat, lon) points at the given fractions of each origin -> dest arc, shape (n, len(fractions), 2)"""
+    a = _unit_vectors(np.asarray(origin, dtype=np.float64).reshape(-1, 2))[:, None, :]
+    b = _unit_vectors(np.asarray(dest, dtype=np.float64).reshape(-1, 2))[:, None, :]
+    t = np.asarray(fractions, dtype=np.float64)[None, :, None]
+
+    omega = np.arccos(np.clip((a * b).sum(axis=-1, keepdims=True), -1.0, 1.0))
+    sin_omega = np.sin(omega)
+    # Coincident endpoints fall back to linear interpolation
+    safe = np.where(sin_omega > 1e-12, sin_omega, 1.0)
+    weight_a = np.where(sin_omega > 1e-12, np.sin((1 - t) * omega) / safe, 1 - t)
+    weight_b = np.where(sin_omega > 1e-12, np.sin(t * omega) / safe, t)
+    p = weight_a * a + weight_b * b
+
+    lat = np.degrees(np.arctan2(p[..., 2], np.hypot(p[..., 0], p[..., 1])))
+    lon = np.degrees(np.arctan2(p[..., 1], p[..., 0]))
+    return np.stack([lat, lon], axis=-1)
+
+
+def bearing(points, targets):
+    """Initial great-circle bearing from each point towards its target, degrees clockwise from north"""
+    lat1, lon1 = np.radians(np.asarray(points, dtype=np.float64)).T
+    lat2, lon2 = np.radians(np.asarray(targets, dtype=np.float64)).T
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+
+def arc_paths(origin, dest, resolution=ARC_POINTS):
+    """Arc polylines (n, resolution, 2) and arrows (n, 3) as (lat, lon, bearing), float32"""
+    origin = np.asarray(origin, dtype=np.float64).reshape(-1, 2)
+    dest = np.asarray(dest, dtype=np.float64).reshape(-1, 2)
+    paths = great_circle(origin, dest, np.linspace(0.0, 1.0, resolution))
+    arrow_points = great_circle(origin, dest, [ARROW_POSITION])[:, 0, :]
+    arrows = np.column_stack([arrow_points, bearing(arrow_points, dest)])
+    return paths.astype(np.float32), arrows.astype(np.float32)
+
+
+def join_paths(paths):
+    """(lat, lon) arrays of every (n, points, 2) path in one polyline, with NaN gaps between paths"""
+    paths = np.asarray(paths, dtype=np.float32)
+    gaps = np.full((len(paths), 1, 2), np.nan, dtype=np.float32)
+    joined = np.concatenate([paths, gaps], axis=1).reshape(-1, 2)[:-1]
+    return joined[:, 0], joined[:, 1]
+
+
+class ArcStore:
+    """Arc polylines and arrows cached per (origin_id, dest_id, resolution)
+
+    Each resolution has one float32 array of paths and one of arrows; rows for
+    pairs not seen before are computed in a single batch and appended.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._rows = {}
+            self._paths = {}
+            self._arrows = {}
+
+    def lookup(self, origin_ids, dest_ids, origin, dest, resolution=ARC_POINTS):
+        """Paths and arrows for each (origin_id, dest_id) pair with the given endpoint coordinates"""
+        pairs = list(zip(np.asarray(origin_ids).tolist(), np.asarray(dest_ids).tolist()))
+        with self._lock:
+            rows = self._rows.setdefault(resolution, {})
+            missing = {}
+            for i, pair in enumerate(pairs):
+                if pair not in rows and pair not in missing:
+                    missing[pair] = i
+            if missing:
+                new = np.fromiter(missing.values(), dtype=np.int64, count=len(missing))
+                paths, arrows = arc_paths(np.asarray(origin)[new], np.asarray(dest)[new], resolution)
+                self._append(resolution, paths, arrows)
+                start = len(rows)
+                for offset, pair in enumerate(missing):
+                    rows[pair] = start + offset
+            index = np.fromiter((rows[pair] for pair in pairs), dtype=np.int64, count=len(pairs))
+            if resolution not in self._paths:
+                return np.zeros((0, resolution, 2), np.float32), np.zeros((0, 3), np.float32)
+            return self._paths[resolution][index], self._arrows[resolution][index]
+
+    def _append(self, resolution, paths, arrows):
+        # Capacity doubles so appends stay amortised O(1) per row
+        used = len(self._rows[resolution])
+        store = self._paths.get(resolution)
+        if store is None or used + len(paths) > len(store):
+            capacity = max(64, 2 * (used + len(paths)))
+            grown_paths = np.zeros((capacity, resolution, 2), dtype=np.float32)
+            grown_arrows = np.zeros((capacity, 3), dtype=np.float32)
+            if store is not None:
+                grown_paths[:used] = store[:used]
+                grown_arrows[:used] = self._arrows[resolution][:used]
+            self._paths[resolution], self._arrows[resolution] = grown_paths, grown_arrows
+        self._paths[resolution][used:used + len(paths)] = paths
+        self._arrows[resolution][used:used + len(paths)] = arrows
+
+    def __len__(self):
+        return sum(len(rows) for rows in self._rows.values())
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self._paths.values()) + sum(a.nbytes for a in self._arrows.values())
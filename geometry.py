@@ -0,0 +1,175 @@
+"""
+Boundary polygons as flat coordinate buffers
+
+The boundary files store one WKB polygon or multipolygon per row (GeoParquet).
+Boundaries reads that column with pyarrow and unpacks it straight into
+GeoArrow-style buffers: every vertex in one (n, 2) float64 lon/lat array,
+plus offsets splitting it into rings, rings into polygons and polygons into
+features. Drawing a boundary is then a slice of the coordinate array, with
+no shapely objects or GeoJSON dicts in between. geopandas and shapely are
+only needed by the offline build scripts in b/.
+"""
+
+import struct
+
+import numpy as np
+import pyarrow.parquet as pq
+
+WKB_POLYGON = 3
+WKB_MULTIPOLYGON = 6
+
+
+def _read_polygon(wkb, pos, order, rings):
+    """Append the rings of the WKB polygon body at pos to rings; return the position after it"""
+    (n_rings,) = struct.unpack_from(order + 'I', wkb, pos)
+    pos += 4
+    for _ in range(n_rings):
+        (n_points,) = struct.unpack_from(order + 'I', wkb, pos)
+        pos += 4
+        rings.append(np.frombuffer(wkb, dtype=order + 'f8', count=2 * n_points, offset=pos))
+        pos += 16 * n_points
+    return pos, n_rings
+
+
+def _header(wkb, pos):
+    order = '<' if wkb[pos] == 1 else '>'
+    (geometry_type,) = struct.unpack_from(order + 'I', wkb, pos + 1)
+    return order, geometry_type, pos + 5
+
+
+def parse_wkb(values):
+    """Flat buffers for a sequence of 2D WKB polygons/multipolygons
+
+    Returns (coords, ring_offsets, polygon_offsets, feature_offsets); an empty
+    (None) value becomes a feature with no polygons.
+    """
+    rings, ring_counts, polygon_counts = [], [], []
+    for wkb in values:
+        n_polygons = 0
+        if wkb is not None:
+            order, geometry_type, pos = _header(wkb, 0)
+            if geometry_type == WKB_POLYGON:
+                pos, n_rings = _read_polygon(wkb, pos, order, rings)
+                ring_counts.append(n_rings)
+                n_polygons = 1
+            elif geometry_type == WKB_MULTIPOLYGON:
+                (n_polygons,) = struct.unpack_from(order + 'I', wkb, pos)
+                pos += 4
+                for _ in range(n_polygons):
+                    part_order, part_type, pos = _header(wkb, pos)
+                    if part_type != WKB_POLYGON:
+                        raise ValueError(f'Unsupported WKB geometry type {part_type} in a multipolygon')
+                    pos, n_rings = _read_polygon(wkb, pos, part_order, rings)
+                    ring_counts.append(n_rings)
+            else:
+                raise ValueError(f'Unsupported WKB geometry type {geometry_type} (expected 2D polygons)')
+        polygon_counts.append(n_polygons)
+
+    coords = (np.concatenate(rings).astype(np.float64).reshape(-1, 2) if rings
+              else np.zeros((0, 2), dtype=np.float64))
+    ring_offsets = np.concatenate([[0], np.cumsum([len(ring) // 2 for ring in rings])]).astype(np.int64)
+    polygon_offsets = np.concatenate([[0], np.cumsum(ring_counts)]).astype(np.int64)
+    feature_offsets = np.concatenate([[0], np.cumsum(polygon_counts)]).astype(np.int64)
+    return coords, ring_offsets, polygon_offsets, feature_offsets
+
+
+def _simplify_ring(ring, tolerance):
+    """Douglas-Peucker simplification of one closed ring; rings that would collapse are kept as they are"""
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        a, b = ring[start], ring[end]
+        between = ring[start + 1:end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(between[:, 0] - a[0], between[:, 1] - a[1])
+        else:
+            distance = np.abs(dx * (between[:, 1] - a[1]) - dy * (between[:, 0] - a[0])) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack += [(start, split), (split, end)]
+    return ring[keep] if keep.sum() >= 4 else ring
+
+
+class Boundaries:
+    """Polygon features in flat buffers, with their attribute columns
+
+    coords[ring_offsets[r]:ring_offsets[r + 1]] is ring r (lon, lat);
+    polygon p has rings polygon_offsets[p]:polygon_offsets[p + 1], the first
+    being its exterior; feature f has polygons
+    feature_offsets[f]:feature_offsets[f + 1].
+    """
+
+    def __init__(self, attributes, coords, ring_offsets, polygon_offsets, feature_offsets):
+        self.attributes = attributes
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.polygon_offsets = polygon_offsets
+        self.feature_offsets = feature_offsets
+
+    @classmethod
+    def read_parquet(cls, path, geometry_column='geometry'):
+        """Read a GeoParquet file with WKB polygon geometries"""
+        table = pq.read_table(path)
+        buffers = parse_wkb(table.column(geometry_column).to_pylist())
+        return cls(table.drop_columns([geometry_column]).to_pandas(), *buffers)
+
+    def __len__(self):
+        return len(self.feature_offsets) - 1
+
+    @property
+    def bounds(self):
+        """(minx, miny, maxx, maxy) of each feature; NaN for empty features"""
+        starts = self.ring_offsets[self.polygon_offsets[self.feature_offsets]]
+        result = np.full((len(self), 4), np.nan)
+        filled = np.flatnonzero(starts[1:] > starts[:-1])
+        if len(filled):
+            result[filled, :2] = np.minimum.reduceat(self.coords, starts[filled])[:len(filled)]
+            result[filled, 2:] = np.maximum.reduceat(self.coords, starts[filled])[:len(filled)]
+        return result
+
+    def _rings(self, polygon):
+        rings = range(self.polygon_offsets[polygon], self.polygon_offsets[polygon + 1])
+        return [self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]] for r in rings]
+
+    def exterior_rings(self, features=None):
+        """Exterior ring (lon, lat array view) of every polygon of the given features, in order"""
+        if features is None:
+            features = range(len(self))
+        return [self.coords[self.ring_offsets[self.polygon_offsets[p]]:self.ring_offsets[self.polygon_offsets[p] + 1]]
+                for f in features
+                for p in range(self.feature_offsets[f], self.feature_offsets[f + 1])]
+
+    def geojson(self, ids=None):
+        """GeoJSON FeatureCollection dict, with the given feature ids"""
+        features = []
+        for f in range(len(self)):
+            polygons = [[ring.tolist() for ring in self._rings(p)]
+                        for p in range(self.feature_offsets[f], self.feature_offsets[f + 1])]
+            geometry = ({'type': 'Polygon', 'coordinates': polygons[0]} if len(polygons) == 1
+                        else {'type': 'MultiPolygon', 'coordinates': polygons})
+            feature = {'type': 'Feature', 'properties': {}, 'geometry': geometry}
+            if ids is not None:
+                feature['id'] = ids[f]
+            features.append(feature)
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def simplify(self, tolerance):
+        """New Boundaries with every ring simplified to within tolerance degrees"""
+        rings = [_simplify_ring(self.coords[start:stop], tolerance)
+                 for start, stop in zip(self.ring_offsets[:-1], self.ring_offsets[1:])]
+        coords = np.concatenate(rings) if rings else self.coords
+        ring_offsets = np.concatenate([[0], np.cumsum([len(ring) for ring in rings])]).astype(np.int64)
+        return Boundaries(self.attributes, coords, ring_offsets, self.polygon_offsets, self.feature_offsets)
+
+    @property
+    def nbytes(self):
+        return (int(self.attributes.memory_usage(deep=True, index=True).sum()) + self.coords.nbytes +
+                self.ring_offsets.nbytes + self.polygon_offsets.nbytes + self.feature_offsets.nbytes)
@@ -0,0 +1,168 @@
+"""
+Debounced, coalesced and cancellable map computations
+
+A single click on the dashboard can fire update_map several times while the
+cascading dropdowns reset themselves. JobRunner runs map computations on a
+small local thread pool and makes sure only one of them does real work:
+
+- debounce: a request waits MIGRATION_DEBOUNCE_MS (default 150) before
+  starting, and gives up if the same page session sent a newer request.
+  Requests of one session in the same group (e.g. a map's preview and the
+  full map) wait once: after one has settled, the others start at once
+- coalesce: requests for a filter key that is already being computed wait
+  for that job instead of starting another one
+- cancel: when every session waiting on a job has moved on, the job is
+  flagged, and the computation stops at its next checkpoint()
+
+Superseded requests raise JobCancelled so the callback can skip its update.
+With profiling on, jobs_queued counts jobs that had to wait for a free
+worker, and the update_map 'queued' stage times how long they waited.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import count, observe
+
+DEBOUNCE_SECONDS = float(os.environ.get('MIGRATION_DEBOUNCE_MS', 150)) / 1000
+JOB_WORKERS = int(os.environ.get('MIGRATION_JOB_WORKERS', 2))
+# How long a settled group spares the session's later requests the debounce
+SETTLED_SECONDS = 10
+
+_running = threading.local()
+
+
+class JobCancelled(Exception):
+    """The computation was superseded by a newer request"""
+
+
+def checkpoint():
+    """Stop the current job if nobody is waiting for its result any more"""
+    job = getattr(_running, 'job', None)
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled()
+
+
+class _Job:
+    def __init__(self, key):
+        self.key = key
+        self.cancelled = threading.Event()
+        self.waiters = {}
+        self.superseded = set()
+        self.latest = {}
+        self.future = None
+        self.submitted = time.perf_counter()
+
+
+class JobRunner:
+    """Runs keyed computations on a local thread pool"""
+
+    def __init__(self, workers=JOB_WORKERS, debounce=DEBOUNCE_SECONDS):
+        self.workers = workers
+        self.debounce = debounce
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='map-job')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._session_job = {}
+        self._session_ticket = {}
+        # session -> (group, time) of its last request to get through the debounce, oldest first
+        self._settled = OrderedDict()
+        self._tickets = itertools.count()
+        self._waiting = 0
+        self._busy = 0
+
+    def run(self, key, session, func, *args, group=None):
+        """Return func(*args), sharing and cancelling work by key and session
+
+        Requests of a session with the same group share one debounce.
+        """
+        ticket = next(self._tickets)
+        if session is not None:
+            with self._lock:
+                self._session_ticket[session] = ticket
+                settled = self._settled.get(session)
+                settled = (group is not None and settled is not None and settled[0] == group and
+                           time.monotonic() - settled[1] < SETTLED_SECONDS)
+            if self.debounce and not settled:
+                time.sleep(self.debounce)
+                if self._session_ticket.get(session) != ticket:
+                    count('update_map', 'jobs_debounced')
+                    raise JobCancelled()
+                self._settle(session, group)
+
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is None or job.cancelled.is_set():
+                job = _Job(key)
+                self._inflight[key] = job
+                if self._waiting + self._busy >= self.workers:
+                    count('update_map', 'jobs_queued')
+                self._waiting += 1
+                job.future = self._executor.submit(self._execute, job, func, args)
+            else:
+                count('update_map', 'jobs_coalesced')
+            # Each request waits under its own ticket, so two requests of one session can share a job
+            job.waiters[ticket] = session
+            if session is not None:
+                job.latest[session] = max(ticket, job.latest.get(session, ticket))
+                previous = self._session_job.get(session)
+                self._session_job[session] = job
+                if previous is not None and previous is not job:
+                    self._abandon(previous, session)
+
+        try:
+            result = job.future.result()
+        finally:
+            with self._lock:
+                job.waiters.pop(ticket, None)
+                superseded = ticket in job.superseded
+                # The session's entries go when its last waiter on this job leaves
+                if session is not None and not superseded and session not in job.waiters.values():
+                    if self._session_job.get(session) is job:
+                        del self._session_job[session]
+                    if self._session_ticket.get(session) == job.latest.pop(session, None):
+                        del self._session_ticket[session]
+        if superseded:
+            raise JobCancelled()
+        return result
+
+    def _abandon(self, job, session):
+        """Mark a session's requests on job as superseded, and cancel the job if nobody else waits for it"""
+        for ticket in [t for t, s in job.waiters.items() if s == session]:
+            del job.waiters[ticket]
+            job.superseded.add(ticket)
+        job.latest.pop(session, None)
+        if not job.waiters and not job.future.done():
+            job.cancelled.set()
+            count('update_map', 'jobs_cancelled')
+
+    def _settle(self, session, group):
+        """Remember that a request of session in group got through the debounce"""
+        if group is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._settled.pop(session, None)
+            self._settled[session] = (group, now)
+            while now - next(iter(self._settled.values()))[1] >= SETTLED_SECONDS:
+                self._settled.popitem(last=False)
+
+    def _execute(self, job, func, args):
+        with self._lock:
+            self._waiting -= 1
+            self._busy += 1
+        observe('update_map', 'queued', time.perf_counter() - job.submitted)
+        _running.job = job
+        try:
+            checkpoint()
+            return func(*args)
+        finally:
+            _running.job = None
+            with self._lock:
+                self._busy -= 1
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
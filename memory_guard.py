@@ -0,0 +1,218 @@
+"""
+Memory accounting and budget enforcement for the dashboard
+
+Data tables, geometry and caches are registered with a MemoryGuard, which
+measures their deep size on demand (DataFrame.memory_usage(deep=True), WKB
+size of geometries, recursive getsizeof for caches). After each map update
+the guard compares process RSS with the budget (MIGRATION_MEMORY_BUDGET_MB,
+default 450 MB to leave headroom on a 512 MB instance). When over budget it
+clears the registered caches and, if their tracked bytes were less than the
+excess, applies the next registered downgrade.
+
+Freed memory often stays in the allocator, so RSS may not fall after a
+clear. The RSS measured after acting becomes a floor, and the guard acts
+again only once RSS grows HEADROOM_MB past it (or past the budget, if
+higher). Without that, every map update would empty the caches and the
+downgrades would all fire within a few requests.
+
+The current accounting is served as JSON at /debug/memory (localhost only).
+"""
+
+import gc
+import os
+import resource
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BUDGET_MB = float(os.environ.get('MIGRATION_MEMORY_BUDGET_MB', 450))
+CACHE_MB = float(os.environ.get('MIGRATION_CACHE_MB', 64))
+# Growth over the RSS left after the last intervention before the guard acts again
+HEADROOM_MB = float(os.environ.get('MIGRATION_MEMORY_HEADROOM_MB', CACHE_MB))
+
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+MB = 1024 * 1024
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by obj, following containers and counting each object once"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(deep=True, index=True).sum())
+        if hasattr(obj, 'geometry'):
+            # memory_usage only sees the pointers to shapely objects
+            import shapely
+            size += int(sum(len(b) for b in shapely.to_wkb(obj.geometry.values) if b is not None))
+        return size
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True, index=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, LRUCache):
+        return deep_size(obj._entries, seen)
+    if isinstance(getattr(type(obj), 'nbytes', None), property):
+        # Array-backed indexes and stores report their own size
+        return obj.nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, 'to_plotly_json'):
+        # Dash components and plotly objects keep their state in a props dict
+        size += deep_size(obj.to_plotly_json(), seen)
+    return size
+
+
+def current_rss_mb():
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except OSError:
+        # No procfs (macOS): fall back to the peak, reported in bytes there
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / MB if sys.platform == 'darwin' else peak / 1024
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by the deep size of its values"""
+
+    def __init__(self, max_mb=CACHE_MB):
+        self.max_bytes = int(max_mb * MB)
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = deep_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryGuard:
+    """Tracks what the app holds in memory and keeps RSS under a budget"""
+
+    def __init__(self, budget_mb=BUDGET_MB, headroom_mb=HEADROOM_MB):
+        self.budget_mb = budget_mb
+        self.headroom_mb = headroom_mb
+        self.floor_mb = None
+        self.applied = []
+        self._tracked = {}
+        self._caches = {}
+        self._downgrades = []
+        self._lock = threading.Lock()
+
+    def track(self, name, kind, getter):
+        """Account for the object returned by getter under name"""
+        self._tracked[name] = (kind, getter)
+
+    def track_cache(self, name, cache):
+        """Account for a cache with a clear() method, emptied first under pressure"""
+        self._caches[name] = cache
+        self.track(name, 'cache', lambda: cache)
+
+    def add_downgrade(self, name, action):
+        """Register a downgrade, applied after the caches and earlier downgrades"""
+        self._downgrades.append((name, action))
+
+    def account(self):
+        """Deep size of every tracked object, in bytes"""
+        seen = set()
+        return {name: {'kind': kind, 'bytes': deep_size(getter(), seen)}
+                for name, (kind, getter) in self._tracked.items()}
+
+    def limit_mb(self):
+        """RSS above which check() acts: the budget, or the floor left by the last intervention plus headroom"""
+        if self.floor_mb is None:
+            return self.budget_mb
+        return max(self.budget_mb, self.floor_mb + self.headroom_mb)
+
+    def check(self):
+        """Free memory if RSS is over the limit; returns the actions taken"""
+        rss = current_rss_mb()
+        if rss <= self.budget_mb:
+            self.floor_mb = None
+            return []
+        if rss <= self.limit_mb():
+            return []
+        actions = []
+        with self._lock:
+            seen = set()
+            freed = sum(cache.bytes if isinstance(cache, LRUCache) else deep_size(cache, seen)
+                        for cache in self._caches.values())
+            for name, cache in self._caches.items():
+                cache.clear()
+                actions.append(f'cleared {name}')
+            gc.collect()
+            # Downgrade only when the caches could not account for the excess
+            if freed < (rss - self.budget_mb) * MB and len(self.applied) < len(self._downgrades):
+                name, action = self._downgrades[len(self.applied)]
+                action()
+                gc.collect()
+                self.applied.append(name)
+                actions.append(name)
+            rss = current_rss_mb()
+            self.floor_mb = rss if rss > self.budget_mb else None
+        print(f"Memory budget {self.budget_mb:.0f} MB exceeded: {', '.join(actions)} "
+              f"(RSS now {rss:.1f} MB)")
+        return actions
+
+    def report(self):
+        components = self.account()
+        by_kind = {}
+        for entry in components.values():
+            by_kind[entry['kind']] = by_kind.get(entry['kind'], 0) + entry['bytes']
+        return {
+            'budget_mb': self.budget_mb,
+            'limit_mb': round(self.limit_mb(), 2),
+            'rss_mb': round(current_rss_mb(), 2),
+            'tracked_mb': round(sum(by_kind.values()) / MB, 2),
+            'by_kind_mb': {kind: round(size / MB, 2) for kind, size in by_kind.items()},
+            'components': {name: {'kind': e['kind'], 'mb': round(e['bytes'] / MB, 3)}
+                           for name, e in components.items()},
+            'downgrades_applied': list(self.applied),
+            'downgrades_available': [name for name, _ in self._downgrades[len(self.applied):]],
+        }
+
+
+def register(app, guard):
+    """Serve the guard's accounting at /debug/memory"""
+    from flask import abort, jsonify, request
+
+    @app.server.route('/debug/memory')
+    def debug_memory():
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            abort(403)
+        return jsonify(guard.report())
@@ -2,42 +2,82 @@
 Fast Interactive Migration Dashboard using Plotly Dash
 Run with: python migration.py
 Then open http://localhost:8050 in your browser
+
+For deployment, serve it with multiple workers, compression and debug off:
+python migration.py serve --workers 2 --threads 4
 """
 
 import pandas as pd
-import geopandas as gpd
 import plotly.graph_objects as go
-from dash import Dash, dcc, html, Input, Output
+from dash import ClientsideFunction, Dash, Patch, ctx, dcc, html, no_update, Input, Output, State
+from dash.exceptions import PreventUpdate
+import argparse
+import functools
+import gc
+import hashlib
 import json
+import os
+import threading
+import uuid
 import numpy as np
 from pathlib import Path
 
+from analytics import Analytics, register as register_analytics
+from cube import AggregateCube, read_metadata
+from engine import create_engine
+from export import export_url, register as register_export
+from geometry import Boundaries
+from jobs import JobCancelled, JobRunner, checkpoint
+from frames import MonthlyFrames, read_metadata as read_frames_metadata
+from flows import (DEFAULT_FLOW_LIMIT, FLOW_LIMIT_OPTIONS, PREVIEW_FLOW_LIMIT, bundle_flows, bundles_flows,
+                   exceeds_preview, parse_flow_limit, select_flows, tail_summary)
+from geodesic import ArcStore, arc_paths, join_paths
+from odmatrix import PAGE_SIZE, ODMatrix, PlaceDetail
+from panel import PanelIndex
+from search import OptionIndex
+from memory_guard import LRUCache, MemoryGuard, register as register_memory_endpoint
+from profiling import count, instrument, register, span
+from spatial import (GridIndex, boundary_keys, detail_min_share, quantize_viewport, viewport_bbox,
+                     viewport_from_relayout)
+
+# Map styles: flow lines, or a choropleth of one per-place measure
+MAP_STYLE_OPTIONS = [
+    {'label': 'Flow lines', 'value': 'flows'},
+    {'label': 'Inflow', 'value': 'inflow'},
+    {'label': 'Outflow', 'value': 'outflow'},
+    {'label': 'Net migration', 'value': 'net'},
+    {'label': 'Inflow per 1,000 surveyed', 'value': 'inflow_rate'},
+    {'label': 'Outflow per 1,000 surveyed', 'value': 'outflow_rate'},
+    {'label': 'Net migration per 1,000 surveyed', 'value': 'net_rate'},
+]
+
 # Define data directory
 DATA_DIR = Path(__file__).parent / 'raw'
+ASSETS_DIR = Path(__file__).parent / 'assets'
+
+# Migration records can be swapped out (e.g. for synthetic data) via MIGRATION_DATA; several
+# files (e.g. several CPHS years) are given separated by os.pathsep (':' on Linux) and concatenated
+MIGRATION_FILES = [Path(p) for p in os.environ.get('MIGRATION_DATA', str(DATA_DIR / 'migration_2024.parquet'))
+                   .split(os.pathsep) if p]
+
+# Optional precomputed aggregates (b/precompute_cube.py); used only if built from MIGRATION_FILES
+CUBE_FILE = Path(os.environ.get('MIGRATION_CUBE', DATA_DIR / 'aggregate_cube.parquet'))
+
+# Optional monthly frames for the time slider (b/precompute_frames.py); used only if built from MIGRATION_FILES
+FRAMES_FILE = Path(os.environ.get('MIGRATION_FRAMES', DATA_DIR / 'monthly_frames.parquet'))
+MONTH_INTERVAL_MS = int(os.environ.get('MIGRATION_MONTH_INTERVAL_MS', 1500))
+
+# Query engine for the filter -> aggregate step (engine.py): 'pandas' (default) or 'duckdb'
+ENGINE = os.environ.get('MIGRATION_ENGINE', 'pandas')
 
 # Load data
 print("Loading data...")
-migration_df = pd.read_parquet(DATA_DIR / 'migration_2024.parquet')
-district_mapping = pd.read_parquet(DATA_DIR / 'district_mapping.parquet')
 state_centroids = pd.read_parquet(DATA_DIR / 'state_centroids.parquet')
 district_centroids = pd.read_parquet(DATA_DIR / 'district_centroids.parquet')
 
-# Load boundaries (already pre-simplified for memory efficiency)
-state_gdf = gpd.read_parquet(DATA_DIR / 'state_boundaries.parquet')
-district_gdf = gpd.read_parquet(DATA_DIR / 'district_boundaries.parquet')
-
-# Merge migration data with district mapping
-migration_df = migration_df.merge(
-    district_mapping[['state_code', 'district', 'matched_district']],
-    on=['state_code', 'district'],
-    how='left'
-)
-
-# Filter to migration records only
-migration_df = migration_df[migration_df['mem_status'].isin(['Emigrated', 'Immigrated'])].copy()
-
-# Create unique ID
-migration_df['unique_id'] = migration_df['hh_id'].astype(str) + '_' + migration_df['mem_id'].astype(str)
+# Load boundaries (already pre-simplified for memory efficiency) as flat coordinate buffers
+boundaries = {'state': Boundaries.read_parquet(DATA_DIR / 'state_boundaries.parquet'),
+              'district': Boundaries.read_parquet(DATA_DIR / 'district_boundaries.parquet')}
 
 # Create centroids lookup
 state_centroids_dict = dict(zip(state_centroids['state_name'],
@@ -46,24 +86,198 @@ district_centroids_dict = dict(zip(
     district_centroids['district_name'] + '|' + district_centroids['state_name'],
     zip(district_centroids['lat'], district_centroids['lon'])
 ))
-
-# Get unique filter values (convert to string to avoid categorical issues)
-migration_df['caste_category'] = migration_df['caste_category'].astype(str)
-migration_df['caste'] = migration_df['caste'].astype(str)
-migration_df['religion'] = migration_df['religion'].astype(str)
-migration_df['emigration_immigration_reason'] = migration_df['emigration_immigration_reason'].astype(str)
-
-caste_categories = sorted([x for x in migration_df['caste_category'].unique() if x and x != 'nan'])
-castes = sorted([x for x in migration_df['caste'].unique() if x and x != 'nan'])
-religions = sorted([x for x in migration_df['religion'].unique() if x and x != 'nan'])
-reasons = sorted([x for x in migration_df['emigration_immigration_reason'].unique() if x and x != 'nan'])
+place_keys = {'state': list(state_centroids_dict), 'district': list(district_centroids_dict)}
+
+# Migration records merged with the district mapping, filtered to migrants; the
+# pandas engine holds them in memory (migration_df), DuckDB queries the file
+engine = create_engine(ENGINE, MIGRATION_FILES, DATA_DIR / 'district_mapping.parquet', place_keys)
+migration_df = getattr(engine, 'df', None)
+source_rows = engine.source_rows
+surveyed_counts = engine.surveyed_members()
+# Survey-weighted population per home place, when the records carry weights
+population_counts = engine.surveyed_members(weighted=True) if engine.weighted else None
+print(f"Query engine: {engine.name} ({engine.rows:,} migration records"
+      f"{', survey-weighted' if engine.weighted else ''})")
+
+# Each member's records across waves, for repeat and return migration
+panel = PanelIndex(engine.panel_records(), engine.member_records)
+
+# Caste dropdown search per (status, caste category or None for all), ranked by unique migrants
+caste_search = {}
+for columns in (['mem_status', 'caste'], ['mem_status', 'caste_category', 'caste']):
+    counts = engine.migrant_counts(columns)
+    counts = counts[~counts['caste'].astype(str).isin(['', 'nan'])]
+    for key, group in counts.groupby(columns[:-1], observed=True):
+        caste_search[(key[0], key[1] if len(key) > 1 else None)] = OptionIndex(group['caste'], group['migrants'])
+
+# Get unique filter values
+caste_categories = engine.distinct('caste_category')
+castes = engine.distinct('caste')
+religions = engine.distinct('religion')
+reasons = engine.distinct('emigration_immigration_reason')
+
+def built_from_data(metadata):
+    """Whether a precomputed file was built from the migration files loaded here, in any order"""
+    return (sorted(metadata.get('source_files', [])) == sorted(p.name for p in MIGRATION_FILES) and
+            metadata.get('source_rows') == source_rows)
+
+cube = None
+if CUBE_FILE.exists():
+    cube_metadata = read_metadata(CUBE_FILE)
+    if built_from_data(cube_metadata):
+        cube = AggregateCube(CUBE_FILE)
+        print(f"Using aggregate cube {CUBE_FILE.name} ({len(cube):,} rows)")
+    else:
+        print(f"Ignoring aggregate cube {CUBE_FILE.name}: it was built from different migration data")
+
+# Monthly frames are read on the first month-by-month request; only their month labels are needed here
+frame_months = []
+frames = None
+frames_lock = threading.Lock()
+if FRAMES_FILE.exists():
+    frames_metadata = read_frames_metadata(FRAMES_FILE)
+    if built_from_data(frames_metadata):
+        frame_months = frames_metadata.get('months', [])
+        print(f"Monthly frames {FRAMES_FILE.name} available for {len(frame_months)} months")
+    else:
+        print(f"Ignoring monthly frames {FRAMES_FILE.name}: they were built from different migration data")
+
+def monthly_frames():
+    """The monthly frames, read from FRAMES_FILE on first use"""
+    global frames
+    with frames_lock:
+        if frames is None:
+            frames = MonthlyFrames(FRAMES_FILE)
+    return frames
+
+# Spatial indexes for the visible-area map: places by location
+# (the engine indexes the records starting or ending at each place)
+place_ids = {level: {key: i for i, key in enumerate(keys)} for level, keys in place_keys.items()}
+surveyed = {level: surveyed_counts[level].reindex(keys, fill_value=0).to_numpy() for level, keys in place_keys.items()}
+population = None
+if population_counts is not None:
+    population = {level: population_counts[level].reindex(keys, fill_value=0).to_numpy()
+                  for level, keys in place_keys.items()}
+place_index = {level: GridIndex([(lon, lat, lon, lat) for lat, lon in points.values()])
+               for level, points in [('state', state_centroids_dict), ('district', district_centroids_dict)]}
+
+# Caches, accounted for and emptied by the memory guard when over budget
+boundary_cache = {}
+figure_cache = LRUCache()
+aggregate_cache = LRUCache()
+od_cache = LRUCache()
+panel_cache = LRUCache()
+place_cache = LRUCache()
+arc_stores = {'state': ArcStore(), 'district': ArcStore()}
+
+def clear_caches():
+    """Empty the boundary, figure, aggregate, OD matrix, panel summary, place detail and arc caches"""
+    boundary_cache.clear()
+    figure_cache.clear()
+    aggregate_cache.clear()
+    od_cache.clear()
+    panel_cache.clear()
+    place_cache.clear()
+    for store in arc_stores.values():
+        store.clear()
+
+def coarsen_district_geometry():
+    """Re-simplify district boundaries with the tolerance used for Render (0.08)
+
+    The base map and choropleth polygons are then rebuilt from them, so the
+    browser gets the coarser geometry too.
+    """
+    boundaries['district'] = boundaries['district'].simplify(tolerance=0.08)
+    boundary_cache.pop('district_features', None)
+    boundary_cache.pop('district_basemap', None)
+
+def release_district_geometry():
+    """Drop the loaded district boundaries, which the browser gets from the static assets instead"""
+    boundaries.pop('district', None)
+    boundary_cache.pop('district_features', None)
+    boundary_cache.pop('district_basemap', None)
+
+def hash_unique_ids():
+    """Replace the hh_id_mem_id strings with 64-bit hashes (counts become approximate)"""
+    global migration_df
+    engine.hash_unique_ids()
+    migration_df = engine.df
+    figure_cache.clear()
+    aggregate_cache.clear()
+
+guard = MemoryGuard()
+guard.track('migration_df', 'table', lambda: migration_df)
+guard.track('caste_search', 'table', lambda: caste_search)
+guard.track('panel_index', 'table', lambda: panel)
+guard.track('aggregate_cube', 'table', lambda: cube and (cube.flows, cube._keys))
+guard.track('monthly_frames', 'table', lambda: frames)
+guard.track('centroids', 'table', lambda: (state_centroids, district_centroids,
+                                           state_centroids_dict, district_centroids_dict, surveyed, population))
+guard.track('spatial_index', 'table', lambda: (place_index, getattr(engine, 'place_rows', None)))
+guard.track('state_boundaries', 'geometry', lambda: boundaries['state'])
+guard.track('district_boundaries', 'geometry', lambda: boundaries.get('district'))
+guard.track_cache('boundary_cache', boundary_cache)
+guard.track_cache('figure_cache', figure_cache)
+guard.track_cache('aggregate_cache', aggregate_cache)
+guard.track_cache('od_cache', od_cache)
+guard.track_cache('panel_cache', panel_cache)
+guard.track_cache('place_cache', place_cache)
+for level, store in arc_stores.items():
+    guard.track_cache(f'{level}_arc_store', store)
+# Only downgrades that free memory with this data and engine are registered: with the
+# static district assets the loaded boundaries are only a fallback and can go, and
+# ids are hashed only in the pandas engine's in-memory table (DuckDB holds none)
+if all((ASSETS_DIR / f'{prefix}_district.json').exists() for prefix in ('basemap', 'choropleth')):
+    guard.add_downgrade('released district geometry', release_district_geometry)
+else:
+    guard.add_downgrade('coarser district geometry', coarsen_district_geometry)
+if migration_df is not None:
+    guard.add_downgrade('hashed unique ids', hash_unique_ids)
+
+map_jobs = JobRunner()
 
 print("Data loaded successfully!")
 
 # Initialize Dash app
 app = Dash(__name__)
-
-app.layout = html.Div([
+register(app)
+register_memory_endpoint(app, guard)
+
+# Static base map layers and choropleth polygons built by b/build_basemap.py; the
+# content hash in the URL lets browsers cache them permanently
+basemap_urls = {}
+choropleth_urls = {}
+for level in ['state', 'district']:
+    for urls, prefix in [(basemap_urls, 'basemap'), (choropleth_urls, 'choropleth')]:
+        asset_file = ASSETS_DIR / f'{prefix}_{level}.json'
+        if asset_file.exists():
+            version = hashlib.md5(asset_file.read_bytes()).hexdigest()[:12]
+            urls[level] = f"{app.get_asset_url(asset_file.name)}?v={version}"
+    # Without the static asset, the same base map is built from the loaded boundaries
+    basemap_urls.setdefault(level, app.get_relative_path(f'/basemap/{level}.json'))
+
+def basemap_layer(level_type):
+    """Base map in the format of assets/basemap_<level>.json: every exterior ring in one line trace"""
+    cache_key = f'{level_type}_basemap'
+    if cache_key not in boundary_cache:
+        lons, lats = [], []
+        for ring in boundaries[level_type].exterior_rings():
+            lons += np.round(ring[:, 0], 4).tolist() + [None]
+            lats += np.round(ring[:, 1], 4).tolist() + [None]
+        trace = {'type': 'scattergeo', 'lon': lons, 'lat': lats, 'mode': 'lines',
+                 'line': {'width': 1, 'color': '#95a5a6' if level_type == 'district' else '#667eea'},
+                 'hoverinfo': 'skip', 'showlegend': False, 'name': 'Boundaries'}
+        boundary_cache[cache_key] = json.dumps({'data': [trace]}, separators=(',', ':'))
+    return boundary_cache[cache_key]
+
+@app.server.route('/basemap/<level_type>.json')
+def serve_basemap(level_type):
+    from flask import Response, abort
+    if level_type not in boundaries:
+        abort(404)
+    return Response(basemap_layer(level_type), mimetype='application/json')
+
+base_layout = html.Div([
     # Header
     html.Div([
         html.Div([
@@ -206,7 +420,82 @@ app.layout = html.Div([
                     optionHeight=60,
                     className='custom-dropdown'
                 )
-            ], style={'flex': '1', 'minWidth': '280px'})
+            ], style={'flex': '1', 'minWidth': '280px'}),
+
+            html.Div([
+                html.Label('Flows Shown', style={
+                    'fontWeight': '600',
+                    'marginBottom': '8px',
+                    'display': 'block',
+                    'color': '#2d3748',
+                    'fontSize': '14px'
+                }),
+                dcc.Dropdown(
+                    id='flow-limit',
+                    options=FLOW_LIMIT_OPTIONS,
+                    value=DEFAULT_FLOW_LIMIT,
+                    clearable=False,
+                    className='custom-dropdown'
+                )
+            ], style={'flex': '1', 'minWidth': '240px'}),
+
+            html.Div([
+                html.Label('Map Style', style={
+                    'fontWeight': '600',
+                    'marginBottom': '8px',
+                    'display': 'block',
+                    'color': '#2d3748',
+                    'fontSize': '14px'
+                }),
+                dcc.Dropdown(
+                    id='map-style',
+                    options=MAP_STYLE_OPTIONS,
+                    value='flows',
+                    clearable=False,
+                    className='custom-dropdown'
+                )
+            ], style={'flex': '1', 'minWidth': '240px'}),
+
+            html.Div([
+                html.Label('Map Extent', style={
+                    'fontWeight': '600',
+                    'marginBottom': '8px',
+                    'display': 'block',
+                    'color': '#2d3748',
+                    'fontSize': '14px'
+                }),
+                dcc.Dropdown(
+                    id='map-extent',
+                    options=[
+                        {'label': 'All of India', 'value': 'all'},
+                        {'label': 'Visible area (updates on zoom)', 'value': 'viewport'}
+                    ],
+                    value='all',
+                    clearable=False,
+                    className='custom-dropdown'
+                )
+            ], style={'flex': '1', 'minWidth': '240px'}),
+
+            # Sample counts or survey-weighted population estimates (hidden without weights)
+            html.Div([
+                html.Label('Counts', style={
+                    'fontWeight': '600',
+                    'marginBottom': '8px',
+                    'display': 'block',
+                    'color': '#2d3748',
+                    'fontSize': '14px'
+                }),
+                dcc.Dropdown(
+                    id='count-weighting',
+                    options=[
+                        {'label': 'Surveyed migrants', 'value': 'sample'},
+                        {'label': 'Population estimate (survey-weighted)', 'value': 'weighted'}
+                    ],
+                    value='sample',
+                    clearable=False,
+                    className='custom-dropdown'
+                )
+            ], style={'flex': '1', 'minWidth': '240px', 'display': 'block' if engine.weighted else 'none'})
 
         ], style={
             'display': 'flex',
@@ -225,13 +514,93 @@ app.layout = html.Div([
 
     # Map Container
     html.Div([
+        # Month-by-month view from the precomputed frames (hidden without them)
+        html.Div([
+            dcc.Checklist(
+                id='month-mode',
+                options=[{'label': ' Month by month', 'value': 'monthly'}],
+                value=[],
+                inline=True
+            ),
+            html.Button('▶ Play', id='month-play', n_clicks=0),
+            html.Div(dcc.Slider(
+                id='month-slider',
+                min=0,
+                max=max(len(frame_months) - 1, 0),
+                step=1,
+                value=0,
+                marks={i: month for i, month in enumerate(frame_months)
+                       if i % max(1, -(-len(frame_months) // 12)) == 0}
+            ), style={'flex': '1'}),
+            dcc.Interval(id='month-timer', interval=MONTH_INTERVAL_MS, disabled=True)
+        ], style={
+            'display': 'flex' if frame_months else 'none',
+            'alignItems': 'center',
+            'gap': '16px',
+            'padding': '12px 20px 0 20px'
+        }),
+        # Shown while the full map is drawn behind a preview
+        html.Div(id='map-progress', style={
+            'padding': '0 20px',
+            'fontSize': '13px',
+            'color': '#718096',
+            'lineHeight': '28px',
+            'minHeight': '28px'
+        }),
+        # The spinner covers the map only until the first answer (preview) arrives
         dcc.Loading(
             id='loading',
             type='default',
+            target_components={'map-preview': 'data'},
             children=[
-                dcc.Graph(id='migration-map', style={'height': '700px'})
+                dcc.Graph(id='migration-map', style={'height': '700px'}),
+                dcc.Store(id='map-figure'),
+                # Fingerprint of the figure layout the page shows, so updates can send only traces
+                dcc.Store(id='map-layout'),
+                # Which request the preview answered, and whether it was already the full map
+                dcc.Store(id='map-preview')
             ]
-        )
+        ),
+        dcc.Store(id='viewport'),
+
+        # Downloads of the table behind the map, for the current filters
+        html.Div([
+            html.Span('Download: ', style={'fontWeight': '600', 'color': '#2d3748'}),
+            html.A('Flows (CSV)', id='export-flows-csv', download='', style={'color': '#5a67d8'}),
+            html.Span(' · ', style={'color': '#a0aec0'}),
+            html.A('Flows (Parquet)', id='export-flows-parquet', download='', style={'color': '#5a67d8'}),
+            html.Span(' · ', style={'color': '#a0aec0'}),
+            html.A('Migrants (CSV)', id='export-records-csv', download='', style={'color': '#5a67d8'}),
+            html.Span(' · ', style={'color': '#a0aec0'}),
+            html.A('Migrants (Parquet)', id='export-records-parquet', download='', style={'color': '#5a67d8'})
+        ], style={
+            'padding': '12px 20px',
+            'borderTop': '1px solid #edf2f7',
+            'fontSize': '14px'
+        }),
+
+        # Repeat and return migration across survey waves, for the current filters
+        html.Div(id='panel-metrics', style={
+            'padding': '12px 20px',
+            'borderTop': '1px solid #edf2f7',
+            'fontSize': '14px',
+            'color': '#4a5568'
+        }),
+
+        # Largest origins and destinations of the clicked place, a page at a time
+        html.Div([
+            html.Div(id='place-detail'),
+            html.Div([
+                html.Button('‹ Previous', id='place-detail-prev', n_clicks=0),
+                html.Button('Next ›', id='place-detail-next', n_clicks=0)
+            ], style={'display': 'flex', 'gap': '8px', 'marginTop': '8px'}),
+            dcc.Store(id='place-detail-page')
+        ], style={
+            'padding': '12px 20px',
+            'borderTop': '1px solid #edf2f7',
+            'fontSize': '14px',
+            'color': '#4a5568'
+        })
     ], style={
         'background': 'white',
         'borderRadius': '12px',
@@ -258,6 +627,12 @@ app.layout = html.Div([
     'minHeight': '100vh'
 })
 
+def serve_layout():
+    """Page layout with a fresh session id, used to supersede that page's stale map jobs"""
+    return html.Div([base_layout, dcc.Store(id='session-id', data=uuid.uuid4().hex)])
+
+app.layout = serve_layout
+
 # Callback to update breakdown values based on migration status
 @app.callback(
     [Output('breakdown-value', 'options'),
@@ -266,20 +641,17 @@ app.layout = html.Div([
     [Input('breakdown-type', 'value'),
      Input('migration-status', 'value')]
 )
+@instrument('update_breakdown_options')
 def update_breakdown_options(breakdown_type, migration_status):
     if breakdown_type == 'overall':
         return [], None, {'flex': '1', 'minWidth': '200px', 'display': 'none'}
 
-    # Filter data based on migration status
-    df = migration_df[migration_df['mem_status'] == migration_status].copy()
-
-    # Get available values for the selected breakdown type
-    if breakdown_type == 'caste_category':
-        available_values = sorted([x for x in df['caste_category'].unique() if x and x != 'nan'])
-    elif breakdown_type == 'religion':
-        available_values = sorted([x for x in df['religion'].unique() if x and x != 'nan'])
+    # Get available values for the selected breakdown type among records with this migration status
+    if breakdown_type in ('caste_category', 'religion'):
+        available_values = engine.distinct(breakdown_type, mem_status=migration_status)
     else:
         available_values = []
+    count('update_breakdown_options', 'rows_scanned', engine.rows)
 
     options = [{'label': x, 'value': x} for x in available_values]
     return options, None, {'flex': '1', 'minWidth': '200px', 'display': 'block'}
@@ -293,24 +665,41 @@ def update_breakdown_options(breakdown_type, migration_status):
      Input('breakdown-value', 'value'),
      Input('migration-status', 'value')]
 )
+@instrument('update_caste_options')
 def update_caste_options(breakdown_type, breakdown_value, migration_status):
     # Only show caste filter when caste category is selected
     if breakdown_type != 'caste_category':
         return [], None, {'flex': '1', 'minWidth': '200px', 'display': 'none'}
 
-    # Filter data based on migration status
-    df = migration_df[migration_df['mem_status'] == migration_status].copy()
-
-    # If a specific caste category is selected, filter castes for that category
-    if breakdown_value:
-        df = df[df['caste_category'] == breakdown_value]
-
-    # Get available castes
-    available_castes = sorted([x for x in df['caste'].unique() if x and x != 'nan'])
+    # The castes with the most migrants for this status (and caste category if one is
+    # selected); typing searches all of them (search_caste_options)
+    index = caste_search.get((migration_status, breakdown_value or None))
+    available_castes = index.top() if index is not None else []
     options = [{'label': x, 'value': x} for x in available_castes]
 
     return options, None, {'flex': '1', 'minWidth': '200px', 'display': 'block'}
 
+# Callback to search castes on the server as the user types
+@app.callback(
+    Output('caste-filter', 'options', allow_duplicate=True),
+    Input('caste-filter', 'search_value'),
+    [State('breakdown-value', 'value'),
+     State('migration-status', 'value'),
+     State('caste-filter', 'value')],
+    prevent_initial_call=True
+)
+@instrument('search_caste_options')
+def search_caste_options(search_value, breakdown_value, migration_status, selected):
+    if search_value is None:
+        raise PreventUpdate
+    index = caste_search.get((migration_status, breakdown_value or None))
+    matches = index.search(search_value) if index is not None else []
+    # Keep the current selection among the options so the dropdown can still display it
+    if selected and selected not in matches:
+        matches.append(selected)
+    count('search_caste_options', 'options_returned', len(matches))
+    return [{'label': x, 'value': x} for x in matches]
+
 # Callback to update migration reason options based on previous filters
 @app.callback(
     [Output('migration-reason', 'options'),
@@ -320,325 +709,703 @@ def update_caste_options(breakdown_type, breakdown_value, migration_status):
      Input('breakdown-value', 'value'),
      Input('caste-filter', 'value')]
 )
+@instrument('update_reason_options')
 def update_reason_options(migration_status, breakdown_type, breakdown_value, caste_filter):
-    # Filter data based on migration status
-    df = migration_df[migration_df['mem_status'] == migration_status].copy()
+    # Filter based on migration status
+    filters = {'mem_status': migration_status}
+    count('update_reason_options', 'rows_scanned', engine.rows)
 
     # Apply breakdown filter if selected
-    if breakdown_type != 'overall' and breakdown_value:
-        if breakdown_type == 'caste_category':
-            df = df[df['caste_category'] == breakdown_value]
-        elif breakdown_type == 'religion':
-            df = df[df['religion'] == breakdown_value]
+    if breakdown_type in ('caste_category', 'religion') and breakdown_value:
+        filters[breakdown_type] = breakdown_value
 
     # Apply caste filter if selected
     if caste_filter:
-        df = df[df['caste'] == caste_filter]
+        filters['caste'] = caste_filter
 
     # Get available migration reasons
-    available_reasons = sorted([x for x in df['emigration_immigration_reason'].unique() if x and x != 'nan'])
+    available_reasons = engine.distinct('emigration_immigration_reason', **filters)
     options = [{'label': x, 'value': x} for x in available_reasons]
 
     return options, None
 
-# Main callback to update map
+# Point the download links at the current filters
 @app.callback(
-    [Output('migration-map', 'figure'),
-     Output('info-text', 'children')],
+    [Output('export-flows-csv', 'href'),
+     Output('export-flows-parquet', 'href'),
+     Output('export-records-csv', 'href'),
+     Output('export-records-parquet', 'href')],
     [Input('migration-status', 'value'),
      Input('level-type', 'value'),
+     Input('breakdown-type', 'value'),
+     Input('breakdown-value', 'value'),
+     Input('caste-filter', 'value'),
+     Input('migration-reason', 'value'),
+     Input('count-weighting', 'value')]
+)
+def update_export_links(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                        migration_reason, weighting='sample'):
+    filters = {'migration_status': migration_status, 'level_type': level_type, 'breakdown_type': breakdown_type,
+               'breakdown_value': breakdown_value, 'caste_filter': caste_filter,
+               'migration_reason': migration_reason, 'weighted': '1' if weighted_counts(weighting) else None}
+    return [app.get_relative_path(export_url(kind, fmt, filters))
+            for kind in ('flows', 'records') for fmt in ('csv', 'parquet')]
+
+# Summarise repeat and return migration for the current filters from the panel index
+@app.callback(
+    Output('panel-metrics', 'children'),
+    [Input('migration-status', 'value'),
      Input('breakdown-type', 'value'),
      Input('breakdown-value', 'value'),
      Input('caste-filter', 'value'),
      Input('migration-reason', 'value')]
 )
-def update_map(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason):
-    # Filter data
-    df = migration_df[migration_df['mem_status'] == migration_status].copy()
-
-    # Define origin and destination FIRST
-    if migration_status == 'Emigrated':
-        df['origin'] = df['state']
-        df['destination'] = df['emigrated_immigrated_state']
-        df['origin_district'] = df['matched_district']
-        df['destination_district'] = df['emigrated_immigrated_district']
+@instrument('update_panel_metrics')
+def update_panel_metrics(migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason):
+    key = (migration_status, breakdown_type, breakdown_value, caste_filter, migration_reason)
+    summary = panel_cache.get(key)
+    if summary is None:
+        summary = analytics.panel_summary(migration_status=migration_status, breakdown_type=breakdown_type,
+                                          breakdown_value=breakdown_value, caste_filter=caste_filter,
+                                          migration_reason=migration_reason)
+        panel_cache.put(key, summary)
+
+    migrants = summary['migrants']
+    if not migrants:
+        return [html.Span('Across survey waves: ', style={'fontWeight': '600', 'color': '#2d3748'}),
+                html.Span('no matching migrants')]
+    text = (f"{migrants:,} migrants · {summary['repeat_migrants'] / migrants:.1%} moved more than once · "
+            f"{summary['returned'] / migrants:.1%} returned to the household they left · "
+            f"{summary['several_waves'] / migrants:.1%} reported in several waves")
+    if summary['median_months_between_moves'] is not None:
+        text += f" · median {summary['median_months_between_moves']:.0f} months from first to last move"
+    return [html.Span('Across survey waves: ', style={'fontWeight': '600', 'color': '#2d3748'}), html.Span(text)]
+
+# Show the largest origins and destinations of the clicked place, a page at a time
+@app.callback(
+    [Output('place-detail', 'children'),
+     Output('place-detail-page', 'data')],
+    [Input('migration-map', 'clickData'),
+     Input('place-detail-prev', 'n_clicks'),
+     Input('place-detail-next', 'n_clicks'),
+     Input('migration-status', 'value'),
+     Input('level-type', 'value'),
+     Input('breakdown-type', 'value'),
+     Input('breakdown-value', 'value'),
+     Input('caste-filter', 'value'),
+     Input('migration-reason', 'value'),
+     Input('month-mode', 'value'),
+     Input('month-slider', 'value'),
+     Input('count-weighting', 'value')],
+    State('place-detail-page', 'data')
+)
+@instrument('update_place_detail')
+def update_place_detail(click_data, prev_clicks, next_clicks, migration_status, level_type, breakdown_type,
+                        breakdown_value, caste_filter, migration_reason, month_mode=None, month_index=None,
+                        weighting='sample', current=None):
+    current = current if current and current.get('level_type') == level_type else None
+    place, page = (current['place'], current['page']) if current else (None, 0)
+    if ctx.triggered_id == 'migration-map':
+        point = ((click_data or {}).get('points') or [{}])[0]
+        data = point.get('customdata')
+        data = data[0] if isinstance(data, list) else data
+        if not isinstance(data, (int, float)):
+            # A flow arrow, not a place
+            raise PreventUpdate
+        place, page = data, 0
+    elif ctx.triggered_id == 'place-detail-prev':
+        page = max(page - 1, 0)
+    elif ctx.triggered_id == 'place-detail-next':
+        page += 1
     else:
-        df['origin'] = df['emigrated_immigrated_state']
-        df['destination'] = df['state']
-        df['origin_district'] = df['emigrated_immigrated_district']
-        df['destination_district'] = df['matched_district']
+        page = 0
+    if place is None or not 0 <= int(place) < len(place_keys[level_type]):
+        return html.Span('Click a place on the map to see where its migrants come from and go to.'), None
+
+    place = int(place)
+    weighted = weighted_counts(weighting)
+    detail = place_detail(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                          migration_reason, selected_month(month_mode, month_index), weighted)
+    n_origins, n_destinations = detail.partner_count(place, 'in'), detail.partner_count(place, 'out')
+    page = min(page, max(max(n_origins, n_destinations) - 1, 0) // PAGE_SIZE)
+
+    def partner_list(direction, total, n_partners, label):
+        ids, counts = detail.partners(place, direction, page * PAGE_SIZE, PAGE_SIZE)
+        count('update_place_detail', 'partners_sent', len(ids))
+        first = page * PAGE_SIZE + 1
+        heading = f"{label}: {int(total):,} {'estimated migrants' if weighted else 'migrants'}"
+        if len(ids):
+            heading += f" (places {first}–{first + len(ids) - 1} of {n_partners:,})"
+        elif n_partners:
+            heading += f" ({n_partners:,} places)"
+        rows = [html.Li(f"{place_name(place_keys[level_type][i], level_type)}: {c:,}") for i, c in zip(ids, counts)]
+        return html.Div([html.Div(heading, style={'fontWeight': '600', 'color': '#2d3748'}),
+                         html.Ol(rows, start=first, style={'margin': '4px 0 0 0'})],
+                        style={'flex': '1', 'minWidth': '240px'})
+
+    children = [
+        html.Div(place_name(place_keys[level_type][place], level_type),
+                 style={'fontWeight': '600', 'color': '#2d3748', 'marginBottom': '6px'}),
+        html.Div([partner_list('in', detail.inflow[place], n_origins, 'Inflows, largest origins'),
+                  partner_list('out', detail.outflow[place], n_destinations, 'Outflows, largest destinations')],
+                 style={'display': 'flex', 'gap': '20px', 'flexWrap': 'wrap'})
+    ]
+    # Moves within the place count in both totals but are not a partner
+    if detail.within[place]:
+        children.append(html.Div(f"Within the place: {int(detail.within[place]):,} "
+                                 f"{'estimated migrants' if weighted else 'migrants'} (included in both totals)",
+                                 style={'color': '#4a5568', 'marginTop': '6px'}))
+    return children, {'level_type': level_type, 'place': place, 'page': page}
+
+# Track the geo view while the map is in visible-area mode
+@app.callback(
+    Output('viewport', 'data'),
+    Input('migration-map', 'relayoutData'),
+    [State('map-extent', 'value'),
+     State('viewport', 'data')]
+)
+def update_viewport(relayout, map_extent, current):
+    view = viewport_from_relayout(relayout, current)
+    if map_extent != 'viewport' or view is None:
+        raise PreventUpdate
+    return view
 
-    # Apply breakdown filter AFTER defining origin/destination
-    if breakdown_type != 'overall' and breakdown_value:
-        if breakdown_type == 'caste_category':
-            df = df[df['caste_category'] == breakdown_value]
-        elif breakdown_type == 'religion':
-            df = df[df['religion'] == breakdown_value]
+# First answer to a map request: the largest flows only, unless the full map is as cheap
+@app.callback(
+    [Output('map-preview', 'data'),
+     Output('map-figure', 'data', allow_duplicate=True),
+     Output('info-text', 'children', allow_duplicate=True),
+     Output('map-layout', 'data', allow_duplicate=True),
+     Output('map-progress', 'children', allow_duplicate=True)],
+    [Input('migration-status', 'value'),
+     Input('level-type', 'value'),
+     Input('breakdown-type', 'value'),
+     Input('breakdown-value', 'value'),
+     Input('caste-filter', 'value'),
+     Input('migration-reason', 'value'),
+     Input('flow-limit', 'value'),
+     Input('map-style', 'value'),
+     Input('map-extent', 'value'),
+     Input('viewport', 'data'),
+     Input('month-mode', 'value'),
+     Input('month-slider', 'value'),
+     Input('count-weighting', 'value')],
+    [State('session-id', 'data'),
+     State('map-layout', 'data')],
+    prevent_initial_call='initial_duplicate'
+)
+@instrument('preview_map')
+def preview_map(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                flow_limit=DEFAULT_FLOW_LIMIT, map_style='flows', map_extent='all', view=None, month_mode=None,
+                month_index=None, weighting='sample', session_id=None, page_layout=None):
+    cache_key = map_key(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                        migration_reason, flow_limit, map_style, map_extent, view, month_mode, month_index,
+                        weighting)
+    complete = map_style != 'flows' or not exceeds_preview(flow_limit) or figure_cache.get(cache_key) is not None
+    if complete:
+        result = compute_map(cache_key, session_id, 'preview_map')
+        progress = ''
+    else:
+        result = compute_map(cache_key[:6] + (PREVIEW_FLOW_LIMIT,) + cache_key[7:], session_id, 'preview_map')
+        progress = f"Showing the {parse_flow_limit(PREVIEW_FLOW_LIMIT)[0]} largest flows while the full map is drawn…"
+        count('preview_map', 'previews')
+    return ({'request': request_fingerprint(cache_key), 'complete': complete},
+            *map_update(result, page_layout, 'preview_map'), progress)
 
-    # Apply caste filter if selected
-    if caste_filter:
-        df = df[df['caste'] == caste_filter]
+# Full map, after the preview (which it waits for as an input); skipped when the preview was already complete
+@app.callback(
+    [Output('map-figure', 'data'),
+     Output('info-text', 'children'),
+     Output('map-layout', 'data'),
+     Output('map-progress', 'children')],
+    [Input('migration-status', 'value'),
+     Input('level-type', 'value'),
+     Input('breakdown-type', 'value'),
+     Input('breakdown-value', 'value'),
+     Input('caste-filter', 'value'),
+     Input('migration-reason', 'value'),
+     Input('flow-limit', 'value'),
+     Input('map-style', 'value'),
+     Input('map-extent', 'value'),
+     Input('viewport', 'data'),
+     Input('month-mode', 'value'),
+     Input('month-slider', 'value'),
+     Input('count-weighting', 'value'),
+     Input('map-preview', 'data')],
+    [State('session-id', 'data'),
+     State('map-layout', 'data')]
+)
+@instrument('update_map')
+def update_map(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+               flow_limit=DEFAULT_FLOW_LIMIT, map_style='flows', map_extent='all', view=None, month_mode=None,
+               month_index=None, weighting='sample', preview=None, session_id=None, page_layout=None):
+    cache_key = map_key(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                        migration_reason, flow_limit, map_style, map_extent, view, month_mode, month_index,
+                        weighting)
+    if preview and preview['complete'] and preview['request'] == request_fingerprint(cache_key):
+        raise PreventUpdate
+    return (*map_update(compute_map(cache_key, session_id), page_layout), '')
+
+def map_key(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+            flow_limit, map_style, map_extent, view, month_mode=None, month_index=None, weighting='sample'):
+    """Cache key of a map request (build_map's arguments)"""
+    # Views are rounded so that nearby pans and zooms share cached results
+    viewport = quantize_viewport(view) if map_extent == 'viewport' else None
+    return (migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+            flow_limit, map_style, viewport, selected_month(month_mode, month_index), weighted_counts(weighting))
+
+def weighted_counts(weighting):
+    """Whether the Counts control asks for survey-weighted estimates (only offered with weights)"""
+    return weighting == 'weighted' and engine.weighted
+
+def selected_month(month_mode, month_index):
+    """Month label picked on the time slider, or None for all months"""
+    if 'monthly' not in (month_mode or []) or month_index is None or not 0 <= month_index < len(frame_months):
+        return None
+    return frame_months[month_index]
+
+def request_fingerprint(cache_key):
+    """Short id of a map key, stored in the browser to match a preview with its full request"""
+    return hashlib.md5(repr(cache_key).encode()).hexdigest()[:12]
+
+def compute_map(cache_key, session_id, callback='update_map'):
+    """(figure, info, layout fingerprint) for a map key, from the cache or the job runner"""
+    result = figure_cache.get(cache_key)
+    if result is not None:
+        count(callback, 'cache_hits')
+        return result
+    # Only the latest request from a page does work; duplicate requests share one job, and a
+    # preview and its full map (keys differing only in the flow limit) share one debounce
+    try:
+        return map_jobs.run(cache_key, session_id, build_map, *cache_key, group=cache_key[:6] + cache_key[7:])
+    except JobCancelled:
+        raise PreventUpdate
+
+def map_update(result, page_layout, callback='update_map'):
+    """Figure, info and layout outputs for a page whose figure has page_layout
+
+    When the page already shows this layout, only the traces are replaced (the
+    base map is attached in the browser and stays cached there).
+    """
+    figure, info, layout = result
+    if layout != page_layout:
+        return figure, info, layout
+    patch = Patch()
+    patch['data'] = figure['data']
+    count(callback, 'patched')
+    return patch, info, no_update
+
+def aggregate_flows(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                    places=None, callback='update_map', month=None, weighted=False):
+    """Unique migrants per origin-destination pair for one set of filters
+
+    Answered from the aggregate cube when it covers the filters, otherwise by the
+    query engine. With places (keys of place_keys[level_type]), only records
+    starting or ending at those places are aggregated. Engine results are
+    cached, so a map preview and the full map that follows aggregate once.
+    With a month ('Mon YYYY'), the counts come from the monthly frames, or from
+    the engine restricted to that month for filters the frames don't hold
+    (layers left out with --layers). With weighted, counts are survey-weighted
+    population estimates, from the same precomputed sources (both hold them
+    next to the sample counts).
+    """
+    if month is not None:
+        with span(callback, 'frames'):
+            agg_df = monthly_frames().lookup(migration_status, level_type, breakdown_type, breakdown_value,
+                                             caste_filter, migration_reason, month, weighted)
+        if agg_df is not None:
+            count(callback, 'frame_lookups')
+            return agg_df
+    elif cube is not None:
+        with span(callback, 'cube'):
+            agg_df = cube.lookup(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                                 migration_reason, weighted)
+        if agg_df is not None:
+            count(callback, 'cube_hits')
+            return agg_df
+
+    key = (migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+           None if places is None else tuple(places), weighted, month)
+    agg_df = aggregate_cache.get(key)
+    if agg_df is not None:
+        count(callback, 'aggregate_cache_hits')
+        return agg_df
+    agg_df = engine.aggregate(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                              migration_reason, places, callback, weighted, month)
+    aggregate_cache.put(key, agg_df)
+    return agg_df
+
+# Programmatic access to the same aggregates (/api/*) and streaming downloads (/export/*)
+analytics = Analytics(functools.partial(aggregate_flows, callback='analytics'), engine.records, panel, cube)
+register_analytics(app, analytics)
+register_export(app, analytics, engine.record_batches)
+
+# Play through the months in the browser (assets/timeline.js): Play toggles the timer, which steps the slider
+app.clientside_callback(
+    ClientsideFunction(namespace='migration', function_name='togglePlay'),
+    [Output('month-timer', 'disabled'),
+     Output('month-play', 'children'),
+     Output('month-mode', 'value')],
+    Input('month-play', 'n_clicks'),
+    [State('month-timer', 'disabled'),
+     State('month-mode', 'value')]
+)
 
-    # Apply migration reason filter (independent of breakdown)
-    if migration_reason:
-        df = df[df['emigration_immigration_reason'] == migration_reason]
+app.clientside_callback(
+    ClientsideFunction(namespace='migration', function_name='nextMonth'),
+    Output('month-slider', 'value'),
+    Input('month-timer', 'n_intervals'),
+    [State('month-slider', 'value'),
+     State('month-slider', 'max')]
+)
+
+# Add the static base map to the flow layer in the browser (assets/basemap.js)
+app.clientside_callback(
+    ClientsideFunction(namespace='migration', function_name='attachBasemap'),
+    Output('migration-map', 'figure'),
+    Input('map-figure', 'data')
+)
 
-    # Aggregate unique individuals
+def place_name(key, level_type):
+    """Display name of a place key: 'State', or 'District (State)' for 'District|State'"""
+    return key.replace('|', ' (') + ')' if level_type == 'district' else key
+
+def place_detail(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+                 month=None, weighted=False):
+    """Every place's partners, largest flow first, for one filter set across all of India (cached)"""
+    key = (migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason)
+    detail = place_cache.get(key + (month, weighted))
+    if detail is None:
+        od = od_cache.get(key + (None, month, weighted))
+        if od is None:
+            with span('update_place_detail', 'matrix'):
+                od = od_matrix(aggregate_flows(*key, callback='update_place_detail', month=month, weighted=weighted),
+                               level_type)
+            od_cache.put(key + (None, month, weighted), od)
+        with span('update_place_detail', 'rank'):
+            detail = PlaceDetail(od)
+        place_cache.put(key + (month, weighted), detail)
+    return detail
+
+def flow_keys(agg_df, level_type):
+    """Centroid lookup keys for the origin and destination of each flow"""
     if level_type == 'state':
-        agg_df = df.groupby(['origin', 'destination'], observed=True)['unique_id'].nunique().reset_index()
-        agg_df.columns = ['origin', 'destination', 'count']
-        centroids_dict = state_centroids_dict
-        geojson = json.loads(state_gdf.to_json())
-    else:
-        # For district level, need to track both district and state
-        agg_df = df.groupby(['origin_district', 'destination_district', 'origin', 'destination'], observed=True)['unique_id'].nunique().reset_index()
-        agg_df.columns = ['origin', 'destination', 'origin_state', 'destination_state', 'count']
-        centroids_dict = district_centroids_dict
-        geojson = json.loads(district_gdf.to_json())
+        return agg_df['origin'].astype(str), agg_df['destination'].astype(str)
+    return (agg_df['origin'].astype(str) + '|' + agg_df['origin_state'].astype(str),
+            agg_df['destination'].astype(str) + '|' + agg_df['destination_state'].astype(str))
+
+def build_map(migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+              flow_limit, map_style='flows', viewport=None, month=None, weighted=False):
+    """Compute the map figure and info panel for one set of filters
+
+    With a viewport, only flows starting or ending at a visible place (and the
+    boundaries in view) are computed and drawn. With a month, the flows are
+    that month's, from the precomputed frames. With weighted, flows are
+    survey-weighted population estimates.
+    """
+    places = visible = None
+    if viewport is not None:
+        with span('update_map', 'viewport'):
+            places = place_index[level_type].query(viewport_bbox(viewport))
+            visible = [place_keys[level_type][i] for i in places]
+        count('update_map', 'places_visible', len(visible))
+
+    agg_df = aggregate_flows(migration_status, level_type, breakdown_type, breakdown_value, caste_filter,
+                             migration_reason, visible, month=month, weighted=weighted)
+
+    if visible is not None:
+        with span('update_map', 'cull'):
+            origin_keys, dest_keys = flow_keys(agg_df, level_type)
+            agg_df = agg_df[(origin_keys.isin(visible) | dest_keys.isin(visible)).to_numpy()].reset_index(drop=True)
+
+    key = (migration_status, level_type, breakdown_type, breakdown_value, caste_filter, migration_reason,
+           flow_limit, map_style, viewport, month, weighted)
+    if map_style != 'flows':
+        od = od_cache.get(key[:6] + (viewport, month, weighted))
+        if od is None:
+            with span('update_map', 'matrix'):
+                od = od_matrix(agg_df, level_type)
+            od_cache.put(key[:6] + (viewport, month, weighted), od)
+        fig, info = build_choropleth(od, level_type, map_style, migration_status, places, viewport, month, weighted)
+        return finish_map(fig, info, key, hint="Hover over a place to see its inflow, outflow and net migration; "
+                                                   "click it for its largest origins and destinations.")
+
+    # Boundaries are added in the browser from the cached base map (layout.meta.basemap)
+    centroids_dict = state_centroids_dict if level_type == 'state' else district_centroids_dict
+
+    checkpoint()
 
     # Create figure
     fig = go.Figure()
 
-    # Add boundaries
-    for feature in geojson['features']:
-        if feature['geometry']['type'] == 'Polygon':
-            coords = feature['geometry']['coordinates'][0]
-            lons, lats = zip(*coords)
+    # Keep the largest drawable flows; the long tail is bundled or summarised in the info text
+    with span('update_map', 'select'):
+        origin_keys, dest_keys = flow_keys(agg_df, level_type)
+        origin_points = origin_keys.map(centroids_dict)
+        dest_points = dest_keys.map(centroids_dict)
+        drawable = np.flatnonzero((origin_points.notna() & dest_points.notna() &
+                                   (origin_points != dest_points) & (agg_df['count'] > 0)).to_numpy())
+        drawable_counts = agg_df['count'].to_numpy()[drawable]
+        top_k, share = parse_flow_limit(flow_limit)
+        bundles = None
+        if level_type == 'district' and bundles_flows(flow_limit):
+            # District flows outside the top half are merged per (origin state, destination state)
+            state_pairs = (agg_df['origin_state'].astype(str) + '|' +
+                           agg_df['destination_state'].astype(str)).to_numpy()[drawable]
+            pair_codes, pair_names = pd.factorize(state_pairs)
+            kept, bundles, covered = bundle_flows(drawable_counts, pair_codes,
+                                                  np.array(origin_points.iloc[drawable].tolist()),
+                                                  np.array(dest_points.iloc[drawable].tolist()), top_k)
+        else:
+            kept = covered = select_flows(drawable_counts, top_k, share)
+            # A zoomed-out view of districts leaves out the flows too small to see at that scale
+            min_share = detail_min_share(viewport) if viewport is not None and level_type == 'district' else 0.0
+            if min_share and len(kept):
+                visible_detail = drawable_counts[kept] >= min_share * drawable_counts[kept[0]]
+                count('update_map', 'flows_below_detail', int((~visible_detail).sum()))
+                kept = covered = kept[visible_detail]
+        tail = tail_summary(drawable_counts, covered)
+        selected = drawable[kept]
+
+    # Great-circle paths and arrows, cached per OD pair; bundles have their own endpoints
+    with span('update_map', 'arcs'):
+        paths, arrows = arc_stores[level_type].lookup(
+            origin_keys.iloc[selected].map(place_ids[level_type]).to_numpy(),
+            dest_keys.iloc[selected].map(place_ids[level_type]).to_numpy(),
+            np.array(origin_points.iloc[selected].tolist()).reshape(-1, 2),
+            np.array(dest_points.iloc[selected].tolist()).reshape(-1, 2))
+
+        # Flows to draw: paths, arrows (lat, lon, bearing), counts, hover labels and whether bundled
+        flow_counts = agg_df['count'].to_numpy()[selected]
+        labels = [[place_name(o, level_type), place_name(d, level_type)]
+                  for o, d in zip(origin_keys.iloc[selected], dest_keys.iloc[selected])]
+        flow_bundled = np.zeros(len(selected), dtype=bool)
+        if bundles is not None and len(bundles['count']):
+            bundle_paths, bundle_arrows = arc_paths(bundles['origin'], bundles['destination'])
+            paths, arrows = np.concatenate([paths, bundle_paths]), np.concatenate([arrows, bundle_arrows])
+            flow_counts = np.concatenate([flow_counts, bundles['count']])
+            labels += [[f"{origin} ({members:,} smaller flows)", destination]
+                       for (origin, destination), members in
+                       zip((pair.split('|') for pair in pair_names[bundles['group']]), bundles['members'])]
+            flow_bundled = np.concatenate([flow_bundled, np.ones(len(bundles['count']), dtype=bool)])
+
+    checkpoint()
+
+    # All flow lines in one NaN-separated trace (bundles in a second, orange one) and all
+    # arrows in one marker trace sized by count; hovering an arrow describes its flow
+    with span('update_map', 'flows'):
+        if len(flow_counts):
+            for bundled, color in [(False, '#FF6B6B'), (True, '#ED8936')]:
+                rows = np.flatnonzero(flow_bundled == bundled)
+                if len(rows):
+                    lat, lon = join_paths(paths[rows])
+                    fig.add_trace(go.Scattergeo(
+                        lon=lon,
+                        lat=lat,
+                        mode='lines',
+                        line=dict(width=1.5, color=color),
+                        hoverinfo='skip',
+                        showlegend=False,
+                        opacity=0.5,
+                        name='Bundled flows' if bundled else 'Flows'
+                    ))
+
+            # Arrow size follows the flow's count on a logarithmic scale
+            scale = np.log1p(flow_counts) / np.log1p(flow_counts.max())
+            arrows = arrows.astype(np.float64).round(4)
             fig.add_trace(go.Scattergeo(
-                lon=lons,
-                lat=lats,
-                mode='lines',
-                line=dict(width=1, color='#95a5a6' if level_type == 'district' else '#667eea'),
-                hoverinfo='skip',
-                showlegend=False
+                lon=arrows[:, 1],
+                lat=arrows[:, 0],
+                mode='markers',
+                marker=dict(
+                    size=np.clip(scale * 12, 4, 12).round(1),
+                    color=np.where(flow_bundled, '#ED8936', '#FF6B6B').tolist(),
+                    symbol='triangle-up',
+                    angle=arrows[:, 2].round(1)
+                ),
+                customdata=[label + [int(c)] for label, c in zip(labels, flow_counts)],
+                hovertemplate='%{customdata[0]} → %{customdata[1]}<br>%{customdata[2]:,} migrants<extra></extra>',
+                showlegend=False,
+                opacity=0.7,
+                name='Flow arrows'
+            ))
+
+    count('update_map', 'flows_drawn', len(flow_counts))
+    checkpoint()
+
+    # Place markers carry only their id and totals; clicking one asks the server for its partners
+    with span('update_map', 'markers'):
+        od = od_cache.get(key[:6] + (viewport, month, weighted))
+        if od is None:
+            od = od_matrix(agg_df, level_type)
+            od_cache.put(key[:6] + (viewport, month, weighted), od)
+        inflow, outflow = od.inflow(), od.outflow()
+        shown = np.flatnonzero(inflow + outflow > 0)
+        if places is not None:
+            shown = np.intersect1d(shown, places)
+        if len(shown):
+            points = np.array([centroids_dict[place_keys[level_type][i]] for i in shown])
+            marker = (dict(size=10, color='#667eea', line=dict(width=2, color='white')) if level_type == 'state'
+                      else dict(size=4, color='#667eea', opacity=0.6, line=dict(width=0.5, color='white')))
+            fig.add_trace(go.Scattergeo(
+                lon=points[:, 1],
+                lat=points[:, 0],
+                mode='markers',
+                marker=marker,
+                text=[place_name(place_keys[level_type][i], level_type) for i in shown],
+                customdata=np.column_stack([shown, inflow[shown], outflow[shown]]),
+                hovertemplate=('<b>%{text}</b><br>Inflows: %{customdata[1]:,} migrants<br>'
+                               'Outflows: %{customdata[2]:,} migrants<extra></extra>'),
+                showlegend=False,
+                name='Migration Points'
             ))
-        elif feature['geometry']['type'] == 'MultiPolygon':
-            for polygon in feature['geometry']['coordinates']:
-                coords = polygon[0]
-                lons, lats = zip(*coords)
-                fig.add_trace(go.Scattergeo(
-                    lon=lons,
-                    lat=lats,
-                    mode='lines',
-                    line=dict(width=1, color='#95a5a6' if level_type == 'district' else '#667eea'),
-                    hoverinfo='skip',
-                    showlegend=False
-                ))
-
-    # Add migration flow lines with arrow indicators
-    if len(agg_df) > 0:
-        max_count = agg_df['count'].max()
-
-        for _, row in agg_df.iterrows():
-            if level_type == 'state':
-                origin_coords = centroids_dict.get(row['origin'])
-                dest_coords = centroids_dict.get(row['destination'])
-            else:
-                origin_key = f"{row['origin']}|{row['origin_state']}"
-                dest_key = f"{row['destination']}|{row['destination_state']}"
-                origin_coords = centroids_dict.get(origin_key)
-                dest_coords = centroids_dict.get(dest_key)
-
-            if origin_coords and dest_coords and row['count'] > 0:
-                # Skip self-loops
-                if origin_coords == dest_coords:
-                    continue
-
-                # Calculate line width (logarithmic scale)
-                width = max(0.5, (np.log1p(row['count']) / np.log1p(max_count)) * 8)
-
-                # Add flow line
-                fig.add_trace(go.Scattergeo(
-                    lon=[origin_coords[1], dest_coords[1]],
-                    lat=[origin_coords[0], dest_coords[0]],
-                    mode='lines',
-                    line=dict(width=width, color='#FF6B6B'),
-                    hoverinfo='skip',
-                    showlegend=False,
-                    opacity=0.5
-                ))
-
-                # Add small arrow marker near the destination to show direction
-                # Calculate position 80% along the line for arrow placement
-                arrow_lat = origin_coords[0] + 0.8 * (dest_coords[0] - origin_coords[0])
-                arrow_lon = origin_coords[1] + 0.8 * (dest_coords[1] - origin_coords[1])
-
-                # Calculate arrow size based on line width
-                arrow_size = max(4, min(width * 1.5, 12))
-
-                fig.add_trace(go.Scattergeo(
-                    lon=[arrow_lon],
-                    lat=[arrow_lat],
-                    mode='markers',
-                    marker=dict(
-                        size=arrow_size,
-                        color='#FF6B6B',
-                        symbol='triangle-up',
-                        angle=np.degrees(np.arctan2(dest_coords[1] - origin_coords[1],
-                                                    dest_coords[0] - origin_coords[0]))
-                    ),
-                    hoverinfo='skip',
-                    showlegend=False,
-                    opacity=0.7
-                ))
-
-    # Add interactive points showing both origins and destinations
-    if len(agg_df) > 0:
-        if level_type == 'state':
-            # Group by destination to show all origins (inflows/sources)
-            dest_summary = agg_df.groupby('destination').apply(
-                lambda x: pd.Series({
-                    'total_migrants': x['count'].sum(),
-                    'origins': '<br>'.join([f"From {row['origin']}: {row['count']:,}" for _, row in x.iterrows()]),
-                    'destination': x.name,
-                    'lat': centroids_dict.get(x.name, [0, 0])[0],
-                    'lon': centroids_dict.get(x.name, [0, 0])[1]
-                }), include_groups=False
-            ).reset_index(drop=True)
-
-            # Group by origin to show all destinations (outflows)
-            origin_summary = agg_df.groupby('origin').apply(
-                lambda x: pd.Series({
-                    'total_migrants': x['count'].sum(),
-                    'destinations': '<br>'.join([f"To {row['destination']}: {row['count']:,}" for _, row in x.iterrows()]),
-                    'origin': x.name,
-                    'lat': centroids_dict.get(x.name, [0, 0])[0],
-                    'lon': centroids_dict.get(x.name, [0, 0])[1]
-                }), include_groups=False
-            ).reset_index(drop=True)
-
-            # Combine hover info - show both From and To information
-            combined_hover = []
-            for place in state_centroids_dict.keys():
-                dest_info = dest_summary[dest_summary['destination'] == place]
-                origin_info = origin_summary[origin_summary['origin'] == place]
-
-                if not dest_info.empty or not origin_info.empty:
-                    hover_text = f"<b>{place}</b><br>"
-
-                    if not dest_info.empty:
-                        hover_text += f"<br><b>Inflows:</b> {dest_info.iloc[0]['total_migrants']:,} migrants<br>{dest_info.iloc[0]['origins']}"
-
-                    if not origin_info.empty:
-                        if not dest_info.empty:
-                            hover_text += "<br>"
-                        hover_text += f"<br><b>Outflows:</b> {origin_info.iloc[0]['total_migrants']:,} migrants<br>{origin_info.iloc[0]['destinations']}"
-
-                    combined_hover.append({
-                        'place': place,
-                        'lat': centroids_dict.get(place, [0, 0])[0],
-                        'lon': centroids_dict.get(place, [0, 0])[1],
-                        'text': hover_text
-                    })
-
-            if combined_hover:
-                combined_df = pd.DataFrame(combined_hover)
-                fig.add_trace(go.Scattergeo(
-                    lon=combined_df['lon'],
-                    lat=combined_df['lat'],
-                    mode='markers',
-                    marker=dict(size=10, color='#667eea', line=dict(width=2, color='white')),
-                    text=combined_df['text'].tolist(),
-                    hoverinfo='text',
-                    showlegend=False,
-                    name='Migration Points'
-                ))
-        else:
-            # District level - more subtle dots
-            dest_summary = agg_df.groupby(['destination', 'destination_state']).apply(
-                lambda x: pd.Series({
-                    'total_migrants': x['count'].sum(),
-                    'origins': '<br>'.join([f"From {row['origin']} ({row['origin_state']}): {row['count']:,}"
-                                           for _, row in x.iterrows()]),
-                    'destination': x.name[0],
-                    'destination_state': x.name[1],
-                    'lat': centroids_dict.get(f"{x.name[0]}|{x.name[1]}", [0, 0])[0],
-                    'lon': centroids_dict.get(f"{x.name[0]}|{x.name[1]}", [0, 0])[1]
-                }), include_groups=False
-            ).reset_index(drop=True)
-
-            origin_summary = agg_df.groupby(['origin', 'origin_state']).apply(
-                lambda x: pd.Series({
-                    'total_migrants': x['count'].sum(),
-                    'destinations': '<br>'.join([f"To {row['destination']} ({row['destination_state']}): {row['count']:,}"
-                                                for _, row in x.iterrows()]),
-                    'origin': x.name[0],
-                    'origin_state': x.name[1],
-                    'lat': centroids_dict.get(f"{x.name[0]}|{x.name[1]}", [0, 0])[0],
-                    'lon': centroids_dict.get(f"{x.name[0]}|{x.name[1]}", [0, 0])[1]
-                }), include_groups=False
-            ).reset_index(drop=True)
-
-            # Combine hover info for districts
-            combined_hover = []
-            for key in district_centroids_dict.keys():
-                parts = key.split('|')
-                if len(parts) == 2:
-                    district, state = parts
-                    dest_info = dest_summary[(dest_summary['destination'] == district) &
-                                            (dest_summary['destination_state'] == state)]
-                    origin_info = origin_summary[(origin_summary['origin'] == district) &
-                                                 (origin_summary['origin_state'] == state)]
-
-                    if not dest_info.empty or not origin_info.empty:
-                        hover_text = f"<b>{district}</b> ({state})<br>"
-
-                        if not dest_info.empty:
-                            hover_text += f"<br><b>Inflows:</b> {dest_info.iloc[0]['total_migrants']:,} migrants<br>{dest_info.iloc[0]['origins']}"
-
-                        if not origin_info.empty:
-                            if not dest_info.empty:
-                                hover_text += "<br>"
-                            hover_text += f"<br><b>Outflows:</b> {origin_info.iloc[0]['total_migrants']:,} migrants<br>{origin_info.iloc[0]['destinations']}"
-
-                        combined_hover.append({
-                            'place': f"{district} ({state})",
-                            'lat': district_centroids_dict[key][0],
-                            'lon': district_centroids_dict[key][1],
-                            'text': hover_text
-                        })
-
-            if combined_hover:
-                combined_df = pd.DataFrame(combined_hover)
-                fig.add_trace(go.Scattergeo(
-                    lon=combined_df['lon'],
-                    lat=combined_df['lat'],
-                    mode='markers',
-                    marker=dict(size=4, color='#667eea', opacity=0.6, line=dict(width=0.5, color='white')),
-                    text=combined_df['text'].tolist(),
-                    hoverinfo='text',
-                    showlegend=False,
-                    name='Migration Points'
-                ))
 
     # Update layout
-    fig.update_geos(
-        scope='asia',
-        center=dict(lat=23.5, lon=80.0),
-        projection_scale=4,
-        showcountries=False,
-        showland=True,
-        landcolor='#E8F4F8',
-        showlakes=False,
-        fitbounds='locations'
-    )
-
-    fig.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        height=700,
-        geo=dict(bgcolor='#f5f7fa'),
-        hoverlabel=dict(
-            bgcolor='white',
-            font_size=13,
-            font_family='Segoe UI'
+    with span('update_map', 'layout'):
+        fig.update_geos(
+            scope='asia',
+            center=dict(lat=23.5, lon=80.0),
+            projection_scale=4,
+            showcountries=False,
+            showland=True,
+            landcolor='#E8F4F8',
+            showlakes=False,
+            # In visible-area mode the view is the user's: keep it across updates
+            fitbounds='locations' if viewport is None else False
+        )
+
+        fig.update_layout(
+            meta={'basemap': basemap_urls.get(level_type)},
+            uirevision='viewport' if viewport is not None else None,
+            margin=dict(l=0, r=0, t=0, b=0),
+            height=700,
+            geo=dict(bgcolor='#f5f7fa'),
+            hoverlabel=dict(
+                bgcolor='white',
+                font_size=13,
+                font_family='Segoe UI'
+            )
         )
-    )
 
     # Info text
     total_migrants = agg_df['count'].sum()
     num_flows = len(agg_df)
-    info = f"Showing {migration_status.lower()} patterns at {level_type} level. "
-    info += f"Total unique migrants: {total_migrants:,} across {num_flows:,} migration flows. "
+    info = f"Showing {migration_status.lower()} patterns at {level_type} level"
+    info += f" in {month}. " if month else ". "
+    if visible is not None:
+        info += f"Only flows to or from the {len(visible):,} {level_type}s in view are included. "
+    if weighted:
+        info += f"Estimated migrants (survey-weighted): {total_migrants:,} across {num_flows:,} migration flows. "
+    else:
+        info += f"Total unique migrants: {total_migrants:,} across {num_flows:,} migration flows. "
+    if bundles is not None and len(bundles['count']):
+        info += (f"Drawing the {len(selected):,} largest flows as they are and {len(bundles['count']):,} "
+                 f"orange state-pair bundles standing for {int(bundles['members'].sum()):,} smaller flows "
+                 f"({int(bundles['count'].sum()):,} migrants). ")
+        if tail['flows']:
+            info += (f"The other {tail['flows']:,} flows ({tail['migrants']:,} migrants, {tail['share']:.1%}) "
+                     f"are included in the totals and place details only. ")
+    elif tail['flows']:
+        info += (f"Drawing the {len(selected):,} largest flows; the other {tail['flows']:,} flows "
+                 f"({tail['migrants']:,} migrants, {tail['share']:.1%}) are included in the totals and place details only. ")
+
+    return finish_map(fig, info, key)
+
+def od_matrix(agg_df, level_type):
+    """Sparse OD matrix over place_keys[level_type] for one aggregate"""
+    origin_keys, dest_keys = flow_keys(agg_df, level_type)
+    ids = place_ids[level_type]
+    return ODMatrix(origin_keys.map(ids).fillna(-1).to_numpy(dtype=np.int64),
+                    dest_keys.map(ids).fillna(-1).to_numpy(dtype=np.int64),
+                    agg_df['count'].to_numpy(), len(place_keys[level_type]))
+
+def choropleth_geojson(level_type):
+    """URL of the cached choropleth polygons, or the polygons themselves if the asset is missing"""
+    if level_type in choropleth_urls:
+        return choropleth_urls[level_type]
+    cache_key = f'{level_type}_features'
+    if cache_key not in boundary_cache:
+        shapes = boundaries[level_type]
+        boundary_cache[cache_key] = shapes.geojson(boundary_keys(shapes.attributes, level_type).tolist())
+    return boundary_cache[cache_key]
+
+def build_choropleth(od, level_type, map_style, migration_status, places=None, viewport=None, month=None,
+                     weighted=False):
+    """One Choropleth trace of inflow, outflow or net migration (optionally per 1,000 surveyed)
+
+    With weighted, the flows are population estimates and rates are per 1,000
+    of the survey-weighted population.
+    """
+    measure, _, rate = map_style.partition('_')
+    with span('update_map', 'choropleth'):
+        inflow, outflow = od.inflow(), od.outflow()
+        values = {'inflow': inflow, 'outflow': outflow, 'net': inflow - outflow}[measure].astype(np.float64)
+        members = (population if weighted else surveyed)[level_type]
+        if rate:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.where(members > 0, values / members * 1000, np.nan)
+
+        shown = (inflow + outflow > 0) & np.isfinite(values)
+        if places is not None:
+            in_view = np.zeros(len(shown), dtype=bool)
+            in_view[places] = True
+            shown &= in_view
+        shown = np.flatnonzero(shown)
+
+        keys = [place_keys[level_type][i] for i in shown]
+        names = [place_name(k, level_type) for k in keys]
+        text = [f"<b>{name}</b><br>Inflow: {inflow[i]:,}<br>Outflow: {outflow[i]:,}<br>"
+                f"Net: {inflow[i] - outflow[i]:+,}" +
+                (f"<br>{'Population' if weighted else 'Surveyed members'}: {members[i]:,.0f}" if rate else '')
+                for name, i in zip(names, shown)]
+
+        label = next(o['label'] for o in MAP_STYLE_OPTIONS if o['value'] == map_style)
+        colors = {'inflow': 'Blues', 'outflow': 'Reds', 'net': 'RdBu'}[measure]
+        fig = go.Figure(go.Choropleth(
+            geojson=choropleth_geojson(level_type),
+            locations=keys,
+            z=values[shown].round(2),
+            colorscale=colors,
+            zmid=0 if measure == 'net' else None,
+            marker=dict(line=dict(width=0.5, color='white')),
+            colorbar=dict(title=dict(text=label), thickness=14),
+            text=text,
+            customdata=shown,
+            hoverinfo='text'
+        ))
+        fig.update_geos(
+            scope='asia',
+            center=dict(lat=23.5, lon=80.0),
+            projection_scale=4,
+            showcountries=False,
+            showland=True,
+            landcolor='#E8F4F8',
+            showlakes=False,
+            fitbounds='locations' if viewport is None else False
+        )
+        fig.update_layout(
+            uirevision='viewport' if viewport is not None else None,
+            margin=dict(l=0, r=0, t=0, b=0),
+            height=700,
+            geo=dict(bgcolor='#f5f7fa'),
+            hoverlabel=dict(bgcolor='white', font_size=13, font_family='Segoe UI')
+        )
+
+    info = f"Showing {label.lower()} from {migration_status.lower()} records"
+    info += f" in {month}" if month else ""
+    info += f" by {level_type}, for {len(shown):,} places. "
+    info += (f"{'Estimated migrants (survey-weighted)' if weighted else 'Total unique migrants'}: "
+             f"{int(od.data.sum()):,} across {od.nnz:,} migration flows. ")
+    if rate and weighted:
+        info += "Rates are per 1,000 residents of the place, from the survey-weighted population. "
+    elif rate:
+        info += "Rates are per 1,000 surveyed household members living in the place. "
+    return fig, info
+
+def finish_map(fig, info, key, hint="Hover over points (blue dots) to see inflow and outflow totals; "
+                                    "click one for its largest origins and destinations."):
+    """Add the filter summary and info panel to a map, and cache the result under its filter key"""
+    breakdown_type, breakdown_value, caste_filter, migration_reason = key[2:6]
 
     filters_applied = []
     if breakdown_type != 'overall' and breakdown_value:
@@ -651,7 +1418,9 @@ def update_map(migration_status, level_type, breakdown_type, breakdown_value, ca
     if filters_applied:
         info += f"Filters: {', '.join(filters_applied)}"
 
-    return fig, html.Div([
+    count('update_map', 'traces_emitted', len(fig.data))
+
+    info_div = html.Div([
         html.H3("Dashboard Information", style={
             'color': '#2d3748',
             'marginBottom': '16px',
@@ -667,7 +1436,7 @@ def update_map(migration_status, level_type, breakdown_type, breakdown_value, ca
             'lineHeight': '1.6',
             'marginTop': '16px'
         }),
-        html.P(f"Hover over points (blue dots) to see migration inflows and outflows for each location.",
+        html.P(hint,
                style={
                    'marginTop': '12px',
                    'fontSize': '14px',
@@ -710,9 +1479,70 @@ def update_map(migration_status, level_type, breakdown_type, breakdown_value, ca
         ])
     ])
 
+    # Store the figure as a plain dict: Dash would otherwise deep-copy it on every response
+    figure = fig.to_dict()
+    layout = hashlib.md5(json.dumps(figure['layout'], sort_keys=True).encode()).hexdigest()[:12]
+    result = (figure, info_div, layout)
+    figure_cache.put(key, result)
+    guard.check()
+    return result
+
+def serve(host, port, workers, threads, timeout):
+    """Run the app under gunicorn, sharing the already-loaded data with forked workers"""
+    from flask_compress import Compress
+    from gunicorn.app.base import BaseApplication
+
+    # Compress JSON callback responses and let browsers cache static assets for a year
+    app.server.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html', 'text/css',
+                                               'application/javascript', 'text/plain']
+    app.server.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000
+    Compress(app.server)
+
+    class DashApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return app.server
+
+    # Each worker opens its own DuckDB connection on first query instead of inheriting the master's
+    if hasattr(engine, 'close'):
+        engine.close()
+
+    # Data is loaded at import, before forking; freezing it keeps the garbage
+    # collector from touching (and un-sharing) those pages in every worker
+    gc.collect()
+    gc.freeze()
+    DashApplication().run()
+
 if __name__ == '__main__':
-    print("\n" + "="*60)
-    print("Starting Migration Dashboard...")
-    print("Open http://localhost:8050 in your browser")
-    print("="*60 + "\n")
-    app.run_server(debug=True, port=8050)
+    parser = argparse.ArgumentParser(description='India Migration Patterns Dashboard')
+    subcommands = parser.add_subparsers(dest='command')
+    run_parser = subcommands.add_parser('run', help='development server (default)')
+    run_parser.add_argument('--port', type=int, default=8050)
+    run_parser.add_argument('--debug', action='store_true', help='enable the reloader and Dash dev tools')
+    serve_parser = subcommands.add_parser('serve', help='production server (gunicorn)')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8050)))
+    serve_parser.add_argument('--workers', type=int, default=2,
+                              help='worker processes; each keeps its own caches within the memory budget')
+    serve_parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    serve_parser.add_argument('--timeout', type=int, default=120, help='seconds before a busy worker is restarted')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        print(f"Serving Migration Dashboard on http://{args.host}:{args.port} "
+              f"({args.workers} workers x {args.threads} threads)")
+        serve(args.host, args.port, args.workers, args.threads, args.timeout)
+    else:
+        port = getattr(args, 'port', 8050)
+        print("\n" + "="*60)
+        print("Starting Migration Dashboard...")
+        print(f"Open http://localhost:{port} in your browser")
+        print("="*60 + "\n")
+        app.run(debug=getattr(args, 'debug', False), port=port)
@@ -0,0 +1,132 @@
+"""
+Sparse origin-destination matrices
+
+ODMatrix holds the unique-migrant counts of one filter set in CSR form
+(indptr, indices, data) over a fixed place vocabulary: row i lists the
+destinations of origin i. Outflow, inflow and net migration per place are
+then O(nnz) sums, and one origin's partners are a single slice. Plain NumPy
+arrays keep it dependency-free (the layout matches scipy.sparse.csr_array).
+
+PlaceDetail ranks every row of a matrix and of its transpose once, largest
+count first, so a page of one place's top origins or destinations is a
+slice, whatever the number of flows. Moves within a place are left out of
+those rankings and reported as the place's own total.
+"""
+
+import copy
+
+import numpy as np
+
+PAGE_SIZE = 10
+
+
+class ODMatrix:
+    """Origin x destination counts in CSR form
+
+    Pairs with a negative (unknown) id are dropped; repeated pairs are summed.
+    Self-loops (moves within one place) are kept on the diagonal so that
+    outflow and inflow count them; callers drawing arcs skip them.
+    """
+
+    def __init__(self, origin_ids, dest_ids, counts, n_places):
+        origin_ids = np.asarray(origin_ids, dtype=np.int64)
+        dest_ids = np.asarray(dest_ids, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        keep = (origin_ids >= 0) & (dest_ids >= 0)
+        origin_ids, dest_ids, counts = origin_ids[keep], dest_ids[keep], counts[keep]
+
+        order = np.lexsort((dest_ids, origin_ids))
+        origin_ids, dest_ids, counts = origin_ids[order], dest_ids[order], counts[order]
+        first = np.ones(len(origin_ids), dtype=bool)
+        first[1:] = (origin_ids[1:] != origin_ids[:-1]) | (dest_ids[1:] != dest_ids[:-1])
+        starts = np.flatnonzero(first)
+
+        self.shape = (n_places, n_places)
+        self.data = np.add.reduceat(counts, starts) if len(starts) else counts
+        self.indices = dest_ids[starts].astype(np.int32)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(origin_ids[starts], minlength=n_places))])
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.indices.nbytes + self.indptr.nbytes
+
+    def outflow(self):
+        """Row sums: migrants leaving each place"""
+        totals = np.concatenate([[0], np.cumsum(self.data)])
+        return totals[self.indptr[1:]] - totals[self.indptr[:-1]]
+
+    def inflow(self):
+        """Column sums: migrants arriving at each place"""
+        return np.bincount(self.indices, weights=self.data, minlength=self.shape[1]).astype(np.int64)
+
+    def net(self):
+        """Inflow minus outflow per place"""
+        return self.inflow() - self.outflow()
+
+    def row(self, origin_id):
+        """(destination ids, counts) for one origin"""
+        start, stop = self.indptr[origin_id], self.indptr[origin_id + 1]
+        return self.indices[start:stop], self.data[start:stop]
+
+    def diagonal(self):
+        """Self-loop counts: migrants moving within each place"""
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        loops = rows == self.indices
+        return np.bincount(rows[loops], weights=self.data[loops], minlength=self.shape[0]).astype(np.int64)
+
+    def off_diagonal(self):
+        """The same matrix without self-loops"""
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        between = rows != self.indices
+        return ODMatrix(rows[between], self.indices[between], self.data[between], self.shape[0])
+
+    def transpose(self):
+        """Destination x origin counts: row j lists the origins of destination j"""
+        origin_ids = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        return ODMatrix(self.indices, origin_ids, self.data, self.shape[0])
+
+    def ranked(self):
+        """The same matrix with each row's entries ordered by count, largest first"""
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        order = np.lexsort((-self.data, rows))
+        ranked = copy.copy(self)
+        ranked.indices, ranked.data = self.indices[order], self.data[order]
+        return ranked
+
+
+class PlaceDetail:
+    """Each place's origins and destinations, largest flow first, for paging through one place at a time
+
+    Partners are other places; moves within a place are its within total,
+    which inflow and outflow include.
+    """
+
+    def __init__(self, od):
+        between = od.off_diagonal()
+        self.outgoing = between.ranked()
+        self.incoming = between.transpose().ranked()
+        self.outflow = od.outflow()
+        self.inflow = od.inflow()
+        self.within = od.diagonal()
+
+    def partner_count(self, place_id, direction):
+        """Number of places a place receives migrants from ('in') or sends them to ('out')"""
+        od = self.incoming if direction == 'in' else self.outgoing
+        return int(od.indptr[place_id + 1] - od.indptr[place_id])
+
+    def partners(self, place_id, direction, offset=0, limit=PAGE_SIZE):
+        """(partner ids, counts) of one page of a place's inflows ('in') or outflows ('out')"""
+        od = self.incoming if direction == 'in' else self.outgoing
+        start, stop = od.indptr[place_id], od.indptr[place_id + 1]
+        start = min(start + offset, stop)
+        stop = min(start + limit, stop)
+        return od.indices[start:stop], od.data[start:stop]
+
+    @property
+    def nbytes(self):
+        return (self.outgoing.nbytes + self.incoming.nbytes + self.outflow.nbytes + self.inflow.nbytes +
+                self.within.nbytes)
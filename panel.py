@@ -0,0 +1,182 @@
+"""
+Panel index: each migrant's records across survey waves
+
+CPHS reports the same household member in every wave they are surveyed
+in. The map deduplicates those records per OD pair (unique_id); PanelIndex
+links them instead. Records are sorted once by (hh_id, mem_id) and month
+with NumPy and each member is numbered in that order, so finding a member
+is a binary search (O(log n)).
+
+Per-member measures are computed once, at build time:
+- moves: reported moves, i.e. runs of records with the same status and
+  other place, in month order (a move re-reported in later waves counts once)
+- repeat migrants: more than one move
+- returned: an Immigrated move straight after an Emigrated one (the member
+  came back to the household they had left)
+- first and last move: month of the first record and of the start of the
+  last move
+
+Only integer arrays are kept: the member of each record, and for each
+filter column (status, caste category, religion, caste, reason) the record
+ids grouped by value. The members matching a set of dashboard filters are
+the intersection of those id sets, and their summary is sums over the
+measure arrays, so no records are read after the build. Trajectories are
+fetched from the query engine one member at a time.
+"""
+
+import numpy as np
+import pandas as pd
+
+MONTH_FORMAT = '%b %Y'
+TRAJECTORY_COLUMNS = ['month_slot', 'mem_status', 'state', 'matched_district', 'emigrated_immigrated_state',
+                      'emigrated_immigrated_district', 'emigration_immigration_reason']
+# Columns the dashboard filters on, with the filter that sets each
+FILTER_COLUMNS = {
+    'mem_status': 'migration_status',
+    'caste_category': 'caste_category',
+    'religion': 'religion',
+    'caste': 'caste_filter',
+    'emigration_immigration_reason': 'migration_reason',
+}
+
+
+def month_numbers(month_slot):
+    """Months since year 0 for 'Mon YYYY' labels (-1 where unparseable), so slots sort chronologically"""
+    dates = pd.to_datetime(pd.Series(month_slot).astype(str), format=MONTH_FORMAT, errors='coerce')
+    months = dates.dt.year * 12 + dates.dt.month - 1
+    return months.fillna(-1).to_numpy(dtype=np.int64)
+
+
+class PanelIndex:
+    """Members sorted by (hh_id, mem_id), with per-member move measures and per-filter record ids
+
+    records needs hh_id, mem_id, month_slot, mem_status, the other place
+    (emigrated_immigrated_state/district) and the FILTER_COLUMNS; none of it
+    is kept. member_records(hh_id, mem_id) returns one member's records, like
+    engine.member_records, for trajectories.
+    """
+
+    def __init__(self, records, member_records=None):
+        self._member_records = member_records
+        hh_id = records['hh_id'].to_numpy(dtype=np.int64)
+        mem_id = records['mem_id'].to_numpy(dtype=np.int64)
+        self._mem_base = int(mem_id.max()) + 1 if len(mem_id) else 1
+        keys = hh_id * self._mem_base + mem_id
+        month = month_numbers(records['month_slot'])
+        emigrated = (records['mem_status'].astype(str) == 'Emigrated').to_numpy()
+        away = pd.factorize(records['emigrated_immigrated_district'].astype(str) + '|' +
+                            records['emigrated_immigrated_state'].astype(str))[0]
+
+        # Record ids of each filter value: ids sorted by value code, split by offsets
+        self._filters = {}
+        for column in FILTER_COLUMNS:
+            codes, values = pd.factorize(records[column].astype(str))
+            order = np.argsort(codes, kind='stable').astype(np.int32)
+            offsets = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            self._filters[column] = ({value: code for code, value in enumerate(values)}, order, offsets)
+
+        order = np.lexsort((month, keys))
+        keys, month, emigrated, away = keys[order], month[order], emigrated[order], away[order]
+
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        starts = np.flatnonzero(first)
+        self.keys = keys[starts]
+        # Member index of each record, in the order records came in
+        self.record_member = np.empty(len(keys), dtype=np.int32)
+        self.record_member[order] = np.cumsum(first) - 1
+
+        # A new move starts at each member's first record and wherever status or other place changes
+        same_member = ~first
+        new_move = first.copy()
+        new_move[1:] |= (emigrated[1:] != emigrated[:-1]) | (away[1:] != away[:-1])
+        came_back = np.zeros(len(keys), dtype=bool)
+        came_back[1:] = same_member[1:] & new_move[1:] & ~emigrated[1:] & emigrated[:-1]
+        new_month = first.copy()
+        new_month[1:] |= month[1:] != month[:-1]
+
+        if len(keys):
+            self.moves = np.add.reduceat(new_move.astype(np.int32), starts)
+            self.waves = np.add.reduceat(new_month.astype(np.int32), starts)
+            self.returned = np.add.reduceat(came_back.astype(np.int32), starts) > 0
+            last_move = np.maximum.reduceat(np.where(new_move, np.arange(len(keys)), -1), starts)
+            self.first_month = month[starts]
+            self.last_move_month = month[last_move]
+        else:
+            self.moves = self.waves = np.zeros(0, dtype=np.int32)
+            self.returned = np.zeros(0, dtype=bool)
+            self.first_month = self.last_move_month = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, hh_id, mem_id):
+        """Member index for (hh_id, mem_id), or -1"""
+        return int(self.members([hh_id], [mem_id])[0])
+
+    def members(self, hh_ids, mem_ids):
+        """Member index of each (hh_id, mem_id) pair, -1 where unknown"""
+        hh_ids = np.asarray(hh_ids, dtype=np.int64)
+        mem_ids = np.asarray(mem_ids, dtype=np.int64)
+        keys = hh_ids * self._mem_base + mem_ids
+        if not len(self.keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = (self.keys[found] == keys) & (mem_ids >= 0) & (mem_ids < self._mem_base)
+        return np.where(hit, found, -1)
+
+    def matching(self, migration_status, breakdown_type=None, breakdown_value=None, caste_filter=None,
+                 migration_reason=None):
+        """Member indices with a record matching the dashboard filters (like engine.records)"""
+        values = {'migration_status': migration_status, 'caste_filter': caste_filter or None,
+                  'migration_reason': migration_reason or None}
+        if breakdown_type in ('caste_category', 'religion') and breakdown_value:
+            values[breakdown_type] = breakdown_value
+        sets = []
+        for column, name in FILTER_COLUMNS.items():
+            if values.get(name) is None:
+                continue
+            codes, order, offsets = self._filters[column]
+            code = codes.get(values[name])
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            sets.append(order[offsets[code]:offsets[code + 1]])
+        # Smallest set first, so each intersection is at most its size
+        sets.sort(key=len)
+        rows = sets[0] if sets else np.arange(len(self.record_member))
+        for ids in sets[1:]:
+            rows = np.intersect1d(rows, ids, assume_unique=True)
+        return np.unique(self.record_member[rows]).astype(np.int64)
+
+    def trajectory(self, hh_id, mem_id):
+        """One member's records in month order (empty if unknown)"""
+        if self.find(hh_id, mem_id) < 0 or self._member_records is None:
+            return pd.DataFrame(columns=TRAJECTORY_COLUMNS)
+        records = self._member_records(hh_id, mem_id)
+        order = np.argsort(month_numbers(records['month_slot']), kind='stable')
+        columns = [col for col in TRAJECTORY_COLUMNS if col in records.columns]
+        return records.iloc[order][columns].reset_index(drop=True)
+
+    def summary(self, members=None):
+        """Move measures over the given member indices (all members by default)"""
+        if members is None:
+            members = np.arange(len(self))
+        members = np.unique(np.asarray(members, dtype=np.int64))
+        members = members[members >= 0]
+        n = len(members)
+        span = self.last_move_month[members] - self.first_month[members]
+        repeat = self.moves[members] > 1
+        return {
+            'migrants': n,
+            'repeat_migrants': int(repeat.sum()),
+            'returned': int(self.returned[members].sum()),
+            'several_waves': int((self.waves[members] > 1).sum()),
+            'mean_moves': float(self.moves[members].mean()) if n else 0.0,
+            'median_months_between_moves': float(np.median(span[repeat])) if repeat.any() else None,
+        }
+
+    @property
+    def nbytes(self):
+        filters = sum(order.nbytes + offsets.nbytes for _, order, offsets in self._filters.values())
+        return (self.keys.nbytes + self.record_member.nbytes + filters + self.moves.nbytes + self.waves.nbytes +
+                self.returned.nbytes + self.first_month.nbytes + self.last_move_month.nbytes)
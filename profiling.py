@@ -0,0 +1,179 @@
+"""
+Opt-in instrumentation for the dashboard callbacks
+
+Enable with MIGRATION_PROFILE=1. Callback stages are timed with span(), work
+done is recorded with count(), and both are served in Prometheus text format
+at /metrics. /debug/profile?capture=N arms cProfile for the next N callback
+calls and /debug/profile returns the captured reports. Both endpoints only
+answer requests from localhost.
+
+When disabled, span() hands back a shared no-op context manager, count()
+returns immediately, instrument() leaves callbacks untouched and no routes
+are registered.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+ENABLED = os.environ.get('MIGRATION_PROFILE', '') not in ('', '0')
+
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+MAX_CAPTURES = 20
+
+_lock = threading.Lock()
+_stage_seconds = defaultdict(float)
+_stage_calls = defaultdict(int)
+_counters = defaultdict(int)
+_captures = deque(maxlen=MAX_CAPTURES)
+_pending_captures = 0
+_null_span = nullcontext()
+
+
+@contextmanager
+def _timed_span(callback, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(callback, stage, time.perf_counter() - start)
+
+
+def span(callback, stage):
+    """Time one stage of a callback"""
+    if not ENABLED:
+        return _null_span
+    return _timed_span(callback, stage)
+
+
+def observe(callback, stage, seconds):
+    """Record seconds spent in a stage that is not a single block of code (e.g. waiting in a queue)"""
+    if not ENABLED:
+        return
+    with _lock:
+        _stage_seconds[(callback, stage)] += seconds
+        _stage_calls[(callback, stage)] += 1
+
+
+def count(callback, name, value=1):
+    """Add value to the named counter of a callback"""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[(callback, name)] += int(value)
+
+
+def _take_capture():
+    global _pending_captures
+    with _lock:
+        if _pending_captures <= 0:
+            return False
+        _pending_captures -= 1
+        return True
+
+
+def instrument(callback):
+    """Decorator timing a whole callback, with cProfile capture when armed"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            count(callback, 'calls')
+            profiler = cProfile.Profile() if _take_capture() else None
+            with span(callback, 'total'):
+                if profiler is None:
+                    return func(*args, **kwargs)
+                profiler.enable()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    out = io.StringIO()
+                    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+                    with _lock:
+                        _captures.append({'callback': callback, 'args': repr(args),
+                                          'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                          'report': out.getvalue()})
+        return wrapper
+    return decorator
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    """Current spans and counters in Prometheus text exposition format"""
+    with _lock:
+        seconds = dict(_stage_seconds)
+        calls = dict(_stage_calls)
+        counters = dict(_counters)
+
+    lines = ['# HELP migration_stage_seconds Wall time spent in each callback stage',
+             '# TYPE migration_stage_seconds summary']
+    for (callback, stage), total in sorted(seconds.items()):
+        labels = f'callback="{_label(callback)}",stage="{_label(stage)}"'
+        lines.append(f'migration_stage_seconds_sum{{{labels}}} {total:.6f}')
+        lines.append(f'migration_stage_seconds_count{{{labels}}} {calls[(callback, stage)]}')
+
+    for name in sorted({name for _, name in counters}):
+        lines.append(f'# TYPE migration_{name}_total counter')
+        for (callback, counter), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'migration_{name}_total{{callback="{_label(callback)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def register(app):
+    """Add /metrics, /debug/profile and response size accounting to a Dash app"""
+    if not ENABLED:
+        return
+
+    from flask import Response, abort, request
+
+    server = app.server
+
+    def local_only():
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            abort(403)
+
+    @server.route('/metrics')
+    def metrics():
+        local_only()
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/debug/profile')
+    def debug_profile():
+        global _pending_captures
+        local_only()
+        capture = request.args.get('capture', type=int)
+        if capture:
+            with _lock:
+                _pending_captures = capture
+            return Response(f'cProfile armed for the next {capture} callback calls\n',
+                            mimetype='text/plain')
+        with _lock:
+            captures = list(_captures)
+        if not captures:
+            return Response('No captures yet, arm one with /debug/profile?capture=1\n',
+                            mimetype='text/plain')
+        body = '\n'.join(f"=== {c['time']} {c['callback']}{c['args']}\n{c['report']}"
+                         for c in reversed(captures))
+        return Response(body, mimetype='text/plain')
+
+    @server.after_request
+    def count_response_bytes(response):
+        if request.path.endswith('_dash-update-component') and not response.direct_passthrough:
+            body = request.get_json(silent=True) or {}
+            entry = app.callback_map.get(body.get('output'), {})
+            callback = getattr(entry.get('callback'), '__name__', body.get('output'))
+            count(callback, 'bytes_returned', len(response.get_data()))
+        return response
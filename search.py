@@ -0,0 +1,84 @@
+"""
+Server-side search for long dropdowns
+
+There are thousands of jatis, too many to send as dropdown options. The
+caste dropdown therefore sends what the user types (search_value) to the
+server, which answers from an OptionIndex built once per (status, caste
+category):
+
+- word prefixes: every word start of every name, lowercased, in one
+  sorted array, so the names with a word starting with the query are one
+  binary-searched range
+- trigrams: the names containing each three-letter sequence, so longer
+  queries also match inside words (the posting lists are intersected and
+  the candidates checked)
+
+Matches are ranked by unique migrants and capped at SEARCH_LIMIT, so the
+options payload stays small whatever the vocabulary size.
+"""
+
+import re
+from functools import reduce
+
+import numpy as np
+
+SEARCH_LIMIT = 50
+WORD_START = re.compile(r'\b\w')
+
+
+class OptionIndex:
+    """Option values with a weight each (e.g. unique migrants), searchable by prefix and substring"""
+
+    def __init__(self, values, weights):
+        self.values = np.asarray(list(values), dtype=object)
+        self.weights = np.asarray(weights, dtype=np.int64)
+        self._by_weight = np.argsort(-self.weights, kind='stable')
+        self._rank = np.empty(len(self.values), dtype=np.int64)
+        self._rank[self._by_weight] = np.arange(len(self.values))
+        self._lowered = [str(value).lower() for value in self.values]
+
+        suffixes, owners = [], []
+        grams = {}
+        for i, name in enumerate(self._lowered):
+            for match in WORD_START.finditer(name):
+                suffixes.append(name[match.start():])
+                owners.append(i)
+            for gram in {name[j:j + 3] for j in range(len(name) - 2)}:
+                grams.setdefault(gram, []).append(i)
+        order = np.argsort(np.asarray(suffixes, dtype=object), kind='stable')
+        self._suffixes = np.asarray(suffixes, dtype=object)[order]
+        self._owners = np.asarray(owners, dtype=np.int32)[order]
+        self._trigrams = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in grams.items()}
+
+    def __len__(self):
+        return len(self.values)
+
+    def top(self, limit=SEARCH_LIMIT):
+        """The limit heaviest values"""
+        return self.values[self._by_weight[:limit]].tolist()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Values with a word starting with query, or containing it, heaviest first"""
+        query = (query or '').strip().lower()
+        if not query:
+            return self.top(limit)
+
+        lo = np.searchsorted(self._suffixes, query, side='left')
+        hi = np.searchsorted(self._suffixes, query + '\uffff', side='left')
+        found = set(self._owners[lo:hi].tolist())
+        if len(query) >= 3:
+            postings = [self._trigrams.get(query[j:j + 3]) for j in range(len(query) - 2)]
+            if all(p is not None for p in postings):
+                candidates = reduce(np.intersect1d, postings)
+                found.update(i for i in candidates.tolist() if query in self._lowered[i])
+
+        ids = np.fromiter(found, dtype=np.int64, count=len(found))
+        ids = ids[np.argsort(self._rank[ids])][:limit]
+        return self.values[ids].tolist()
+
+    @property
+    def nbytes(self):
+        strings = sum(len(s) for s in self._suffixes) + sum(len(s) for s in self._lowered)
+        return (self.values.nbytes + self.weights.nbytes + self._by_weight.nbytes + self._rank.nbytes +
+                self._suffixes.nbytes + self._owners.nbytes + strings +
+                sum(ids.nbytes for ids in self._trigrams.values()))
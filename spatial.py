@@ -0,0 +1,135 @@
+"""
+Spatial indexes for viewport-aware rendering
+
+GridIndex buckets bounding boxes (polygons or points) into a uniform
+lon/lat grid, so a viewport query only tests the items in the cells it
+touches. PlaceRows maps each place to the positions of the migration
+records that start or end there, so a zoomed-in map only aggregates the
+records touching visible places, at a cost proportional to that region
+rather than to all of India. detail_min_share sets how small a flow a view
+can show: the wider it is, the fewer small flows are drawn.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Geo view used in visible-area mode (matches update_map's layout), the
+# half extent in degrees shown at that scale, and a margin around the viewport
+DEFAULT_VIEW = {'lon': 80.0, 'lat': 23.5, 'scale': 4.0}
+DEFAULT_HALF_EXTENT = (16.0, 16.0)
+VIEWPORT_MARGIN = 1.25
+
+# Level of detail in visible-area mode: (viewport width in degrees, share of the
+# largest flow in view below which a district flow is left out of a view that wide)
+DETAIL_MIN_SHARE = ((30.0, 0.01), (15.0, 0.002))
+
+
+class GridIndex:
+    """Uniform grid over bounding boxes (minx, miny, maxx, maxy)"""
+
+    def __init__(self, bounds, cell_size=1.0):
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        self.cell_size = cell_size
+        self.origin = self.bounds[:, :2].min(axis=0) if len(self.bounds) else np.zeros(2)
+
+        cells, items = [], []
+        lo = self._cell(self.bounds[:, 0:2])
+        hi = self._cell(self.bounds[:, 2:4])
+        for item, ((x0, y0), (x1, y1)) in enumerate(zip(lo, hi)):
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    cells.append((x, y))
+                    items.append(item)
+        self._cells = {}
+        for cell, item in zip(cells, items):
+            self._cells.setdefault(cell, []).append(item)
+        self._cells = {cell: np.array(ids, dtype=np.int32) for cell, ids in self._cells.items()}
+
+    def _cell(self, points):
+        return np.floor((np.asarray(points) - self.origin) / self.cell_size).astype(np.int64)
+
+    def query(self, bbox):
+        """Indices of the items whose bounding box intersects bbox"""
+        (x0, y0), (x1, y1) = self._cell([bbox[0:2], bbox[2:4]])
+        found = [self._cells[(x, y)] for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+                 if (x, y) in self._cells]
+        if not found:
+            return np.zeros(0, dtype=np.int32)
+        candidates = np.unique(np.concatenate(found))
+        b = self.bounds[candidates]
+        hit = (b[:, 0] <= bbox[2]) & (b[:, 2] >= bbox[0]) & (b[:, 1] <= bbox[3]) & (b[:, 3] >= bbox[1])
+        return candidates[hit]
+
+    @property
+    def nbytes(self):
+        return self.bounds.nbytes + sum(ids.nbytes for ids in self._cells.values())
+
+
+class PlaceRows:
+    """Positions of the records whose home or away place is a given place"""
+
+    def __init__(self, places, home_keys, away_keys):
+        self.places = pd.Index(places)
+        self._index = []
+        for keys in (home_keys, away_keys):
+            codes = self.places.get_indexer(keys)
+            order = np.argsort(codes, kind='stable').astype(np.int32)
+            offsets = np.searchsorted(codes[order], np.arange(len(self.places) + 1))
+            self._index.append((order, offsets))
+
+    def rows(self, place_ids):
+        """Sorted record positions touching any of the given place ids"""
+        parts = [order[offsets[i]:offsets[i + 1]] for order, offsets in self._index for i in place_ids]
+        if not parts:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate(parts))
+
+    @property
+    def nbytes(self):
+        return sum(order.nbytes + offsets.nbytes for order, offsets in self._index)
+
+
+def boundary_keys(gdf, level_type):
+    """Place keys of boundary rows, matching the centroid lookups ('state' or 'district|state')"""
+    if level_type == 'state':
+        return gdf['state_name'].astype(str)
+    return gdf['matched_district'].astype(str) + '|' + gdf['state'].astype(str)
+
+
+def viewport_from_relayout(relayout, current=None):
+    """Apply the geo keys of a relayoutData event to a {'lon', 'lat', 'scale'} view
+
+    Returns None when the event did not move the map (e.g. autosize).
+    """
+    keys = {'geo.center.lon': 'lon', 'geo.center.lat': 'lat', 'geo.projection.scale': 'scale'}
+    changed = {name: float(relayout[key]) for key, name in keys.items() if key in (relayout or {})}
+    if not changed:
+        return None
+    return {**DEFAULT_VIEW, **(current or {}), **changed}
+
+
+def quantize_viewport(view):
+    """Round a view to (lon, lat, scale) so that small pans and zooms share results"""
+    view = view or DEFAULT_VIEW
+    zoom = max(1.0, round(view['scale'] / DEFAULT_VIEW['scale'] * 4) / 4)
+    step = 0.5 / zoom
+    return (round(round(view['lon'] / step) * step, 3), round(round(view['lat'] / step) * step, 3),
+            zoom * DEFAULT_VIEW['scale'])
+
+
+def viewport_bbox(viewport):
+    """(minx, miny, maxx, maxy) visible for a quantized viewport, with a margin"""
+    lon, lat, scale = viewport
+    zoom = scale / DEFAULT_VIEW['scale']
+    half_x = DEFAULT_HALF_EXTENT[0] * VIEWPORT_MARGIN / zoom
+    half_y = DEFAULT_HALF_EXTENT[1] * VIEWPORT_MARGIN / zoom
+    return (lon - half_x, lat - half_y, lon + half_x, lat + half_y)
+
+
+def detail_min_share(viewport):
+    """Smallest flow drawn in a viewport, as a share of the largest; 0.0 draws every flow"""
+    minx, _, maxx, _ = viewport_bbox(viewport)
+    for width, share in DETAIL_MIN_SHARE:
+        if maxx - minx >= width:
+            return share
+    return 0.0
@@ -0,0 +1,71 @@
+"""
+Shared fixtures: a small synthetic survey (b/generate_synthetic.py), the
+query engine over it and its aggregate cube; precomputed files are built
+from it by the same scripts the deployment uses
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RAW_DIR = REPO_DIR / 'raw'
+ROWS = 20000
+MONTHS = 6
+
+
+def build(script, *args):
+    subprocess.run([sys.executable, str(REPO_DIR / 'b' / script), *map(str, args)],
+                   check=True, capture_output=True)
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('data')
+    build('generate_synthetic.py', '--rows', ROWS, '--months', MONTHS, '--weights',
+          '--output', path / 'migration.parquet')
+    return path
+
+
+@pytest.fixture(scope='session')
+def place_keys():
+    states = pd.read_parquet(RAW_DIR / 'state_centroids.parquet')
+    districts = pd.read_parquet(RAW_DIR / 'district_centroids.parquet')
+    return {'state': list(states['state_name']),
+            'district': list(districts['district_name'] + '|' + districts['state_name'])}
+
+
+@pytest.fixture(scope='session')
+def engine(data_dir, place_keys):
+    from engine import create_engine
+    return create_engine('pandas', [data_dir / 'migration.parquet'], RAW_DIR / 'district_mapping.parquet',
+                         place_keys)
+
+
+@pytest.fixture(scope='session')
+def cube(data_dir):
+    from cube import AggregateCube
+    build('precompute_cube.py', '--data', data_dir / 'migration.parquet', '--output', data_dir / 'cube.parquet',
+          '--workers', 2)
+    return AggregateCube(data_dir / 'cube.parquet')
+
+
+def flows(agg_df):
+    """OD counts as a {pair: count} dict, so results can be compared whatever their order and dtypes"""
+    places = [col for col in agg_df.columns if col != 'count']
+    keys = zip(*(agg_df[col].astype(str) for col in places))
+    return {key: int(count) for key, count in zip(keys, agg_df['count']) if count > 0}
+
+
+@pytest.fixture(scope='session')
+def dashboard(data_dir):
+    """migration.py loaded with the synthetic survey (and no cube or frames)"""
+    import os
+    os.environ.update(MIGRATION_DATA=str(data_dir / 'migration.parquet'),
+                      MIGRATION_CUBE=str(data_dir / 'no_cube.parquet'),
+                      MIGRATION_FRAMES=str(data_dir / 'no_frames.parquet'))
+    import migration
+    return migration
@@ -0,0 +1,91 @@
+import io
+import json
+
+import pyarrow as pa
+import pytest
+
+from analytics import SHARE_DIMENSIONS, Analytics
+
+
+@pytest.fixture(scope='module')
+def from_records(engine):
+    return Analytics(engine.aggregate, engine.records)
+
+
+@pytest.fixture(scope='module')
+def from_cube(engine, cube):
+    return Analytics(engine.aggregate, engine.records, cube=cube)
+
+
+@pytest.fixture(scope='module')
+def client(dashboard):
+    return dashboard.app.server.test_client()
+
+
+@pytest.mark.parametrize('dimension', list(SHARE_DIMENSIONS))
+@pytest.mark.parametrize('filters', [{}, {'migration_status': 'Immigrated', 'breakdown_type': 'religion',
+                                          'breakdown_value': 'Hindu'}])
+def test_cube_shares_match_the_records(from_records, from_cube, dimension, filters):
+    expected = from_records.shares(dimension, **filters)
+    assert len(expected) and expected['share'].sum() <= 1.0 + 1e-9
+    found = from_cube.shares(dimension, **filters)
+    assert found.to_dict('records') == expected.to_dict('records')
+
+
+def test_weighted_cube_shares_match_the_records(from_records, from_cube):
+    expected = from_records.shares('caste_category', weighted=True).set_index('caste_category')
+    found = from_cube.shares('caste_category', weighted=True).set_index('caste_category')
+    assert list(found.index) == list(expected.index)
+    # The cube rounds each flow's estimate, the records only the total
+    assert ((found['migrants'] - expected['migrants']).abs() <= 0.001 * expected['migrants'] + 50).all()
+
+
+def test_shares_the_cube_cannot_answer_come_from_the_records(from_records, from_cube):
+    filters = {'breakdown_type': 'religion', 'breakdown_value': 'Hindu'}
+    assert from_cube._cube_shares('caste_category', False, from_cube._filters(filters)) is None
+    assert from_cube.shares('caste_category', **filters).equals(from_records.shares('caste_category', **filters))
+
+
+def test_od_endpoint(client, engine):
+    response = client.get('/api/od?migration_status=Immigrated&level_type=district')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['filters']['level_type'] == 'district'
+    expected = engine.aggregate('Immigrated', 'district', 'overall', None, None, None)
+    assert sum(row['count'] for row in body['rows']) == expected['count'].sum()
+    counts = [row['count'] for row in body['rows']]
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_od_endpoint_streams_arrow(client):
+    response = client.get('/api/od?level_type=district&format=arrow')
+    assert response.mimetype == 'application/vnd.apache.arrow.stream'
+    table = pa.ipc.open_stream(io.BytesIO(response.get_data())).read_all()
+    assert table.num_rows == len(client.get('/api/od?level_type=district').get_json()['rows'])
+    assert set(table.column_names) >= {'origin', 'destination', 'count'}
+
+
+def test_wide_od_endpoint(client):
+    rows = client.get('/api/od?wide=1').get_json()['rows']
+    assert rows and 'origin' in rows[0]
+    assert client.get('/api/od?wide=1&format=arrow').status_code == 400
+
+
+def test_net_endpoint(client):
+    rows = client.get('/api/net?breakdown_type=religion&breakdown_value=Hindu').get_json()['rows']
+    assert all(row['net'] == row['inflow'] - row['outflow'] for row in rows)
+    assert sum(row['net'] for row in rows) == 0
+
+
+def test_shares_endpoint(client):
+    rows = client.get('/api/shares?dimension=reason').get_json()['rows']
+    assert rows and {'reason', 'migrants', 'share'} <= set(rows[0])
+    assert client.get('/api/shares?dimension=income').status_code == 400
+
+
+@pytest.mark.parametrize('query', ['/api/od?level_type=village', '/api/net?migration_status=Stayed',
+                                   '/api/trajectory?hh_id=x&mem_id=1'])
+def test_bad_requests_are_rejected(client, query):
+    response = client.get(query)
+    assert response.status_code == 400
+    assert 'error' in json.loads(response.get_data())
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from conftest import RAW_DIR, build, flows
+from cube import AggregateCube, read_metadata
+
+FILTERS = [
+    ('Emigrated', 'state', 'overall', None, None, None),
+    ('Immigrated', 'district', 'overall', None, None, None),
+    ('Emigrated', 'district', 'caste_category', 'OBC', None, None),
+    ('Immigrated', 'state', 'religion', 'Muslim', None, None),
+    ('Emigrated', 'state', 'overall', None, None, 'Employment'),
+    ('Immigrated', 'district', 'caste_category', 'SC', None, 'Marriage'),
+    ('Emigrated', 'state', 'overall', None, None, 'No such reason'),
+]
+
+
+@pytest.fixture(scope='module')
+def caste(engine):
+    """(caste category, caste) of the most common caste"""
+    castes = engine.df['caste'].astype(str)
+    caste = castes.value_counts().index[0]
+    return str(engine.df.loc[castes == caste, 'caste_category'].iloc[0]), caste
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_lookup_matches_engine(cube, engine, filters):
+    assert flows(cube.lookup(*filters)) == flows(engine.aggregate(*filters))
+
+
+@pytest.mark.parametrize('level_type', ['state', 'district'])
+def test_caste_lookup_matches_engine(cube, engine, caste, level_type):
+    filters = ('Emigrated', level_type, 'caste_category', *caste, None)
+    expected = flows(engine.aggregate(*filters))
+    assert expected
+    assert flows(cube.lookup(*filters)) == expected
+
+
+def test_weighted_lookup_matches_engine(cube, engine):
+    filters = ('Emigrated', 'state', 'religion', 'Hindu', None, None)
+    expected = flows(engine.aggregate(*filters, weighted=True))
+    found = flows(cube.lookup(*filters, weighted=True))
+    # Both round a float sum; the summation order can differ by one
+    assert found.keys() == expected.keys()
+    assert all(abs(found[pair] - expected[pair]) <= 1 for pair in expected)
+
+
+def test_religion_with_caste_is_left_to_the_engine(cube, caste):
+    assert cube.lookup('Emigrated', 'state', 'religion', 'Hindu', caste[1], None) is None
+
+
+def test_cube_records_are_the_engines(engine, data_dir):
+    from b.precompute_cube import load_records
+
+    records, source_rows = load_records([data_dir / 'migration.parquet'], RAW_DIR)
+    assert source_rows == engine.source_rows
+    pd.testing.assert_frame_equal(records, engine.df.reset_index(drop=True))
+
+
+def test_cube_from_several_files(engine, data_dir, tmp_path):
+    records = pd.read_parquet(data_dir / 'migration.parquet')
+    half = len(records) // 2
+    paths = [tmp_path / 'early.parquet', tmp_path / 'late.parquet']
+    records.iloc[:half].to_parquet(paths[0], index=False)
+    records.iloc[half:].to_parquet(paths[1], index=False)
+    build('precompute_cube.py', '--data', *paths, '--output', tmp_path / 'cube.parquet', '--workers', 1)
+
+    assert sorted(read_metadata(tmp_path / 'cube.parquet')['source_files']) == ['early.parquet', 'late.parquet']
+    cube = AggregateCube(tmp_path / 'cube.parquet')
+    filters = ('Emigrated', 'district', 'overall', None, None, None)
+    assert flows(cube.lookup(*filters)) == flows(engine.aggregate(*filters))
@@ -0,0 +1,78 @@
+import io
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+import export
+from analytics import Analytics
+
+
+@pytest.fixture(scope='module')
+def client(engine):
+    app = SimpleNamespace(server=Flask(__name__))
+    analytics = Analytics(engine.aggregate, engine.records)
+    export.register(app, analytics, engine.record_batches)
+    return app.server.test_client()
+
+
+def test_head_requests_return_their_slots(client):
+    for _ in range(export.EXPORT_SLOTS + 2):
+        response = client.head('/export/records.csv?level_type=district')
+        assert response.status_code == 200
+        response.close()
+    response = client.get('/export/flows.csv')
+    assert response.status_code == 200
+    response.close()
+
+
+def test_slots_are_held_until_the_response_is_closed(client):
+    open_responses = [client.get('/export/flows.csv', buffered=False) for _ in range(export.EXPORT_SLOTS)]
+    assert all(response.status_code == 200 for response in open_responses)
+    assert client.get('/export/flows.csv').status_code == 429
+    for response in open_responses:
+        response.close()
+    response = client.get('/export/flows.csv')
+    assert response.status_code == 200
+    response.close()
+
+
+def test_bad_filters_return_their_slot(client):
+    for _ in range(export.EXPORT_SLOTS + 1):
+        assert client.get('/export/records.csv?level_type=village').status_code == 400
+    response = client.get('/export/flows.csv')
+    assert response.status_code == 200
+    response.close()
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_batched_records_match_one_batch(engine, monkeypatch, fmt):
+    def read(batch_rows):
+        monkeypatch.setattr(export, 'EXPORT_BATCH_ROWS', batch_rows)
+        app = SimpleNamespace(server=Flask(__name__))
+        export.register(app, Analytics(engine.aggregate, engine.records), engine.record_batches)
+        response = app.server.test_client().get(f'/export/records.{fmt}?migration_status=Immigrated')
+        body = response.get_data()
+        response.close()
+        return pd.read_csv(io.BytesIO(body)) if fmt == 'csv' else pd.read_parquet(io.BytesIO(body))
+
+    whole = read(10 ** 9)
+    batched = read(1000)
+    assert len(whole) > 1000
+    pd.testing.assert_frame_equal(batched, whole, check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize('level_type', ['state', 'district'])
+def test_records_are_one_per_migrant_and_pair(client, engine, level_type):
+    response = client.get(f'/export/records.csv?level_type={level_type}')
+    rows = pd.read_csv(io.BytesIO(response.get_data()), dtype=str)
+    response.close()
+    places = ['origin_state', 'destination_state']
+    if level_type == 'district':
+        places += ['origin_district', 'destination_district']
+    assert not rows.duplicated(['hh_id', 'mem_id'] + places).any()
+    records = engine.records('Emigrated', 'overall', None, None, None)
+    expected = records.drop_duplicates(['unique_id', 'origin', 'destination', 'origin_district',
+                                        'destination_district'][:len(places) + 1])
+    assert len(rows) == len(expected)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from flows import bundle_flows, exceeds_preview, parse_flow_limit, select_flows, tail_summary
+
+
+@pytest.fixture
+def counts():
+    return np.random.default_rng(0).zipf(1.8, 5000).astype(np.int64)
+
+
+def test_top_k_keeps_the_largest_flows_in_order(counts):
+    kept = select_flows(counts, top_k=100)
+    assert len(kept) == 100
+    assert np.all(np.diff(counts[kept]) <= 0)
+    assert counts[kept].min() >= np.sort(counts)[-100]
+
+
+def test_share_keeps_the_fewest_flows_covering_it(counts):
+    kept = select_flows(counts, share=0.8)
+    total = counts.sum()
+    assert counts[kept].sum() >= 0.8 * total
+    assert counts[kept[:-1]].sum() < 0.8 * total
+
+
+def test_no_limit_keeps_everything(counts):
+    assert len(select_flows(counts)) == len(counts)
+    assert len(select_flows(counts, top_k=10 ** 6)) == len(counts)
+    assert len(select_flows(np.zeros(0), top_k=5)) == 0
+
+
+def test_tail_summary_accounts_for_the_rest(counts):
+    kept = select_flows(counts, top_k=100)
+    tail = tail_summary(counts, kept)
+    assert tail['flows'] == len(counts) - 100
+    assert tail['migrants'] == counts.sum() - counts[kept].sum()
+
+
+def test_flow_limit_values():
+    assert parse_flow_limit('top:500') == (500, None)
+    assert parse_flow_limit('share:0.8') == (None, 0.8)
+    assert parse_flow_limit('all') == (None, None)
+    assert exceeds_preview('top:500') and exceeds_preview('all') and not exceeds_preview('top:50')
+
+
+@pytest.fixture
+def flow_groups(counts):
+    rng = np.random.default_rng(1)
+    return rng.integers(0, 40, len(counts)), rng.uniform(8, 35, (len(counts), 2)), rng.uniform(8, 35, (len(counts), 2))
+
+
+def test_bundles_draw_at_most_the_limit_and_cover_every_flow(counts, flow_groups):
+    groups, origin, dest = flow_groups
+    kept, bundles, covered = bundle_flows(counts, groups, origin, dest, 30)
+    assert len(kept) == 15 and len(kept) + len(bundles['count']) <= 30
+    assert np.array_equal(counts[kept], np.sort(counts)[::-1][:15])
+    # The 15 largest groups are bundled; the flows of the others are left to the tail
+    assert len(bundles['count']) == 15 and len(np.unique(bundles['group'])) == 15
+    assert np.all(np.diff(bundles['count']) <= 0)
+    assert len(np.unique(covered)) == len(covered)
+    assert counts[kept].sum() + bundles['count'].sum() == counts[covered].sum()
+
+
+def test_a_bundle_sums_its_members(counts, flow_groups):
+    groups, origin, dest = flow_groups
+    kept, bundles, _ = bundle_flows(counts, groups, origin, dest, 100)
+    rest = np.ones(len(counts), dtype=bool)
+    rest[kept] = False
+    for group, total, members, start in zip(bundles['group'], bundles['count'], bundles['members'], bundles['origin']):
+        member = rest & (groups == group)
+        assert total == counts[member].sum() and members == member.sum()
+        assert np.allclose(start, np.average(origin[member], axis=0, weights=counts[member]))
+
+
+def test_few_flows_are_not_bundled(counts, flow_groups):
+    groups, origin, dest = flow_groups
+    kept, bundles, covered = bundle_flows(counts[:20], groups[:20], origin[:20], dest[:20], 50)
+    assert len(kept) == 20 and len(bundles['count']) == 0 and len(bundles['group']) == 0
+    assert np.array_equal(kept, covered)
@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import build, flows
+from frames import MonthlyFrames
+
+FILTERS = [
+    ('Emigrated', 'state', 'overall', None, None, None),
+    ('Immigrated', 'district', 'overall', None, None, None),
+    ('Emigrated', 'district', 'caste_category', 'ST', None, None),
+    ('Immigrated', 'state', 'religion', 'Hindu', None, 'Employment'),
+]
+
+
+@pytest.fixture(scope='module')
+def frames(data_dir, tmp_path_factory):
+    path = tmp_path_factory.mktemp('frames') / 'frames.parquet'
+    build('precompute_frames.py', '--data', data_dir / 'migration.parquet', '--output', path, '--workers', 2)
+    return MonthlyFrames(path)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_every_month_matches_a_monthly_groupby(frames, engine, filters):
+    assert len(frames.months) > 1
+    for month in frames.months:
+        expected = flows(engine.aggregate(*filters, month=month))
+        assert flows(frames.lookup(*filters, month)) == expected, month
+
+
+def test_unknown_month_matches_nothing(frames):
+    assert len(frames.lookup('Emigrated', 'state', 'overall', None, None, None, 'Jan 1990')) == 0
+
+
+def test_religion_with_caste_is_left_to_the_engine(frames, engine):
+    caste = engine.df['caste'].astype(str).value_counts().index[0]
+    assert frames.lookup('Emigrated', 'state', 'religion', 'Hindu', caste, None, frames.months[0]) is None
+
+
+def test_layers_left_out_are_left_to_the_engine(data_dir, tmp_path):
+    build('precompute_frames.py', '--data', data_dir / 'migration.parquet', '--output', tmp_path / 'frames.parquet',
+          '--workers', 1, '--layers', 'overall', 'religion')
+    frames = MonthlyFrames(tmp_path / 'frames.parquet')
+    month = frames.months[-1]
+    assert frames.lookup('Emigrated', 'state', 'religion', 'Hindu', None, None, month) is not None
+    assert frames.lookup('Emigrated', 'state', 'caste_category', 'OBC', None, None, month) is None
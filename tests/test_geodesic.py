@@ -0,0 +1,56 @@
+import numpy as np
+
+from geodesic import ArcStore, arc_paths, bearing, great_circle, join_paths
+
+DELHI = (28.61, 77.21)
+MUMBAI = (19.08, 72.88)
+KOLKATA = (22.57, 88.36)
+
+
+def test_arcs_run_from_origin_to_destination():
+    points = great_circle([DELHI], [MUMBAI], [0.0, 0.5, 1.0])[0]
+    assert np.allclose(points[0], DELHI) and np.allclose(points[-1], MUMBAI)
+    assert MUMBAI[0] < points[1, 0] < DELHI[0]
+
+
+def test_bearings_point_the_way():
+    assert round(float(bearing([(0.0, 0.0)], [(10.0, 0.0)])[0])) == 0
+    assert round(float(bearing([(0.0, 0.0)], [(0.0, 10.0)])[0])) == 90
+    assert 180 < bearing([DELHI], [MUMBAI])[0] < 270
+
+
+def test_arrows_sit_on_the_arc_pointing_at_the_destination():
+    paths, arrows = arc_paths([DELHI, DELHI], [MUMBAI, KOLKATA], resolution=5)
+    assert paths.shape == (2, 5, 2) and arrows.shape == (2, 3) and paths.dtype == np.float32
+    assert np.allclose(arrows[:, 2], bearing(arrows[:, :2], [MUMBAI, KOLKATA]), atol=0.01)
+
+
+def test_store_computes_each_pair_once():
+    store = ArcStore()
+    paths, arrows = store.lookup([0, 1], [1, 2], [DELHI, MUMBAI], [MUMBAI, KOLKATA])
+    assert len(store) == 2
+    again, again_arrows = store.lookup([1, 0, 0], [2, 1, 1], [MUMBAI, DELHI, DELHI], [KOLKATA, MUMBAI, MUMBAI])
+    assert len(store) == 2
+    assert np.array_equal(again[0], paths[1]) and np.array_equal(again[2], paths[0])
+    assert np.array_equal(again_arrows[1], arrows[0])
+    store.lookup([0], [1], [DELHI], [MUMBAI], resolution=3)
+    assert len(store) == 3 and store.nbytes > 0
+
+
+def test_store_grows_past_its_capacity():
+    rng = np.random.default_rng(0)
+    origin, dest = rng.uniform(8, 35, (200, 2)), rng.uniform(8, 35, (200, 2))
+    store = ArcStore()
+    for start in range(0, 200, 50):
+        store.lookup(np.arange(start, start + 50), np.zeros(50), origin[start:start + 50], dest[start:start + 50])
+    paths, arrows = store.lookup(np.arange(200), np.zeros(200), origin, dest)
+    expected_paths, expected_arrows = arc_paths(origin, dest)
+    assert np.array_equal(paths, expected_paths) and np.array_equal(arrows, expected_arrows)
+
+
+def test_joined_paths_are_separated_by_gaps():
+    paths, _ = arc_paths([DELHI, DELHI], [MUMBAI, KOLKATA], resolution=4)
+    lat, lon = join_paths(paths)
+    assert len(lat) == len(lon) == 9
+    assert np.isnan(lat[4]) and np.isnan(lon[4]) and not np.isnan(lat[[0, 3, 5, 8]]).any()
+    assert np.array_equal(lat[5:], paths[1, :, 0])
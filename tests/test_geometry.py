@@ -0,0 +1,70 @@
+import struct
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from geometry import WKB_MULTIPOLYGON, WKB_POLYGON, Boundaries, parse_wkb
+
+SQUARE = [(0.0, 0.0), (2.0, 0.0), (2.0, 2.0), (0.0, 2.0), (0.0, 0.0)]
+HOLE = [(0.5, 0.5), (1.0, 0.5), (1.0, 1.0), (0.5, 0.5)]
+ISLAND = [(5.0, 5.0), (6.0, 5.0), (6.0, 6.0), (5.0, 5.0)]
+
+
+def polygon_wkb(rings, order='<'):
+    body = struct.pack(order + 'I', len(rings))
+    for ring in rings:
+        body += struct.pack(order + 'I', len(ring)) + struct.pack(order + 'd' * 2 * len(ring), *np.ravel(ring))
+    return bytes([order == '<']) + struct.pack(order + 'I', WKB_POLYGON) + body
+
+
+def multipolygon_wkb(polygons, order='<'):
+    parts = b''.join(polygon_wkb(rings, order) for rings in polygons)
+    return bytes([order == '<']) + struct.pack(order + 'II', WKB_MULTIPOLYGON, len(polygons)) + parts
+
+
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_polygons_and_multipolygons_unpack_into_flat_buffers(order):
+    coords, rings, polygons, features = parse_wkb([polygon_wkb([SQUARE, HOLE], order), None,
+                                                   multipolygon_wkb([[SQUARE], [ISLAND]], order)])
+    assert coords.dtype == np.float64
+    assert np.array_equal(coords, np.array(SQUARE + HOLE + SQUARE + ISLAND))
+    assert rings.tolist() == [0, 5, 9, 14, 18]
+    assert polygons.tolist() == [0, 2, 3, 4]
+    assert features.tolist() == [0, 1, 1, 3]
+
+
+def test_other_geometries_are_rejected():
+    point = b'\x01' + struct.pack('<I', 1) + struct.pack('<dd', 1.0, 2.0)
+    with pytest.raises(ValueError, match='type 1'):
+        parse_wkb([point])
+
+
+def test_boundaries_from_geoparquet(tmp_path):
+    table = pa.table({'name': ['holed', 'empty', 'islands'],
+                      'geometry': [polygon_wkb([SQUARE, HOLE]), None, multipolygon_wkb([[SQUARE], [ISLAND]])]})
+    pq.write_table(table, tmp_path / 'boundaries.parquet')
+    boundaries = Boundaries.read_parquet(tmp_path / 'boundaries.parquet')
+
+    assert len(boundaries) == 3 and list(boundaries.attributes.columns) == ['name']
+    assert np.array_equal(boundaries.bounds[0], [0, 0, 2, 2]) and np.isnan(boundaries.bounds[1]).all()
+    assert np.array_equal(boundaries.bounds[2], [0, 0, 6, 6])
+    assert [len(ring) for ring in boundaries.exterior_rings()] == [5, 5, 4]
+
+    geojson = boundaries.geojson(ids=['a', 'b', 'c'])
+    holed, islands = geojson['features'][0], geojson['features'][2]
+    assert holed['id'] == 'a' and holed['geometry']['type'] == 'Polygon'
+    assert holed['geometry']['coordinates'][1] == [list(point) for point in HOLE]
+    assert islands['geometry']['type'] == 'MultiPolygon' and len(islands['geometry']['coordinates']) == 2
+
+
+def test_simplify_drops_vertices_within_tolerance():
+    ring = [(0.0, 0.0), (1.0, 0.001), (2.0, 0.0), (2.0, 2.0), (0.0, 2.0), (0.0, 0.0)]
+    boundaries = Boundaries(None, *parse_wkb([polygon_wkb([ring, HOLE])]))
+    simplified = boundaries.simplify(tolerance=0.01)
+    assert simplified.ring_offsets.tolist() == [0, 5, 9]
+    assert (1.0, 0.001) not in map(tuple, simplified.coords.tolist())
+    assert np.array_equal(simplified.coords[5:], HOLE)
+    # Rings that would collapse below a triangle are kept whole
+    assert np.array_equal(boundaries.simplify(tolerance=1.0).coords[5:], HOLE)
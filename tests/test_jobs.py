@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobCancelled, JobRunner, checkpoint
+
+
+class Computation:
+    """A slow computation that counts its runs and stops at checkpoints"""
+
+    def __init__(self, steps=20):
+        self.steps = steps
+        self.runs = 0
+        self.finished = 0
+        self.started = threading.Event()
+
+    def __call__(self, value):
+        self.runs += 1
+        self.started.set()
+        for _ in range(self.steps):
+            time.sleep(0.01)
+            checkpoint()
+        self.finished += 1
+        return value
+
+
+def request(runner, key, session, func, results, name):
+    try:
+        results[name] = runner.run(key, session, func, key)
+    except JobCancelled:
+        results[name] = 'cancelled'
+
+
+def start(*args):
+    thread = threading.Thread(target=request, args=args)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def runner():
+    return JobRunner(debounce=0)
+
+
+def test_requests_for_one_key_share_a_job(runner):
+    compute, results = Computation(), {}
+    threads = [start(runner, 'map', session, compute, results, session) for session in ('a', 'b', None)]
+    for thread in threads:
+        thread.join()
+    assert results == {'a': 'map', 'b': 'map', None: 'map'}
+    assert compute.runs == 1
+
+
+def test_same_session_waiters_share_a_job(runner):
+    compute, results = Computation(), {}
+    threads = [start(runner, 'map', 'a', compute, results, name) for name in ('first', 'second')]
+    for thread in threads:
+        thread.join()
+    assert results == {'first': 'map', 'second': 'map'}
+    assert compute.runs == 1
+    assert not runner._session_job and not runner._session_ticket
+
+
+def test_newer_request_cancels_the_abandoned_job(runner):
+    old, new, results = Computation(), Computation(), {}
+    first = start(runner, 'old', 'a', old, results, 'old')
+    old.started.wait()
+    second = start(runner, 'new', 'a', new, results, 'new')
+    first.join()
+    second.join()
+    assert results == {'old': 'cancelled', 'new': 'new'}
+    assert old.finished == 0
+    assert not runner._inflight
+
+
+def test_job_shared_with_another_session_keeps_running(runner):
+    shared, other, results = Computation(), Computation(), {}
+    first = start(runner, 'shared', 'a', shared, results, 'a')
+    shared.started.wait()
+    second = start(runner, 'shared', 'b', shared, results, 'b')
+    time.sleep(0.02)
+    third = start(runner, 'other', 'a', other, results, 'a2')
+    for thread in (first, second, third):
+        thread.join()
+    assert results == {'a': 'cancelled', 'b': 'shared', 'a2': 'other'}
+    assert shared.finished == 1
+
+
+def test_debounce_drops_all_but_the_latest_request():
+    runner, compute, results = JobRunner(debounce=0.05), Computation(steps=1), {}
+    first = start(runner, 'first', 'a', compute, results, 'first')
+    time.sleep(0.01)
+    second = start(runner, 'second', 'a', compute, results, 'second')
+    first.join()
+    second.join()
+    assert results == {'first': 'cancelled', 'second': 'second'}
+    assert compute.runs == 1
+
+
+def test_a_group_is_debounced_once_per_session():
+    runner = JobRunner(debounce=0.2)
+    start_time = time.perf_counter()
+    assert runner.run('preview', 'a', lambda: 'preview', group='filters') == 'preview'
+    assert time.perf_counter() - start_time >= 0.2
+    start_time = time.perf_counter()
+    assert runner.run('full', 'a', lambda: 'full', group='filters') == 'full'
+    assert time.perf_counter() - start_time < 0.1
+    # Another session, or another group, waits again
+    start_time = time.perf_counter()
+    runner.run('full', 'b', lambda: 'full', group='filters')
+    runner.run('other', 'a', lambda: 'other', group='other filters')
+    assert time.perf_counter() - start_time >= 0.4
+
+
+def test_jobs_waiting_for_a_worker_are_counted(monkeypatch):
+    import profiling
+    monkeypatch.setattr(profiling, 'ENABLED', True)
+    monkeypatch.setattr(profiling, '_counters', profiling.defaultdict(int))
+    monkeypatch.setattr(profiling, '_stage_calls', profiling.defaultdict(int))
+    runner, results = JobRunner(workers=1, debounce=0), {}
+    threads = [start(runner, key, None, Computation(steps=5), results, key) for key in ('a', 'b', 'c')]
+    for thread in threads:
+        thread.join()
+    assert results == {'a': 'a', 'b': 'b', 'c': 'c'}
+    assert profiling._counters[('update_map', 'jobs_queued')] == 2
+    assert profiling._stage_calls[('update_map', 'queued')] == 3
+    assert 'migration_jobs_queued_total{callback="update_map"} 2' in profiling.render_metrics()
@@ -0,0 +1,34 @@
+import pytest
+
+
+def flow_traces(figure):
+    return [trace for trace in figure['data'] if trace.get('name') != 'Migration Points']
+
+
+@pytest.mark.parametrize('level_type, flow_limit', [('state', 'top:500'), ('district', 'top:500'),
+                                                     ('district', 'all')])
+def test_flows_are_drawn_as_one_line_and_one_arrow_trace(dashboard, level_type, flow_limit):
+    key = dashboard.map_key('Emigrated', level_type, 'overall', None, None, None, flow_limit, 'flows', 'all', None)
+    figure, _, _ = dashboard.build_map(*key)
+    lines, arrows = flow_traces(figure)
+    assert lines['mode'] == 'lines' and arrows['mode'] == 'markers'
+    assert len(arrows['customdata']) > 1
+    assert all(len(point) == 3 for point in arrows['customdata'])
+
+
+def test_zoomed_out_views_leave_out_small_district_flows(dashboard, monkeypatch):
+    import spatial
+    monkeypatch.setattr(spatial, 'DETAIL_MIN_SHARE', ((30.0, 0.1),))
+
+    def drawn(view):
+        key = dashboard.map_key('Emigrated', 'district', 'overall', None, None, None, 'all', 'flows', 'viewport',
+                                view)
+        figure, _, _ = dashboard.build_map(*key)
+        _, arrows = flow_traces(figure)
+        return {tuple(point) for point in arrows['customdata']}
+
+    center = {'lon': 78.0, 'lat': 22.0}
+    wide, close = drawn({**center, 'scale': 4.0}), drawn({**center, 'scale': 32.0})
+    largest = max(c for _, _, c in wide)
+    assert min(c for _, _, c in wide) >= 0.1 * largest
+    assert min(c for _, _, c in close) < 0.1 * largest
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+import memory_guard
+from memory_guard import LRUCache, MemoryGuard
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Settable process RSS, in MB"""
+    state = {'mb': 100.0}
+    monkeypatch.setattr(memory_guard, 'current_rss_mb', lambda: state['mb'])
+    return state
+
+
+def guard_with(cache_mb=0):
+    guard = MemoryGuard(budget_mb=100, headroom_mb=20)
+    cache = LRUCache(max_mb=64)
+    if cache_mb:
+        cache.put('figure', np.zeros(int(cache_mb * memory_guard.MB), dtype=np.uint8))
+    guard.track_cache('figures', cache)
+    applied = []
+    for name in ('first', 'second'):
+        guard.add_downgrade(name, lambda name=name: applied.append(name))
+    return guard, cache, applied
+
+
+def test_under_budget_does_nothing(rss):
+    guard, cache, applied = guard_with(cache_mb=1)
+    assert guard.check() == []
+    assert len(cache) == 1 and applied == []
+
+
+def test_clearing_enough_cache_skips_the_downgrades(rss):
+    guard, cache, applied = guard_with(cache_mb=10)
+    rss['mb'] = 105
+    assert guard.check() == ['cleared figures']
+    assert len(cache) == 0 and applied == []
+
+
+def test_downgrades_escalate_only_when_the_caches_cannot_cover_the_excess(rss):
+    guard, cache, applied = guard_with(cache_mb=1)
+    rss['mb'] = 130
+    assert guard.check() == ['cleared figures', 'first']
+    assert applied == ['first']
+
+
+def test_rss_that_stays_up_does_not_retrigger(rss):
+    guard, cache, applied = guard_with(cache_mb=1)
+    rss['mb'] = 130
+    guard.check()
+    # Freed memory stays in the allocator: RSS is unchanged, and the cache fills up again
+    for i in range(10):
+        cache.put(i, np.zeros(memory_guard.MB, dtype=np.uint8))
+        assert guard.check() == []
+    assert applied == ['first'] and len(cache) == 10
+    assert guard.limit_mb() == 150
+
+
+def test_growth_past_the_headroom_escalates(rss):
+    guard, cache, applied = guard_with(cache_mb=1)
+    rss['mb'] = 130
+    guard.check()
+    rss['mb'] = 151
+    assert guard.check() == ['cleared figures', 'second']
+    assert applied == ['first', 'second']
+    rss['mb'] = 175
+    assert guard.check() == ['cleared figures']
+    assert applied == ['first', 'second']
+
+
+def test_dropping_under_budget_resets_the_floor(rss):
+    guard, cache, applied = guard_with(cache_mb=1)
+    rss['mb'] = 130
+    guard.check()
+    rss['mb'] = 90
+    guard.check()
+    assert guard.limit_mb() == 100
+    cache.put('figure', np.zeros(memory_guard.MB * 2, dtype=np.uint8))
+    rss['mb'] = 101
+    assert guard.check() == ['cleared figures']
+
+
+def test_geometry_downgrade_shrinks_the_tracked_boundaries(rss):
+    from conftest import RAW_DIR
+    from geometry import Boundaries
+
+    boundaries = {'district': Boundaries.read_parquet(RAW_DIR / 'district_boundaries.parquet')}
+    guard = MemoryGuard(budget_mb=100, headroom_mb=20)
+    guard.track('district_boundaries', 'geometry', lambda: boundaries['district'])
+    guard.add_downgrade('coarser district geometry',
+                        lambda: boundaries.update(district=boundaries['district'].simplify(tolerance=0.08)))
+    before = guard.account()['district_boundaries']['bytes']
+    rss['mb'] = 130
+    assert guard.check() == ['coarser district geometry']
+    assert guard.account()['district_boundaries']['bytes'] < before * 0.8
+
+
+def test_hashing_ids_shrinks_the_tracked_table(rss, data_dir, place_keys):
+    from conftest import RAW_DIR
+    from engine import create_engine
+
+    engine = create_engine('pandas', [data_dir / 'migration.parquet'], RAW_DIR / 'district_mapping.parquet',
+                           place_keys)
+    guard = MemoryGuard(budget_mb=100, headroom_mb=20)
+    guard.track('migration_df', 'table', lambda: engine.df)
+    guard.add_downgrade('hashed unique ids', engine.hash_unique_ids)
+    before = guard.account()['migration_df']['bytes']
+    rss['mb'] = 130
+    assert guard.check() == ['hashed unique ids']
+    assert guard.account()['migration_df']['bytes'] < before
+    assert engine.aggregate('Emigrated', 'state', 'overall', None, None, None)['count'].sum() > 0
@@ -0,0 +1,39 @@
+import numpy as np
+
+from odmatrix import ODMatrix, PlaceDetail
+
+
+def matrix():
+    # 0 -> 1 twice (summed), 1 -> 1 within the place, 2 -> 0, and a pair with an unknown place
+    return ODMatrix([0, 0, 1, 2, -1], [1, 1, 1, 0, 2], [3, 2, 7, 4, 9], n_places=3)
+
+
+def test_totals_count_moves_within_a_place():
+    od = matrix()
+    np.testing.assert_array_equal(od.outflow(), [5, 7, 4])
+    np.testing.assert_array_equal(od.inflow(), [4, 12, 0])
+    np.testing.assert_array_equal(od.net(), [-1, 5, -4])
+    assert od.data.sum() == 16
+
+
+def test_place_detail_pages_largest_first():
+    # Place 0 sends 1, 6, 3 and 8 migrants to places 1-4 and 2 within itself
+    detail = PlaceDetail(ODMatrix([0, 0, 0, 0, 0], [1, 2, 3, 4, 0], [1, 6, 3, 8, 2], n_places=5))
+    assert detail.partner_count(0, 'out') == 4 and detail.outflow[0] == 20
+    ids, counts = detail.partners(0, 'out', limit=2)
+    np.testing.assert_array_equal(ids, [4, 2])
+    np.testing.assert_array_equal(counts, [8, 6])
+    ids, counts = detail.partners(0, 'out', offset=2, limit=5)
+    np.testing.assert_array_equal(ids, [3, 1])
+    assert len(detail.partners(0, 'out', offset=4)[0]) == 0
+    np.testing.assert_array_equal(detail.partners(2, 'in')[0], [0])
+
+
+def test_moves_within_a_place_are_not_partners():
+    detail = PlaceDetail(matrix())
+    ids, counts = detail.partners(1, 'in')
+    np.testing.assert_array_equal(ids, [0])
+    np.testing.assert_array_equal(counts, [5])
+    assert detail.partner_count(1, 'in') == 1 and detail.partner_count(1, 'out') == 0
+    np.testing.assert_array_equal(detail.within, [0, 7, 0])
+    assert detail.inflow[1] == 12 and detail.outflow[1] == 7
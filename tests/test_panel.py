@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel import PanelIndex, month_numbers
+
+FILTERS = [
+    {'migration_status': 'Emigrated'},
+    {'migration_status': 'Immigrated', 'breakdown_type': 'religion', 'breakdown_value': 'Muslim'},
+    {'migration_status': 'Emigrated', 'breakdown_type': 'caste_category', 'breakdown_value': 'OBC',
+     'migration_reason': 'Employment'},
+    {'migration_status': 'Emigrated', 'migration_reason': 'No such reason'},
+]
+
+
+@pytest.fixture(scope='module')
+def panel(engine):
+    return PanelIndex(engine.panel_records(), engine.member_records)
+
+
+def member_rows(moves):
+    """Records of member (1, 1) from (month, status, other state) tuples"""
+    return pd.DataFrame([{'hh_id': 1, 'mem_id': 1, 'month_slot': month, 'mem_status': status,
+                          'emigrated_immigrated_state': state, 'emigrated_immigrated_district': 'd',
+                          'caste_category': 'OBC', 'religion': 'Hindu', 'caste': 'c',
+                          'emigration_immigration_reason': 'Employment'} for month, status, state in moves])
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_matching_members_are_those_of_the_matching_records(panel, engine, filters):
+    records = engine.records(**{'breakdown_type': 'overall', 'breakdown_value': None, 'caste_filter': None,
+                                'migration_reason': None, **filters})
+    expected = np.unique(panel.members(records['hh_id'], records['mem_id']))
+    assert np.array_equal(panel.matching(**filters), expected)
+
+
+def test_caste_filter_matches_the_records(panel, engine):
+    caste = engine.df['caste'].value_counts().index[0]
+    records = engine.records('Emigrated', 'overall', None, caste, None)
+    assert len(panel.matching('Emigrated', caste_filter=caste)) == records['unique_id'].nunique()
+
+
+def test_moves_returns_and_waves():
+    records = member_rows([('Mar 2024', 'Emigrated', 'Goa'), ('Jan 2024', 'Emigrated', 'Goa'),
+                           ('May 2024', 'Immigrated', 'Goa'), ('Jul 2024', 'Emigrated', 'Kerala')])
+    summary = PanelIndex(records).summary()
+    assert summary['migrants'] == 1 and summary['repeat_migrants'] == 1 and summary['returned'] == 1
+    assert summary['several_waves'] == 1 and summary['mean_moves'] == 3.0
+    assert summary['median_months_between_moves'] == 6.0
+
+
+def test_the_index_keeps_only_integer_arrays(panel):
+    for name, value in vars(panel).items():
+        assert not isinstance(value, (pd.DataFrame, pd.Series)), name
+        if isinstance(value, np.ndarray):
+            assert value.dtype.kind in 'iub', name
+    assert panel.nbytes > 0
+
+
+def test_trajectories_come_from_the_engine_in_month_order(panel, engine):
+    counts = engine.df.groupby(['hh_id', 'mem_id']).size()
+    hh_id, mem_id = counts.idxmax()
+    trajectory = panel.trajectory(hh_id, mem_id)
+    assert len(trajectory) == counts.max() > 1
+    assert np.all(np.diff(month_numbers(trajectory['month_slot'])) >= 0)
+    assert panel.trajectory(-1, 0).empty
+
+
+def test_panel_endpoints(dashboard, panel, engine):
+    client = dashboard.app.server.test_client()
+    rows = client.get('/api/panel?migration_status=Immigrated').get_json()['rows']
+    assert rows[0]['migrants'] == len(panel.matching('Immigrated')) > 0
+    hh_id, mem_id = engine.df[['hh_id', 'mem_id']].iloc[0]
+    rows = client.get(f'/api/trajectory?hh_id={hh_id}&mem_id={mem_id}').get_json()['rows']
+    assert rows and set(rows[0]) == {'month_slot', 'mem_status', 'state', 'matched_district',
+                                     'emigrated_immigrated_state', 'emigrated_immigrated_district',
+                                     'emigration_immigration_reason'}
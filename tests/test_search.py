@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from search import OptionIndex
+
+NAMES = ['Yadav', 'Kurmi', 'Jat Sikh', 'Ahir Yadav', 'Sikh Khatri', 'Brahmin', 'Kashyap', 'Mahar']
+WEIGHTS = [50, 40, 30, 20, 60, 70, 10, 5]
+
+
+@pytest.fixture
+def index():
+    return OptionIndex(NAMES, WEIGHTS)
+
+
+def test_empty_query_lists_the_heaviest(index):
+    assert index.search('') == ['Brahmin', 'Sikh Khatri', 'Yadav', 'Kurmi', 'Jat Sikh', 'Ahir Yadav',
+                                'Kashyap', 'Mahar']
+    assert index.top(2) == ['Brahmin', 'Sikh Khatri'] == index.search('  ', limit=2)
+
+
+def test_prefixes_match_any_word(index):
+    assert index.search('yad') == ['Yadav', 'Ahir Yadav']
+    assert index.search('SIKH') == ['Sikh Khatri', 'Jat Sikh']
+    assert index.search('k') == ['Sikh Khatri', 'Kurmi', 'Kashyap']
+
+
+def test_longer_queries_match_inside_words(index):
+    # No word starts with 'har' or 'ahm'; they are found inside Mahar and Brahmin
+    assert index.search('har') == ['Mahar']
+    assert index.search('ahm') == ['Brahmin']
+    assert index.search('ahir yad') == ['Ahir Yadav']
+    assert index.search('xyz') == [] and index.search('zz') == []
+
+
+def test_results_are_capped_by_weight():
+    rng = np.random.default_rng(0)
+    names = [f'Jati {i}' for i in range(5000)]
+    weights = rng.integers(1, 10 ** 6, len(names))
+    index = OptionIndex(names, weights)
+    found = index.search('jati', limit=50)
+    expected = [names[i] for i in np.argsort(-weights, kind='stable')[:50]]
+    assert found == expected
+    assert index.search('ti 4999') == ['Jati 4999']